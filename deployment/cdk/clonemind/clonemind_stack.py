@@ -12,6 +12,7 @@ from aws_cdk import (
     aws_cognito as cognito,
     aws_elasticloadbalancingv2 as elbv2,
     aws_s3_notifications as s3n,
+    Duration,
     RemovalPolicy,
 )
 from constructs import Construct
@@ -78,6 +79,18 @@ class CloneMindStack(Stack):
             removal_policy=RemovalPolicy.DESTROY,
         )
 
+        # One item per user, so bulk onboarding doesn't grow the tenant item toward the 400 KB limit
+        user_table = dynamodb.Table(self, "TenantUsers",
+            partition_key=dynamodb.Attribute(name="tenantId", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="email", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        user_table.add_global_secondary_index(
+            index_name="email-index",
+            partition_key=dynamodb.Attribute(name="email", type=dynamodb.AttributeType.STRING),
+        )
+
         # 4. EFS for Shared Persistence
         file_system = efs.FileSystem(self, "CloneMindEFS",
             vpc=vpc,
@@ -88,6 +101,11 @@ class CloneMindStack(Stack):
         redis_vol = ecs.Volume(name="RedisVolume", efs_volume_configuration=ecs.EfsVolumeConfiguration(file_system_id=file_system.file_system_id))
         qdrant_vol = ecs.Volume(name="QdrantVolume", efs_volume_configuration=ecs.EfsVolumeConfiguration(file_system_id=file_system.file_system_id))
         openwebui_vol = ecs.Volume(name="OpenWebUIVolume", efs_volume_configuration=ecs.EfsVolumeConfiguration(file_system_id=file_system.file_system_id))
+        vectors_vol = ecs.Volume(name="VectorsVolume", efs_volume_configuration=ecs.EfsVolumeConfiguration(file_system_id=file_system.file_system_id))
+
+        # `cdk deploy -c vector_backend=mmap` drops the Qdrant container; the MCP server then keeps
+        # vectors in its embedded memory-mapped index (mmap_index.py), for small tenants
+        vector_backend = self.node.try_get_context("vector_backend") or "qdrant"
 
         # 5. S3 Processor Lambda
         s3_processor = _lambda.Function(self, "S3ToMcpProcessor",
@@ -108,22 +126,38 @@ def lambda_handler(event, context):
         bucket = record['s3']['bucket']['name']
         key = urllib.parse.unquote_plus(record['s3']['object']['key'])
         
-        # Extract from path: tenant_id/persona_id/filename
+        # Extract from path: tenant_id/persona_id/filename (snapshots.py backups aren't documents)
         parts = key.split('/')
-        if len(parts) < 3: continue
+        if len(parts) < 3 or parts[0] == os.environ.get("SNAPSHOT_PREFIX", "_snapshots"): continue
         tenant_id, persona_id = parts[0], parts[1]
         
-        # Ingest into MCP Knowledge Base
+        # Removed objects drop their chunks; creates/overwrites replace the previous version's chunks
         try:
-            requests.post(
-                f"{mcp_url}/call/ingest_knowledge",
-                json={
-                    "text": f"New document uploaded: {key}",
-                    "tenantId": tenant_id,
-                    "metadata": {"s3_key": key, "personaId": persona_id}
-                },
-                timeout=10
-            )
+            if record['eventName'].startswith('ObjectRemoved'):
+                # A delete processed after a re-upload must not purge the live document
+                try:
+                    s3.head_object(Bucket=bucket, Key=key)
+                    continue
+                except s3.exceptions.ClientError as e:
+                    if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+                        raise
+                requests.post(
+                    f"{mcp_url}/call/delete_document",
+                    json={"tenantId": tenant_id, "s3Key": key},
+                    timeout=30
+                )
+            else:
+                requests.post(
+                    f"{mcp_url}/call/ingest_document",
+                    json={
+                        "text": f"New document uploaded: {key}",
+                        "tenantId": tenant_id,
+                        "s3Key": key,
+                        "version": record['s3']['object'].get('eTag'),
+                        "metadata": {"personaId": persona_id, "filename": parts[-1]}
+                    },
+                    timeout=60
+                )
         except Exception as e:
             print(f"Error calling MCP: {e}")
             
@@ -135,9 +169,11 @@ def lambda_handler(event, context):
             vpc=vpc
         )
         documents_bucket.add_event_notification(s3.EventType.OBJECT_CREATED, s3n.LambdaDestination(s3_processor))
+        documents_bucket.add_event_notification(s3.EventType.OBJECT_REMOVED, s3n.LambdaDestination(s3_processor))
+        documents_bucket.grant_read(s3_processor)
 
         # 6. ECS Services (EC2 Mode with BRIDGE Networking for Direct IP)
-        def add_ec2_service(id: str, image_asset: str, container_port: int, host_port: int, cpu=128, mem=256, env=None, volumes=None, mounts=None):
+        def add_ec2_service(id: str, image_asset: str, container_port: int, host_port: int, cpu=128, mem=256, env=None, volumes=None, mounts=None, health_check=None):
             # Using BRIDGE mode to map container ports to specific host ports
             task_def = ecs.Ec2TaskDefinition(self, f"{id}Task", network_mode=ecs.NetworkMode.BRIDGE)
             if volumes: 
@@ -152,7 +188,8 @@ def lambda_handler(event, context):
                 memory_limit_mib=mem,
                 cpu=cpu,
                 environment=env or {},
-                logging=ecs.LogDrivers.aws_logs(stream_prefix=id)
+                logging=ecs.LogDrivers.aws_logs(stream_prefix=id),
+                health_check=health_check
             )
             container.add_port_mappings(ecs.PortMapping(container_port=container_port, host_port=host_port))
             if mounts:
@@ -169,8 +206,10 @@ def lambda_handler(event, context):
         redis = add_ec2_service("Redis", "redis:7-alpine", 6379, 6379, env={}, 
             volumes=[redis_vol], mounts=[ecs.MountPoint(container_path="/data", source_volume="RedisVolume", read_only=False)])
         
-        qdrant = add_ec2_service("Qdrant", "qdrant/qdrant:latest", 6333, 6333, env={},
-            volumes=[qdrant_vol], mounts=[ecs.MountPoint(container_path="/qdrant/storage", source_volume="QdrantVolume", read_only=False)])
+        qdrant = None
+        if vector_backend == "qdrant":
+            qdrant = add_ec2_service("Qdrant", "qdrant/qdrant:v1.13.6", 6333, 6333, env={},
+                volumes=[qdrant_vol], mounts=[ecs.MountPoint(container_path="/qdrant/storage", source_volume="QdrantVolume", read_only=False)])
 
         # Application Services
         # 1. Open WebUI + Sidecar (Map Container 8080 -> Host 80 for easy access)
@@ -197,7 +236,7 @@ def lambda_handler(event, context):
         webui_container.add_mount_points(ecs.MountPoint(container_path="/app/backend/data", source_volume="OpenWebUIVolume", read_only=False))
 
         sync_container = webui_task.add_container("FileSyncSidecar",
-            image=ecs.ContainerImage.from_asset("../../services/file-sync"),
+            image=ecs.ContainerImage.from_asset("../../services", file="file-sync/Dockerfile"),
             memory_limit_mib=128,
             environment={
                 "S3_BUCKET": documents_bucket.bucket_name,
@@ -214,15 +253,30 @@ def lambda_handler(event, context):
         )
 
         # 2. MCP Server (8080 -> 8080)
-        mcp_service = add_ec2_service("Mcp", "../../services/mcp-server", 8080, 8080, env={
+        mcp_env = {
             "AWS_DEFAULT_REGION": self.region,
             "QDRANT_HOST": "qdrant.clonemind.local",
-            "MCP_TRANSPORT": "sse"
-        })
+            "MCP_TRANSPORT": "sse",
+            "VECTOR_BACKEND": vector_backend,
+        }
+        mcp_volumes, mcp_mounts = None, None
+        if vector_backend == "mmap":
+            mcp_volumes = [vectors_vol]
+            mcp_mounts = [ecs.MountPoint(container_path="/app/data/vectors", source_volume="VectorsVolume", read_only=False)]
+        mcp_service = add_ec2_service("Mcp", "../../services/mcp-server", 8080, 8080, env=mcp_env,
+            volumes=mcp_volumes, mounts=mcp_mounts, health_check=ecs.HealthCheck(
+            # Healthy only after startup warmup (collection metadata, connections) has finished
+            command=["CMD-SHELL", "python -c \"import urllib.request; urllib.request.urlopen('http://localhost:8080/health', timeout=3)\""],
+            interval=Duration.seconds(15),
+            timeout=Duration.seconds(5),
+            retries=3,
+            start_period=Duration.seconds(120)
+        ))
 
         # 3. Tenant Service (8000 -> 8000)
         tenant_service = add_ec2_service("Tenant", "../../services/tenant-service", 8000, 8000, env={
             "TENANT_TABLE": tenant_table.table_name,
+            "USER_TABLE": user_table.table_name,
             "AWS_DEFAULT_REGION": self.region
         })
 
@@ -232,16 +286,21 @@ def lambda_handler(event, context):
         security_group.add_ingress_rule(ec2.Peer.any_ipv4(), ec2.Port.tcp(80), "OpenWebUI Dashboard")
         security_group.add_ingress_rule(ec2.Peer.any_ipv4(), ec2.Port.tcp(8000), "Tenant Service Portal")
         security_group.add_ingress_rule(ec2.Peer.any_ipv4(), ec2.Port.tcp(8080), "MCP Server API")
-        security_group.add_ingress_rule(ec2.Peer.any_ipv4(), ec2.Port.tcp(6333), "Qdrant Dashboard")
+        if qdrant:
+            security_group.add_ingress_rule(ec2.Peer.any_ipv4(), ec2.Port.tcp(6333), "Qdrant Dashboard")
 
         # 7. Permissions
         documents_bucket.grant_read_write(webui_task.task_role)
-        mcp_service.task_definition.task_role.add_to_policy(iam.PolicyStatement(actions=["bedrock:InvokeModel"], resources=["*"]))
+        mcp_service.task_definition.task_role.add_to_policy(iam.PolicyStatement(actions=["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream"], resources=["*"]))
         file_system.grant_root_access(webui_task.task_role)
-        file_system.grant_root_access(qdrant.task_definition.task_role)
+        if qdrant:
+            file_system.grant_root_access(qdrant.task_definition.task_role)
+        else:
+            file_system.grant_root_access(mcp_service.task_definition.task_role)
         file_system.grant_root_access(redis.task_definition.task_role)
         tenant_table.grant_read_write_data(mcp_service.task_definition.task_role)
         tenant_table.grant_read_write_data(tenant_service.task_definition.task_role)
+        user_table.grant_read_write_data(tenant_service.task_definition.task_role)
         
         # Grant Tenant Service Cognito permissions
         tenant_service.task_definition.task_role.add_to_policy(iam.PolicyStatement(
@@ -9,10 +9,18 @@ echo "Deploying document-processor Lambda..."
 ENDPOINT="http://localhost:4566"
 
 # Package Lambda function
-# Use the correct path for the lambda function
-cd deployment/localstack/lambda
-zip -r function.zip lambda_function.py
-cd ../../../
+# boto3/urllib3 come from the runtime. The optional parsers (PyPDF2, python-docx, openpyxl) are
+# imported per file type; WITH_PARSERS=1 bundles them. Bytecode is precompiled because
+# /var/task is read-only and Lambda would otherwise recompile every module on each cold start.
+BUILD_DIR=$(mktemp -d)
+cp deployment/localstack/lambda/lambda_function.py "$BUILD_DIR/"
+if [ "${WITH_PARSERS:-0}" = "1" ]; then
+  pip install --quiet -r deployment/localstack/lambda/requirements.txt --target "$BUILD_DIR"
+fi
+python3 -m compileall -q "$BUILD_DIR"
+rm -f deployment/localstack/lambda/function.zip
+(cd "$BUILD_DIR" && zip -qr9 "$OLDPWD/deployment/localstack/lambda/function.zip" . -x '*.dist-info/*' '*/tests/*')
+rm -rf "$BUILD_DIR"
 
 # Create Lambda function
 aws --endpoint-url=$ENDPOINT lambda create-function \
@@ -39,7 +47,7 @@ cat > /tmp/s3-notification.json <<EOF
   "LambdaFunctionConfigurations": [
     {
       "LambdaFunctionArn": "arn:aws:lambda:us-east-1:000000000000:function:document-processor",
-      "Events": ["s3:ObjectCreated:*"]
+      "Events": ["s3:ObjectCreated:*", "s3:ObjectRemoved:*"]
     }
   ]
 }
@@ -9,6 +9,25 @@ from typing import List, Union, Generator, Iterator
 from pydantic import BaseModel, Field
 import requests
 import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Milliseconds the MCP server has left; it cancels the turn (and its Bedrock calls) when they run out
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+# Shared tenant-service client (services/shared, mounted by docker-compose); plain requests if absent
+sys.path.insert(0, os.getenv("CLONEMIND_SHARED_PATH", "/app/backend/shared"))
+try:
+    from persona_lookup import PersonaClient, ServiceUnavailable
+except ImportError:
+    PersonaClient = None
+
+# Fire-and-forget MCP prefetches, so they overlap the identity lookups
+_prefetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mcp-prefetch")
 
 class Pipe:
     class Valves(BaseModel):
@@ -20,33 +39,87 @@ class Pipe:
             default="http://mcp-server-dt:8080/sse",
             description="URL for MCP Knowledge Base Server",
         )
+        REQUEST_TIMEOUT: float = Field(
+            default=120.0,
+            description="Seconds a chat turn may take end to end (identity lookup + MCP)",
+        )
 
     def __init__(self):
         self.type = "manifold"
         self.id = "clonemind_proxy"
         self.name = "CloneMind: "
         self.valves = self.Valves()
+        self._identity = None
+
+    def identity_client(self):
+        """PersonaClient for the configured tenant service URL (rebuilt if the valve changes)."""
+        if PersonaClient is None:
+            return None
+        if self._identity is None or self._identity.base_url != self.valves.TENANT_SERVICE_URL.rstrip("/"):
+            self._identity = PersonaClient(self.valves.TENANT_SERVICE_URL)
+        return self._identity
+
+    def lookup_user(self, email: str, request_id: str = None) -> dict:
+        """Lookup result for a user ({} when unknown or the tenant service is unavailable)"""
+        headers = {REQUEST_ID_HEADER: request_id} if request_id else None
+        client = self.identity_client()
+        if client:
+            tenant_id, persona_id = client.get_tenant_persona(email, headers)
+            return {"tenantId": tenant_id, "personaId": persona_id}
+        try:
+            response = requests.get(f"{self.valves.TENANT_SERVICE_URL}/api/user/lookup", params={"email": email}, headers=headers, timeout=5)
+            return response.json() if response.status_code == 200 else {}
+        except Exception:
+            return {}
 
     def pipes(self) -> List[dict]:
         return [{"id": "twin", "name": "AI Twin Mode"}]
 
-    def get_tenant_dna(self, tenant_id: str):
+    def get_tenant_dna(self, tenant_id: str, request_id: str = None):
         """Fetch the prompt DNA (tone, industry, etc.) from Tenant Service"""
+        client = self.identity_client()
+        if client:
+            try:
+                tenant = client.tenant(tenant_id, {REQUEST_ID_HEADER: request_id} if request_id else None)
+                return {"tenant": tenant} if tenant else None
+            except ServiceUnavailable as e:
+                print(f"Error fetching DNA: {e}")
+                return None
         try:
-            response = requests.get(f"{self.valves.TENANT_SERVICE_URL}/api/tenants/{tenant_id}", timeout=5)
+            response = requests.get(
+                f"{self.valves.TENANT_SERVICE_URL}/api/tenants/{tenant_id}",
+                headers={REQUEST_ID_HEADER: request_id} if request_id else None,
+                timeout=5
+            )
             if response.status_code == 200:
                 return response.json()
         except Exception as e:
             print(f"Error fetching DNA: {e}")
         return None
 
-    def get_rag_context(self, query: str, tenant_id: str):
+    def prefetch_query(self, query: str, messages: list = None, request_id: str = None):
+        """Ask MCP to start embedding the query now; generate_twin_response picks it up later.
+
+        The history lets MCP's retrieval gate skip the embedding for small talk.
+        """
+        url = self.valves.MCP_SERVER_URL.replace("/sse", "/prefetch")
+
+        def post():
+            try:
+                requests.post(url, json={"query": query, "messages": messages or []}, headers={REQUEST_ID_HEADER: request_id} if request_id else None, timeout=2)
+            except Exception:
+                pass  # only an optimization; the chat call embeds the query itself
+
+        _prefetch_pool.submit(post)
+
+    def get_rag_context(self, query: str, tenant_id: str, request_id: str = None):
         """Call MCP Server to get relevant document chunks via simple HTTP POST bridge"""
         try:
             mcp_url = self.valves.MCP_SERVER_URL.replace("/sse", "/call/search_knowledge_base")
             response = requests.post(
                 mcp_url,
                 json={"query": query, "tenantId": tenant_id},
+                headers={REQUEST_ID_HEADER: request_id} if request_id else None,
                 timeout=10
             )
             if response.status_code == 200:
@@ -58,19 +131,26 @@ class Pipe:
     def pipe(self, body: dict, __user__: dict = None) -> Union[str, Generator, Iterator]:
         # 1. Identify User & Tenant
         email = __user__.get("email", "unknown")
-        
+        # One id per chat turn, forwarded to the tenant service and MCP for tracing
+        request_id = uuid.uuid4().hex
+        trace_headers = {REQUEST_ID_HEADER: request_id}
+        started = time.perf_counter()
+
+        # The query embedding doesn't depend on the tenant: start it on MCP while we resolve identity
+        user_message = body["messages"][-1]["content"]
+        if isinstance(user_message, str):
+            self.prefetch_query(user_message, body.get("messages", [])[:-1], request_id)
+
         # 2. Lookup Tenant Context via API
-        try:
-            lookup_resp = requests.get(f"{self.valves.TENANT_SERVICE_URL}/api/user/lookup", params={"email": email}, timeout=5)
-            lookup = lookup_resp.json() if lookup_resp.status_code == 200 else {}
-        except:
-            lookup = {}
+        lookup = self.lookup_user(email, request_id)
+        looked_up = time.perf_counter()
 
         tenant_id = lookup.get("tenantId", "default")
         persona_id = lookup.get("personaId", "user")
         
         # 3. Fetch Prompt DNA (Tone, Company Name)
-        dna = self.get_tenant_dna(tenant_id)
+        dna = self.get_tenant_dna(tenant_id, request_id)
+        dna_fetched = time.perf_counter()
         if dna:
             tenant_info = dna.get("tenant", {})
             company = tenant_info.get("companyName", "Unknown Corp")
@@ -91,11 +171,8 @@ Always prioritize the information found in the retrieved documents to provide ac
         else:
             system_prompt = "You are a helpful AI assistant representing a professional organization. Use the provided context to answer questions accurately."
 
-        # 5. Get User Message
-        user_message = body["messages"][-1]["content"]
-
-        # 6. Call MCP Server for Full Response (including RAG and Model Routing)
-        print(f"Sending request to MCP for tenant: {tenant_id}")
+        # 5. Call MCP Server for Full Response (including RAG and Model Routing)
+        print(f"[req={request_id}] Sending request to MCP for tenant: {tenant_id}")
         try:
             # We'll call a combined 'generate_twin_response' tool on MCP via the HTTP bridge
             mcp_chat_url = self.valves.MCP_SERVER_URL.replace("/sse", "/call/generate_twin_response")
@@ -103,17 +180,32 @@ Always prioritize the information found in the retrieved documents to provide ac
                 "query": user_message,
                 "tenantId": tenant_id,
                 "system_prompt": system_prompt,
-                "messages": body.get("messages", [])[:-1] # History
+                "messages": body.get("messages", [])[:-1], # History
+                "personaId": persona_id  # usage attribution on the MCP server
             }
             
-            response = requests.post(mcp_chat_url, json=payload, timeout=300)
-            
+            # Whatever the lookups left of the turn's budget; MCP stops half a second early so its
+            # 504 arrives before our own timeout
+            remaining = self.valves.REQUEST_TIMEOUT - (time.perf_counter() - started)
+            deadline_headers = {**trace_headers, DEADLINE_HEADER: str(max(0, int((remaining - 0.5) * 1000)))}
+            response = requests.post(mcp_chat_url, json=payload, headers=deadline_headers, timeout=max(remaining, 1))
+            print(
+                f"[req={request_id}] timeline: lookup={(looked_up - started) * 1000:.0f}ms "
+                f"dna={(dna_fetched - looked_up) * 1000:.0f}ms mcp={(time.perf_counter() - dna_fetched) * 1000:.0f}ms "
+                f"(query embedding prefetched from +0ms) server: {response.headers.get('Server-Timing', '-')}"
+            )
+
             if response.status_code == 200:
                 result = response.json()
                 return result.get("content", "No response from MCP")
+            elif response.status_code == 504:
+                return "That took longer than expected. Please try again or ask a more specific question."
+            elif response.status_code == 429:
+                retry_after = response.headers.get("Retry-After", "a few")
+                return f"The assistant is busy right now. Please try again in {retry_after} seconds."
             else:
                 return f"Error from MCP Server: {response.status_code}"
                 
         except Exception as e:
-            print(f"MCP Call failed: {e}")
+            print(f"[req={request_id}] MCP Call failed: {e}")
             return f"Error calling MCP: {str(e)}"
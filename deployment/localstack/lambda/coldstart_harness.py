@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Cold-start / warm-invoke harness for the S3 ingest Lambda (lambda_function.py).
+
+Each cold run is a fresh Python process, like a new Lambda execution
+environment: it times the module import (init), the first invocation and
+then --warm further invocations of the same event. S3 is a moto server and
+the MCP bridge is a local keep-alive HTTP stub, so only the processor's own
+work is measured. The stub counts TCP connections, which shows whether warm
+invocations reuse the pooled connection.
+
+Usage:
+  pip install "moto[server]" PyPDF2 python-docx
+  python coldstart_harness.py
+  python coldstart_harness.py --types txt,pdf --cold-runs 5 --warm 50
+"""
+
+import argparse
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BUCKET = "coldstart-docs"
+SAMPLE_TEXT = "Mastro Metals inventory\n" + "MS Round Pipes - 2 inch: 410 pieces @ 980/piece\n" * 40
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def sample_pdf(text):
+    """Single-page PDF with a text stream (no PDF library needed to build it)."""
+    lines = text.splitlines()[:40]
+    stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+        "/Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def sample_docx(text):
+    try:
+        import docx
+    except ImportError:
+        return None
+    document = docx.Document()
+    for line in text.splitlines():
+        document.add_paragraph(line)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+SAMPLES = {
+    "txt": lambda: SAMPLE_TEXT.encode("utf-8"),
+    "pdf": lambda: sample_pdf(SAMPLE_TEXT),
+    "docx": lambda: sample_docx(SAMPLE_TEXT),
+}
+
+
+class McpStub(BaseHTTPRequestHandler):
+    """Answers every /call/<tool> with a success payload over keep-alive HTTP/1.1."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without TCP_NODELAY keep-alive replies stall on delayed ACKs
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self):
+        type(self).connections += 1
+        super().setup()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"content": "Successfully ingested"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def s3_event(key):
+    return {"Records": [{
+        "eventName": "ObjectCreated:Put",
+        "s3": {"bucket": {"name": BUCKET}, "object": {"key": key}},
+    }]}
+
+
+def child(args):
+    """One execution environment: import (init), first invoke, warm invokes. Prints JSON."""
+    sys.path.insert(0, args.lambda_dir)
+    start = time.perf_counter()
+    import lambda_function
+    init_ms = (time.perf_counter() - start) * 1000
+
+    event = s3_event(f"tenant-coldstart/CEO/sample.{args.child}")
+    start = time.perf_counter()
+    result = lambda_function.lambda_handler(event, None)
+    first_ms = (time.perf_counter() - start) * 1000
+    if result["statusCode"] != 200:
+        raise SystemExit(f"invoke failed: {result}")
+
+    warm = []
+    for _ in range(args.warm):
+        start = time.perf_counter()
+        lambda_function.lambda_handler(event, None)
+        warm.append((time.perf_counter() - start) * 1000)
+    print(json.dumps({"init_ms": init_ms, "first_ms": first_ms, "warm_ms": warm}))
+
+
+def run(args):
+    import logging
+    from moto.server import ThreadedMotoServer
+    import boto3
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    s3_port, mcp_port = free_port(), free_port()
+    moto = ThreadedMotoServer(port=s3_port, verbose=False)
+    moto.start()
+    mcp = ThreadingHTTPServer(("127.0.0.1", mcp_port), McpStub)
+    threading.Thread(target=mcp.serve_forever, daemon=True).start()
+
+    env = {
+        **os.environ,
+        "AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test", "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_S3_ENDPOINT": f"http://127.0.0.1:{s3_port}",
+        "MCP_SERVER_URL": f"http://127.0.0.1:{mcp_port}/call/ingest_document",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    s3 = boto3.client("s3", endpoint_url=env["AWS_S3_ENDPOINT"], region_name="us-east-1",
+                      aws_access_key_id="test", aws_secret_access_key="test")
+    s3.create_bucket(Bucket=BUCKET)
+
+    print(f"{'type':<6}{'init ms':>10}{'first ms':>10}{'warm p50':>10}{'warm p99':>10}{'conns/run':>11}")
+    try:
+        for file_type in args.types.split(","):
+            body = SAMPLES[file_type]()
+            if body is None:
+                print(f"{file_type:<6} skipped (generator library not installed)")
+                continue
+            s3.put_object(Bucket=BUCKET, Key=f"tenant-coldstart/CEO/sample.{file_type}", Body=body)
+
+            runs = []
+            McpStub.connections = 0
+            for _ in range(args.cold_runs):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child", file_type, "--warm", str(args.warm),
+                     "--lambda-dir", args.lambda_dir],
+                    env=env, capture_output=True, text=True, check=True,
+                ).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+
+            warm = sorted(ms for r in runs for ms in r["warm_ms"])
+            p99 = warm[max(0, int(len(warm) * 0.99) - 1)] if warm else 0
+            print(f"{file_type:<6}"
+                  f"{statistics.median(r['init_ms'] for r in runs):>10.1f}"
+                  f"{statistics.median(r['first_ms'] for r in runs):>10.1f}"
+                  f"{(statistics.median(warm) if warm else 0):>10.1f}"
+                  f"{p99:>10.1f}"
+                  f"{McpStub.connections / args.cold_runs:>11.1f}")
+    finally:
+        mcp.shutdown()
+        moto.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="S3 ingest Lambda cold-start harness")
+    parser.add_argument("--types", default="txt,pdf,docx")
+    parser.add_argument("--cold-runs", type=int, default=3, help="Fresh processes per file type")
+    parser.add_argument("--warm", type=int, default=20, help="Warm invocations per process")
+    parser.add_argument("--lambda-dir", default=HERE, help="Directory containing lambda_function.py")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,33 +3,60 @@ Lambda Function: S3 Upload Processor
 Extracts text and calls MCP Server for knowledge ingestion
 
 S3 Structure: <tenant_id>/<persona>/<filename>
+
+ObjectCreated (new upload or overwrite) -> ingest_document: chunks tagged with
+the object's ETag replace the previous version's chunks.
+ObjectRemoved -> delete_document: every chunk of that key is removed, unless
+the key exists again (re-uploaded before the delete event was processed; its
+create event re-indexes it).
+Keys under SNAPSHOT_PREFIX (Qdrant snapshots and tabular backups written by
+snapshots.py when they share the documents bucket) are skipped.
 """
 
+import importlib
+import io
 import json
-import boto3
 import os
-import requests
+import time
 from urllib.parse import unquote_plus
-import io
-
-# Optional: These would need to be in a Lambda layer or packaged with the zip
-# For LocalStack, we assume the environment or deployment handles these
-try:
-    import PyPDF2
-except ImportError:
-    PyPDF2 = None
 
-try:
-    from docx import Document
-except ImportError:
-    Document = None
+import boto3
+import urllib3
 
 # Configuration
 # Note: For LocalStack inside Docker, use the container name for the MCP server
+# MCP_SERVER_URL may still point at a specific tool (older configs); only the bridge base is used
+MCP_BRIDGE_URL = os.environ.get('MCP_SERVER_URL', 'http://mcp-server-dt:8080/call/ingest_document').rsplit('/call/', 1)[0]
+MCP_MAX_RETRIES = int(os.environ.get('MCP_MAX_RETRIES', '4'))
+MCP_MAX_RETRY_AFTER = float(os.environ.get('MCP_MAX_RETRY_AFTER', '30'))
+# Time kept back from the Lambda timeout for logging and returning; MCP gets the rest as its deadline
+MCP_DEADLINE_MARGIN = float(os.environ.get('MCP_DEADLINE_MARGIN', '2'))
+DEADLINE_HEADER = "X-Deadline-Ms"
+# snapshots.py's key prefix; those objects are backups, not documents
+SNAPSHOT_PREFIX = os.environ.get('SNAPSHOT_PREFIX', '_snapshots').strip('/') + '/'
+
+# time.monotonic() by which this invocation's MCP calls must be done (None outside Lambda)
+_deadline = None
+
+# Created once per execution environment and reused by every warm invocation.
+# urllib3 ships with botocore in the Lambda runtime, so the package needs no HTTP library of its own.
 s3_client = boto3.client('s3', endpoint_url=os.environ.get('AWS_S3_ENDPOINT'))
-MCP_INGEST_URL = os.environ.get('MCP_SERVER_URL', 'http://mcp-server-dt:8080/call/ingest_knowledge')
+http = urllib3.PoolManager(maxsize=4, retries=False)
+
+# Parsers are imported on the first file of their type, so a .txt upload never pays for them.
+# They need to be in a Lambda layer or packaged with the zip; a missing one degrades to a placeholder.
+_optional_modules = {}
+
+def optional_import(name):
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
 
 def extract_text_from_pdf(file_bytes):
+    PyPDF2 = optional_import('PyPDF2')
     if not PyPDF2: return "PDF Reader not available"
     try:
         pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
@@ -41,14 +68,34 @@ def extract_text_from_pdf(file_bytes):
         return f"PDF Error: {e}"
 
 def extract_text_from_docx(file_bytes):
-    if not Document: return "DOCX Reader not available"
+    docx = optional_import('docx')
+    if not docx: return "DOCX Reader not available"
     try:
-        doc = Document(io.BytesIO(file_bytes))
+        doc = docx.Document(io.BytesIO(file_bytes))
         text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
         return text.strip()
     except Exception as e:
         return f"DOCX Error: {e}"
 
+def extract_text_from_xlsx(file_bytes):
+    # Sheets become CSV text so the MCP server loads them into its tabular store
+    openpyxl = optional_import('openpyxl')
+    if not openpyxl: return "XLSX Reader not available"
+    import csv
+    try:
+        workbook = openpyxl.load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+        sheets = []
+        for sheet in workbook.worksheets:
+            out = io.StringIO()
+            writer = csv.writer(out)
+            for row in sheet.iter_rows(values_only=True):
+                if any(cell is not None for cell in row):
+                    writer.writerow(["" if cell is None else cell for cell in row])
+            sheets.append(out.getvalue().strip())
+        return "\n\n".join(s for s in sheets if s)
+    except Exception as e:
+        return f"XLSX Error: {e}"
+
 def parse_s3_path(s3_key):
     parts = s3_key.split('/', 2)
     if len(parts) < 2:
@@ -60,63 +107,144 @@ def parse_s3_path(s3_key):
         'file_name': parts[2] if len(parts) > 2 else parts[1]
     }
 
-def lambda_handler(event, context):
-    print("Event received:", json.dumps(event))
-    
+def parse_event(event):
+    """Yield (action, bucket, key, etag) for each document in an S3 notification or EventBridge event.
+
+    Objects under SNAPSHOT_PREFIX are left out.
+    """
+    if 'Records' in event:
+        objects = []
+        for record in event['Records']:
+            action = 'delete' if record.get('eventName', '').startswith('ObjectRemoved') else 'ingest'
+            obj = record['s3']['object']
+            objects.append((action, record['s3']['bucket']['name'], unquote_plus(obj['key']), obj.get('eTag')))
+    else:
+        detail = event.get('detail', {})
+        action = 'delete' if event.get('detail-type') == 'Object Deleted' else 'ingest'
+        obj = detail.get('object', {})
+        objects = [(action, detail.get('bucket', {}).get('name'), unquote_plus(obj.get('key', '')), obj.get('etag'))]
+    for action, bucket, key, etag in objects:
+        if key.startswith(SNAPSHOT_PREFIX):
+            print(f"Skipping snapshot object s3://{bucket}/{key}")
+            continue
+        yield action, bucket, key, etag
+
+def call_mcp(tool, payload, timeout):
+    for attempt in range(MCP_MAX_RETRIES + 1):
+        headers = {"Content-Type": "application/json"}
+        if _deadline is not None:
+            # MCP stops working on the call when the invocation is about to time out anyway
+            remaining = _deadline - time.monotonic()
+            if remaining <= 0:
+                raise RuntimeError(f"MCP {tool} not called: invocation deadline passed")
+            timeout = min(timeout, remaining)
+            headers[DEADLINE_HEADER] = str(int(remaining * 1000))
+        # Pooled keep-alive connection: warm invocations skip the TCP (and TLS) handshake
+        resp = http.request(
+            "POST", f"{MCP_BRIDGE_URL}/call/{tool}",
+            body=json.dumps(payload).encode("utf-8"),
+            headers=headers,
+            timeout=urllib3.Timeout(connect=5, read=timeout),
+        )
+        # 429 = MCP admission control shedding bulk work; back off as told instead of failing the event
+        if resp.status != 429 or attempt == MCP_MAX_RETRIES:
+            break
+        delay = min(float(resp.headers.get("Retry-After", "1")), MCP_MAX_RETRY_AFTER)
+        if _deadline is not None and time.monotonic() + delay >= _deadline:
+            break
+        print(f"MCP {tool} busy, retrying in {delay:.0f}s")
+        time.sleep(delay)
+    body = resp.data.decode("utf-8", errors="replace")
+    if resp.status != 200:
+        raise RuntimeError(f"MCP {tool} returned {resp.status}: {body}")
+    content = json.loads(body).get("content", "")
+    if content.startswith("Error"):
+        raise RuntimeError(content)
+    return content
+
+def object_exists(bucket, key):
+    try:
+        s3_client.head_object(Bucket=bucket, Key=key)
+        return True
+    except s3_client.exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+def delete_object(bucket, key):
+    # Events can arrive out of order: a delete processed after a re-upload must not purge the live document
+    if object_exists(bucket, key):
+        print(f"Not removing s3://{bucket}/{key}: it exists again")
+        return
+    path_info = parse_s3_path(key)
+    print(f"Removing s3://{bucket}/{key}")
+    print(call_mcp("delete_document", {"tenantId": path_info['tenant_id'], "s3Key": key}, timeout=30))
+
+def ingest_object(bucket, key, etag=None):
+    print(f"Processing s3://{bucket}/{key}")
+
+    path_info = parse_s3_path(key)
+
+    # Download from S3
     try:
-        # Handle S3 Event (Direct or from EventBridge)
-        if 'Records' in event:
-            record = event['Records'][0]
-            bucket = record['s3']['bucket']['name']
-            key = unquote_plus(record['s3']['object']['key'])
-        else:
-            detail = event.get('detail', {})
-            bucket = detail.get('bucket', {}).get('name')
-            key = unquote_plus(detail.get('object', {}).get('key', ''))
-
-        print(f"Processing s3://{bucket}/{key}")
-        
-        path_info = parse_s3_path(key)
-        
-        # Download from S3
         response = s3_client.get_object(Bucket=bucket, Key=key)
-        file_bytes = response['Body'].read()
-        
-        # Extract content
-        ext = key.lower().split('.')[-1]
-        content = ""
-        
-        if ext == 'pdf':
-            content = extract_text_from_pdf(file_bytes)
-        elif ext in ['docx', 'doc']:
-            content = extract_text_from_docx(file_bytes)
-        elif ext == 'txt':
-            content = file_bytes.decode('utf-8', errors='ignore')
-        else:
-            content = f"Uploaded file: {path_info['file_name']}"
-
-        # Ingest into MCP
-        payload = {
-            "text": content,
-            "tenantId": path_info['tenant_id'],
-            "metadata": {
-                "filename": path_info['file_name'],
-                "personaId": path_info['persona'],
-                "s3Key": key,
-                "s3Bucket": bucket
-            }
+    except s3_client.exceptions.NoSuchKey:
+        # Deleted before this create event was processed
+        return delete_object(bucket, key)
+    file_bytes = response['Body'].read()
+    # Events can arrive out of order; the object's current ETag is the version we index
+    version = response.get('ETag', etag or '').strip('"') or None
+
+    # Extract content
+    ext = key.lower().split('.')[-1]
+    content = ""
+    
+    if ext == 'pdf':
+        content = extract_text_from_pdf(file_bytes)
+    elif ext in ['docx', 'doc']:
+        content = extract_text_from_docx(file_bytes)
+    elif ext in ['xlsx', 'xlsm']:
+        content = extract_text_from_xlsx(file_bytes)
+    elif ext in ['txt', 'csv', 'tsv', 'md']:
+        content = file_bytes.decode('utf-8', errors='ignore')
+    else:
+        content = f"Uploaded file: {path_info['file_name']}"
+
+    # Ingest into MCP (replaces chunks from any previous version of this key)
+    payload = {
+        "text": content,
+        "tenantId": path_info['tenant_id'],
+        "s3Key": key,
+        "version": version,
+        "metadata": {
+            "filename": path_info['file_name'],
+            "personaId": path_info['persona'],
+            "s3Bucket": bucket
         }
-        
-        print(f"Calling MCP: {MCP_INGEST_URL}")
-        resp = requests.post(MCP_INGEST_URL, json=payload, timeout=15)
-        
-        if resp.status_code == 200:
-            print("✅ Successfully ingested into MCP")
-            return {'statusCode': 200, 'body': 'Success'}
-        else:
-            print(f"❌ MCP Error: {resp.status_code} - {resp.text}")
-            return {'statusCode': resp.status_code, 'body': resp.text}
+    }
 
-    except Exception as e:
-        print(f"Fatal Error: {e}")
-        return {'statusCode': 500, 'body': str(e)}
+    print(f"Calling MCP: {MCP_BRIDGE_URL}/call/ingest_document")
+    print(call_mcp("ingest_document", payload, timeout=120))
+
+def lambda_handler(event, context):
+    global _deadline
+    print("Event received:", json.dumps(event))
+    _deadline = None
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        _deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - MCP_DEADLINE_MARGIN
+
+    failures = []
+    for action, bucket, key, etag in parse_event(event):
+        try:
+            if action == 'delete':
+                delete_object(bucket, key)
+            else:
+                ingest_object(bucket, key, etag)
+            print(f"✅ {action} s3://{bucket}/{key}")
+        except Exception as e:
+            print(f"❌ {action} s3://{bucket}/{key} failed: {e}")
+            failures.append(f"{key}: {e}")
+
+    if failures:
+        return {'statusCode': 500, 'body': json.dumps(failures)}
+    return {'statusCode': 200, 'body': 'Success'}
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import boto3
+from moto import mock_aws
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lambda_function  # noqa: E402
+
+
+@mock_aws
+def test_delete_is_skipped_when_key_was_uploaded_again(monkeypatch):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="docs")
+    monkeypatch.setattr(lambda_function, "s3_client", s3)
+    calls = []
+    monkeypatch.setattr(lambda_function, "call_mcp", lambda tool, payload, timeout: calls.append((tool, payload)) or "ok")
+
+    s3.put_object(Bucket="docs", Key="tenant-acme/analyst/report.txt", Body=b"v2")
+    lambda_function.delete_object("docs", "tenant-acme/analyst/report.txt")
+    assert calls == []
+
+    s3.delete_object(Bucket="docs", Key="tenant-acme/analyst/report.txt")
+    lambda_function.delete_object("docs", "tenant-acme/analyst/report.txt")
+    assert calls == [("delete_document", {"tenantId": "tenant-acme", "s3Key": "tenant-acme/analyst/report.txt"})]
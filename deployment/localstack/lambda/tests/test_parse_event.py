@@ -0,0 +1,36 @@
+import os
+import sys
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lambda_function  # noqa: E402
+
+
+def s3_record(event_name, key):
+    return {"eventName": event_name, "s3": {"bucket": {"name": "docs"}, "object": {"key": key, "eTag": "e1"}}}
+
+
+def test_snapshot_objects_are_skipped():
+    event = {"Records": [
+        s3_record("ObjectCreated:Put", "tenant-acme/analyst/report.pdf"),
+        s3_record("ObjectCreated:CompleteMultipartUpload", "_snapshots/tenant-acme/tenant_acme-1.snapshot"),
+        s3_record("ObjectCreated:Put", "_snapshots/tenant-acme/tenant_acme-1.snapshot.manifest.json"),
+        s3_record("ObjectRemoved:Delete", "_snapshots/tenant-acme/tenant_acme-1.snapshot"),
+        s3_record("ObjectRemoved:Delete", "tenant-acme/analyst/old.txt"),
+    ]}
+    assert list(lambda_function.parse_event(event)) == [
+        ("ingest", "docs", "tenant-acme/analyst/report.pdf", "e1"),
+        ("delete", "docs", "tenant-acme/analyst/old.txt", "e1"),
+    ]
+
+
+def test_snapshot_objects_are_skipped_in_eventbridge_events():
+    event = {"detail-type": "Object Created",
+             "detail": {"bucket": {"name": "docs"}, "object": {"key": "_snapshots/t/x.sqlite", "etag": "e1"}}}
+    assert list(lambda_function.parse_event(event)) == []
+
+
+def test_documents_named_like_the_prefix_are_kept():
+    event = {"Records": [s3_record("ObjectCreated:Put", "_snapshots-notes/analyst/a.txt")]}
+    assert len(list(lambda_function.parse_event(event))) == 1
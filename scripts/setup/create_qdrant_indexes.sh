@@ -1,6 +1,8 @@
 #!/bin/bash
 # Create Qdrant Indexes for Multi-tenant Vector Search
 # Run this after starting Qdrant
+# (n8n-era collection; collections created by the MCP server index tenantId,
+#  personaId, filename and s3Key automatically - see docs/mcp-server-configuration.md)
 
 set -e
 
@@ -121,7 +121,7 @@ if aws --endpoint-url=${LOCALSTACK_URL} events list-rules 2>&1 | grep -q "error\
   "LambdaFunctionConfigurations": [
     {
       "LambdaFunctionArn": "arn:aws:lambda:us-east-1:000000000000:function:digital-twin-processor",
-      "Events": ["s3:ObjectCreated:*"]
+      "Events": ["s3:ObjectCreated:*", "s3:ObjectRemoved:*"]
     }
   ]
 }
@@ -267,7 +267,7 @@ if aws --endpoint-url=${LOCALSTACK_URL} events list-rules 2>&1 | grep -qv "error
       --name s3-upload-trigger \
       --event-pattern '{
         "source":["aws.s3"],
-        "detail-type":["Object Created"],
+        "detail-type":["Object Created","Object Deleted"],
         "detail":{"bucket":{"name":["digital-twin-files"]}}
       }' > /dev/null 2>&1 || echo "   Rule may already exist"
     echo "✅ EventBridge rule created"
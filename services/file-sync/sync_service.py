@@ -4,9 +4,10 @@ import time
 import sqlite3
 import boto3
 import json
-import requests
 from pathlib import Path
 
+from persona_lookup import PersonaClient
+
 # Configuration from Environment
 OPENWEBUI_DB = os.getenv("OPENWEBUI_DB", "/app/backend/data/webui.db")
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/backend/data/uploads")
@@ -18,6 +19,7 @@ TENANT_SERVICE_URL = os.getenv("TENANT_SERVICE_URL", "http://tenant-service-dt:8
 
 # Initialize S3 client
 s3_client = boto3.client('s3', region_name=REGION)
+identity_client = PersonaClient(TENANT_SERVICE_URL)
 
 def load_processed_files():
     if os.path.exists(PROCESSED_FILE):
@@ -35,15 +37,7 @@ def save_processed_file(file_id):
 
 def get_user_context(email):
     """Call Tenant Service to get the true tenantId and personaId for this user"""
-    try:
-        response = requests.get(f"{TENANT_SERVICE_URL}/api/user/lookup", params={"email": email}, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("found"):
-                return data["tenantId"], data.get("personaId", "user")
-    except Exception as e:
-        print(f"Tenant Lookup Error: {e}")
-    return "default_tenant", "user"
+    return identity_client.get_tenant_persona(email, default=("default_tenant", "user"))
 
 def sync_to_s3():
     if not os.path.exists(OPENWEBUI_DB):
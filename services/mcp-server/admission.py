@@ -0,0 +1,211 @@
+"""
+Admission control for the HTTP bridge.
+
+Every tool call is admitted before it runs:
+
+  rate         - per-tenant token bucket per priority class; an empty bucket
+                 is an immediate 429 with Retry-After (no queueing)
+  concurrency  - at most ADMISSION_MAX_CONCURRENT calls run at once, and at
+                 most ADMISSION_TENANT_CONCURRENCY per tenant
+  queueing     - calls that can't start yet wait in a weighted fair queue
+                 (self-clocked fair queueing over (tenant, class) flows), so
+                 interactive calls overtake bulk ingestion and one tenant's
+                 backlog can't starve the others
+  overload     - a full per-tenant queue, or a wait longer than
+                 ADMISSION_MAX_WAIT, is a 429 with Retry-After
+
+Costs are in work units: one per chat turn or search query, one per
+CHUNK_SIZE characters of an ingested document.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT
+
+ADMISSION = os.getenv("ADMISSION", "on") == "on"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_TENANT_CONCURRENCY = int(os.getenv("ADMISSION_TENANT_CONCURRENCY", "8"))
+ADMISSION_TENANT_QUEUE = int(os.getenv("ADMISSION_TENANT_QUEUE", "100"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+# Work units per second per tenant; bursts up to 2x the rate
+RATES = {
+    INTERACTIVE: float(os.getenv("ADMISSION_RATE_INTERACTIVE", "10")),
+    BULK: float(os.getenv("ADMISSION_RATE_BULK", "20")),
+}
+WEIGHTS = {
+    INTERACTIVE: float(os.getenv("ADMISSION_WEIGHT_INTERACTIVE", "8")),
+    BULK: float(os.getenv("ADMISSION_WEIGHT_BULK", "1")),
+}
+
+
+class Rejected(Exception):
+    """The call was not admitted; the bridge answers 429 with Retry-After."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"{reason}, retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float) -> float:
+        """Take `cost` tokens; returns 0 on success, else seconds until they would be available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # A call costing more than the burst can never fit; let it through on a full bucket
+        cost = min(cost, self.burst)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class _Waiter:
+    __slots__ = ("tenant", "priority", "finish", "future")
+
+    def __init__(self, tenant, priority, finish, future):
+        self.tenant = tenant
+        self.priority = priority
+        self.finish = finish
+        self.future = future
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        tenant_concurrency: int = ADMISSION_TENANT_CONCURRENCY,
+        tenant_queue: int = ADMISSION_TENANT_QUEUE,
+        max_wait: float = ADMISSION_MAX_WAIT,
+        rates: dict = None,
+        weights: dict = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.tenant_concurrency = tenant_concurrency
+        self.tenant_queue = tenant_queue
+        self.max_wait = max_wait
+        self.rates = rates or RATES
+        self.weights = weights or WEIGHTS
+        self.active = 0
+        self.tenant_active = defaultdict(int)
+        self.waiters = []
+        self.queued = defaultdict(int)  # (tenant, priority) -> waiting calls
+        self.flow_finish = defaultdict(float)
+        self.virtual_time = 0.0
+        self.buckets = {}
+        self.service_time = 1.0  # moving average of call duration, for Retry-After estimates
+        self.rejected = defaultdict(int)
+
+    def _reject(self, tenant: str, priority: str, reason: str, retry_after: float):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.labels(tenant=tenant, priority=priority, reason=reason).inc()
+        raise Rejected(reason, max(retry_after, 0.1))
+
+    def _backlog_estimate(self, tenant: str) -> float:
+        waiting = sum(count for (t, _), count in self.queued.items() if t == tenant)
+        return (waiting + 1) * self.service_time / max(1, self.tenant_concurrency)
+
+    def _dispatch(self):
+        """Start queued calls, smallest finish tag first, while there is capacity."""
+        while self.waiters and self.active < self.max_concurrent:
+            eligible = [w for w in self.waiters if self.tenant_active[w.tenant] < self.tenant_concurrency]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: w.finish)
+            self.waiters.remove(waiter)
+            if waiter.future.done():
+                continue
+            # Self-clocked: virtual time is the finish tag of the call entering service
+            self.virtual_time = max(self.virtual_time, waiter.finish)
+            self.active += 1
+            self.tenant_active[waiter.tenant] += 1
+            waiter.future.set_result(True)
+
+    def _release(self, tenant: str):
+        self.active -= 1
+        self.tenant_active[tenant] -= 1
+        if not self.tenant_active[tenant]:
+            del self.tenant_active[tenant]
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, tenant: str, priority: str = INTERACTIVE, cost: float = 1.0):
+        """Hold a slot for the duration of the block; raises Rejected instead of queueing past the limits."""
+        rate = self.rates[priority]
+        bucket = self.buckets.get((tenant, priority))
+        if bucket is None:
+            bucket = self.buckets[(tenant, priority)] = TokenBucket(rate, 2 * rate)
+        wait = bucket.take(cost)
+        if wait:
+            self._reject(tenant, priority, "rate", wait)
+
+        flow = (tenant, priority)
+        if self.queued[flow] >= self.tenant_queue:
+            self._reject(tenant, priority, "queue_full", self._backlog_estimate(tenant))
+
+        start = max(self.virtual_time, self.flow_finish[flow])
+        finish = start + cost / self.weights[priority]
+        self.flow_finish[flow] = finish
+        waiter = _Waiter(tenant, priority, finish, asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        self.queued[flow] += 1
+        ADMISSION_QUEUE_DEPTH.labels(tenant=tenant, priority=priority).inc()
+        queued_at = time.perf_counter()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._reject(tenant, priority, "timeout", self._backlog_estimate(tenant))
+        except asyncio.CancelledError:
+            # Caller went away; give the slot back if it was granted in the same tick
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(tenant)
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self.queued[flow] -= 1
+            if not self.queued[flow]:
+                del self.queued[flow]
+            ADMISSION_QUEUE_DEPTH.labels(tenant=tenant, priority=priority).dec()
+            ADMISSION_WAIT.labels(tenant=tenant, priority=priority).observe(time.perf_counter() - queued_at)
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.service_time = 0.9 * self.service_time + 0.1 * (time.perf_counter() - started)
+            self._release(tenant)
+
+    def stats(self) -> dict:
+        tenants = defaultdict(lambda: {"active": 0, "queued": {}})
+        for tenant, count in self.tenant_active.items():
+            tenants[tenant]["active"] = count
+        for (tenant, priority), count in self.queued.items():
+            tenants[tenant]["queued"][priority] = count
+        return {
+            "active": self.active,
+            "queued": len(self.waiters),
+            "rejected": dict(self.rejected),
+            "service_time_s": round(self.service_time, 3),
+            "tenants": dict(tenants),
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
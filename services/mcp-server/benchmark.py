@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Hermetic benchmark for the MCP server RAG hot paths.
+
+Runs ingest_knowledge, search_knowledge_base and generate_twin_response
+against deterministic stand-ins so results are comparable run over run:
+  - Bedrock is replaced by FakeBedrock (configurable latency, hashed
+    bag-of-words vectors through the Titan provider, canned Claude answers)
+  - Qdrant runs in local in-memory mode (or, with --vector-backend mmap,
+    the embedded index in a temporary directory)
+
+Usage:
+  python benchmark.py
+  python benchmark.py --iterations 20 --embed-latency-ms 40 --llm-latency-ms 800
+  python benchmark.py --output bench.json --compare previous-bench.json
+  python benchmark.py --vector-backend mmap
+  python benchmark.py --embed-latency-ms 40 --llm-latency-ms 800 --spike-rate 0.05 --throttle-rate 0.05 --resilience off
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+# main.py reads its configuration at import time; keep the run's files out of /app/data
+BENCH_DATA_DIR = tempfile.mkdtemp(prefix="bench-data-")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("USAGE_DB", os.path.join(BENCH_DATA_DIR, "usage.sqlite"))
+os.environ.setdefault("TABULAR_STORE_DIR", os.path.join(BENCH_DATA_DIR, "tabular"))
+os.environ.setdefault("SEARCH_TUNING_FILE", os.path.join(BENCH_DATA_DIR, "search_params.json"))
+os.environ.setdefault("QUERY_SAMPLE_FILE", os.path.join(BENCH_DATA_DIR, "queries.jsonl"))
+os.environ.setdefault("VECTOR_STORE_DIR", os.path.join(BENCH_DATA_DIR, "vectors"))
+os.environ.setdefault("REEMBED_STATE", os.path.join(BENCH_DATA_DIR, "reembed", "state.json"))
+
+from botocore.exceptions import ClientError
+from qdrant_client import QdrantClient
+
+import main
+import metrics
+from embeddings import TitanProvider
+from mmap_index import MmapIndex
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_QUERIES = REPO_ROOT / "examples" / "queries" / "test-queries.json"
+DEFAULT_DATA_DIR = REPO_ROOT / "data"
+BENCH_SYSTEM_PROMPT = "You are a helpful AI assistant representing a professional organization."
+
+
+class FakeBedrock:
+    """Deterministic stand-in for the bedrock-runtime client."""
+
+    def __init__(self, embed_latency_ms=0.0, llm_latency_ms=0.0, jitter_ms=0.0,
+                 vector_size=1536, seed=42, ttft_ratio=0.3, spike_rate=0.0, spike_ms=0.0, throttle_rate=0.0):
+        self.embed_latency_ms = embed_latency_ms
+        self.llm_latency_ms = llm_latency_ms
+        self.jitter_ms = jitter_ms
+        self.ttft_ratio = ttft_ratio
+        self.vector_size = vector_size
+        # Tail behaviour: a fraction of calls stall for spike_ms, or fail with ThrottlingException
+        self.spike_rate = spike_rate
+        self.spike_ms = spike_ms
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.calls = {"embedding": 0, "llm": 0, "throttled": 0, "llm_completed": 0, "streamed_tokens": 0}
+
+    def _sleep(self, base_ms, jitter=True):
+        delay = base_ms + (self.random.uniform(-self.jitter_ms, self.jitter_ms) if jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _tail(self, operation):
+        """Extra latency for this call, or a throttle error, per spike_rate/throttle_rate."""
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.calls["throttled"] += 1
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, operation)
+        return self.spike_ms if roll < self.throttle_rate + self.spike_rate else 0.0
+
+    def embed(self, text):
+        """Hashed bag-of-words vector so related texts land near each other."""
+        vector = [0.0] * self.vector_size
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.vector_size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def invoke_model(self, body, modelId, accept=None, contentType=None):
+        request = json.loads(body)
+        if "inputText" in request:
+            self.calls["embedding"] += 1
+            self._sleep(self.embed_latency_ms + self._tail("InvokeModel"))
+            text = request["inputText"]
+            result = {"embedding": self.embed(text), "inputTextTokenCount": len(text.split())}
+        else:
+            self.calls["llm"] += 1
+            self._sleep(self.llm_latency_ms + self._tail("InvokeModel"))
+            prompt = request["messages"][-1]["content"][0]["text"]
+            result = {
+                "content": [{"type": "text", "text": f"[{modelId}] answer based on {len(prompt)} prompt chars"}],
+                "usage": {"input_tokens": len(prompt.split()), "output_tokens": 12},
+            }
+        return {"body": io.BytesIO(json.dumps(result).encode("utf-8"))}
+
+    def invoke_model_with_response_stream(self, body, modelId):
+        """Anthropic-style event stream; the first token arrives after ttft_ratio of the latency.
+
+        The rest of the latency is spread over the tokens, so a caller that closes the stream
+        early stops the "generation" (streamed_tokens/llm_completed count the work done).
+        """
+        request = json.loads(body)
+        self.calls["llm"] += 1
+        extra_ms = self._tail("InvokeModelWithResponseStream")
+        prompt = request["messages"][-1]["content"][0]["text"]
+        words = f"[{modelId}] answer based on {len(prompt)} prompt chars".split()
+        total_ms = self.llm_latency_ms + extra_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+
+        def events():
+            yield {"type": "message_start", "message": {"usage": {"input_tokens": len(prompt.split())}}}
+            self._sleep(total_ms * self.ttft_ratio, jitter=False)
+            for index, word in enumerate(words):
+                if index:
+                    self._sleep(total_ms * (1 - self.ttft_ratio) / len(words), jitter=False)
+                self.calls["streamed_tokens"] += 1
+                yield {"type": "content_block_delta", "delta": {"type": "text_delta", "text": word + " "}}
+            self._sleep(total_ms * (1 - self.ttft_ratio) / len(words), jitter=False)
+            yield {"type": "message_delta", "usage": {"output_tokens": len(words)}}
+            self.calls["llm_completed"] += 1
+            yield {"type": "message_stop"}
+
+        def stream():
+            for event in events():
+                yield {"chunk": {"bytes": json.dumps(event).encode("utf-8")}}
+
+        return {"body": stream()}
+
+
+def install_fakes(fake_bedrock):
+    """Point the MCP server module at the hermetic stand-ins."""
+    main.bedrock_client = fake_bedrock
+    main.embedder = TitanProvider(fake_bedrock)
+    main.secondary_embedders = []
+    if main.VECTOR_BACKEND == "mmap":
+        main.qdrant_client = MmapIndex(tempfile.mkdtemp(prefix="bench-vectors-"))
+    else:
+        main.qdrant_client = QdrantClient(location=":memory:")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class StageRecorder:
+    """Collects latencies and peak traced memory for one benchmark stage."""
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.latencies_ms = []
+        self.errors = 0
+        self.wall_s = 0.0
+        self.peak_mem_kb = None
+        self.max_rss_kb = 0
+
+    async def run(self, calls, concurrency=1):
+        # tracemalloc roughly doubles Python-level latency, so it is opt-in
+        if self.trace_memory:
+            tracemalloc.start()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(call):
+            async with semaphore:
+                t0 = time.perf_counter()
+                result = await call()
+                self.latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+                if isinstance(result, str) and ("Error" in result[:40]):
+                    self.errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(timed(call) for call in calls))
+        self.wall_s = time.perf_counter() - started
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.peak_mem_kb = round(peak / 1024.0, 1)
+        self.max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def summary(self):
+        values = sorted(self.latencies_ms)
+        count = len(values)
+        return {
+            "count": count,
+            "errors": self.errors,
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "mean_ms": round(sum(values) / count, 3) if count else 0.0,
+            "max_ms": round(values[-1], 3) if count else 0.0,
+            "throughput_per_s": round(count / self.wall_s, 3) if self.wall_s else 0.0,
+            "peak_mem_kb": self.peak_mem_kb,
+            "max_rss_kb": self.max_rss_kb,
+        }
+
+
+def server_stage_means():
+    """Mean duration of each instrumented server stage, from the Prometheus histograms."""
+    totals = {}
+    for family in metrics.STAGE_LATENCY.collect():
+        for sample in family.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                totals.setdefault(stage, {})["sum"] = sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(stage, {})["count"] = sample.value
+    return {
+        stage: {"count": int(v.get("count", 0)),
+                "mean_ms": round(v.get("sum", 0.0) / v["count"] * 1000.0, 3) if v.get("count") else 0.0}
+        for stage, v in totals.items()
+    }
+
+
+def load_queries(path):
+    with open(path) as f:
+        return json.load(f)["queries"]
+
+
+def load_documents(data_dir):
+    documents = []
+    for path in sorted(Path(data_dir).glob("*.txt")):
+        documents.append((path.name, path.read_text(encoding="utf-8", errors="ignore")))
+    return documents
+
+
+async def run_benchmark(args):
+    fake = FakeBedrock(
+        embed_latency_ms=args.embed_latency_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        jitter_ms=args.jitter_ms,
+        seed=args.seed,
+        spike_rate=args.spike_rate,
+        spike_ms=args.spike_ms,
+        throttle_rate=args.throttle_rate,
+    )
+    main.VECTOR_BACKEND = args.vector_backend
+    install_fakes(fake)
+    main.TENANCY_MODE = args.tenancy_mode
+    if args.resilience == "off":
+        # One attempt, no hedging, no fallback model: the pre-resilience behaviour
+        main.call_policy.max_attempts = 1
+        main.HEDGE_EMBEDDINGS = False
+        main.LLM_FALLBACK = False
+
+    queries = load_queries(args.queries)
+    documents = load_documents(args.data_dir)
+    tenants = sorted({q["tenantId"] for q in queries})
+
+    # Stage 1: ingestion of every data file into every tenant in the query set
+    ingest_calls = []
+    for tenant_id in tenants:
+        for filename, text in documents:
+            for index, chunk in enumerate(main.chunk_text(text)):
+                metadata = {"filename": filename, "chunk": index}
+                ingest_calls.append(
+                    lambda c=chunk, t=tenant_id, m=metadata: main.ingest_knowledge(c, t, m)
+                )
+    ingest = StageRecorder("ingest_knowledge", args.trace_memory)
+    await ingest.run(ingest_calls)
+
+    # Stage 2 and 3: retrieval and full generation over the query set
+    search_calls, generate_calls = [], []
+    for _ in range(args.iterations):
+        for q in queries:
+            search_calls.append(
+                lambda q=q: main.search_knowledge_base(q["message"], q["tenantId"])
+            )
+            generate_calls.append(
+                lambda q=q: main.generate_twin_response(q["message"], q["tenantId"], BENCH_SYSTEM_PROMPT)
+            )
+    search = StageRecorder("search_knowledge_base", args.trace_memory)
+    await search.run(search_calls, args.concurrency)
+    generate = StageRecorder("generate_twin_response", args.trace_memory)
+    await generate.run(generate_calls, args.concurrency)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "embed_latency_ms": args.embed_latency_ms,
+            "llm_latency_ms": args.llm_latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "spike_rate": args.spike_rate,
+            "spike_ms": args.spike_ms,
+            "throttle_rate": args.throttle_rate,
+            "resilience": args.resilience,
+            "seed": args.seed,
+            "trace_memory": args.trace_memory,
+            "tenancy_mode": args.tenancy_mode,
+            "vector_backend": args.vector_backend,
+            "concurrency": args.concurrency,
+            "tenants": tenants,
+            "documents": [name for name, _ in documents],
+            "bedrock_calls": fake.calls,
+            "singleflight": {
+                flight.kind: flight.stats()
+                for flight in (main.embedding_flight, main.search_flight, main.generate_flight)
+            },
+        },
+        "stages": {stage.name: stage.summary() for stage in (ingest, search, generate)},
+        "server_stages": server_stage_means(),
+    }
+
+
+def compare(current, baseline_path):
+    """Print p50/p95/p99 deltas against a previous result file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline_path}:", file=sys.stderr)
+    for name, stats in current["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if not previous:
+            print(f"  {name}: no baseline", file=sys.stderr)
+            continue
+        deltas = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            before, after = previous[key], stats[key]
+            change = ((after - before) / before * 100.0) if before else 0.0
+            deltas.append(f"{key} {before:.2f} -> {after:.2f} ({change:+.1f}%)")
+        print(f"  {name}: " + ", ".join(deltas), file=sys.stderr)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Hermetic MCP server RAG benchmark")
+    parser.add_argument("--queries", default=str(DEFAULT_QUERIES))
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR))
+    parser.add_argument("--iterations", type=int, default=10, help="Passes over the query set")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--spike-rate", type=float, default=0.0, help="Fraction of model calls that stall")
+    parser.add_argument("--spike-ms", type=float, default=2000.0, help="Extra latency of a stalled call")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="Fraction of model calls that fail with ThrottlingException")
+    parser.add_argument("--resilience", choices=["on", "off"], default="on",
+                        help="Retries, hedged embeddings and model fallback (resilience.py)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Concurrent search/generate calls (identical queries coalesce)")
+    parser.add_argument("--tenancy-mode", choices=["collection", "shared"], default=main.TENANCY_MODE)
+    parser.add_argument("--vector-backend", choices=["qdrant", "mmap"], default=main.VECTOR_BACKEND)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record tracemalloc peak per stage (inflates latency)")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="Previous JSON result to diff against")
+    args = parser.parse_args()
+
+    # Keep the server's routing logs out of the machine-readable output
+    with contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(run_benchmark(args))
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main_cli()
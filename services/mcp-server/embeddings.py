@@ -0,0 +1,137 @@
+"""
+Embedding providers for the MCP server.
+
+  titan  - Bedrock Titan (network call to Bedrock, 1536 dims for v1)
+  ollama - Ollama /api/embed, e.g. nomic-embed-text (768 dims, matches the n8n workflows)
+  local  - in-process CPU model via fastembed/ONNX (no network round trip, works offline)
+
+Each provider names the Qdrant vector it writes, so one collection can hold
+vectors from several models side by side.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import requests
+
+try:
+    from fastembed import TextEmbedding
+except ImportError:
+    TextEmbedding = None
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://ollama:11434")
+OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "nomic-ai/nomic-embed-text-v1.5")
+TITAN_BATCH_CONCURRENCY = int(os.getenv("TITAN_BATCH_CONCURRENCY", "8"))
+
+# Known output sizes; anything else is probed with one embedding call
+TITAN_DIMENSIONS = {"amazon.titan-embed-text-v1": 1536, "amazon.titan-embed-text-v2:0": 1024}
+OLLAMA_DIMENSIONS = {"nomic-embed-text": 768, "mxbai-embed-large": 1024, "all-minilm": 384}
+
+
+class EmbeddingProvider:
+    """Base class: `name` is the Qdrant named vector, `vector_size` its dimension."""
+
+    name = "base"
+    model_id = ""
+    vector_size = 0
+    # Network-backed (worth retrying and hedging); in-process providers set False
+    remote = True
+
+    def embed(self, text: str) -> Tuple[List[float], int]:
+        """Return (vector, input token count)."""
+        raise NotImplementedError
+
+    def embed_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        vectors, tokens = [], 0
+        for text in texts:
+            vector, count = self.embed(text)
+            vectors.append(vector)
+            tokens += count
+        return vectors, tokens
+
+
+class TitanProvider(EmbeddingProvider):
+    def __init__(self, client, model_id: str = "amazon.titan-embed-text-v1"):
+        self.client = client
+        self.model_id = model_id
+        # v1 keeps the original vector name; other models get their own, so a collection can hold both
+        self.name = "titan" if model_id == "amazon.titan-embed-text-v1" else model_id.split(".", 1)[-1].split(":")[0]
+        self.vector_size = TITAN_DIMENSIONS.get(model_id, 1536)
+
+    def embed(self, text: str) -> Tuple[List[float], int]:
+        response = self.client.invoke_model(
+            body=json.dumps({"inputText": text}),
+            modelId=self.model_id,
+            accept="application/json",
+            contentType="application/json"
+        )
+        response_body = json.loads(response.get("body").read())
+        return response_body.get("embedding"), response_body.get("inputTextTokenCount", 0)
+
+    def embed_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        # Titan takes one text per InvokeModel call; issue them concurrently instead
+        if len(texts) <= 1:
+            return super().embed_batch(texts)
+        with ThreadPoolExecutor(max_workers=min(len(texts), TITAN_BATCH_CONCURRENCY)) as pool:
+            results = list(pool.map(self.embed, texts))
+        return [vector for vector, _ in results], sum(tokens for _, tokens in results)
+
+
+class OllamaProvider(EmbeddingProvider):
+    def __init__(self, model_id: str = OLLAMA_EMBEDDING_MODEL, base_url: str = OLLAMA_URL):
+        self.model_id = model_id
+        self.name = model_id.split(":")[0]
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.vector_size = OLLAMA_DIMENSIONS.get(self.name) or len(self.embed("dimension probe")[0])
+
+    def embed_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        response = self.session.post(
+            f"{self.base_url}/api/embed",
+            json={"model": self.model_id, "input": texts},
+            timeout=30
+        )
+        response.raise_for_status()
+        data = response.json()
+        return data["embeddings"], data.get("prompt_eval_count", 0)
+
+    def embed(self, text: str) -> Tuple[List[float], int]:
+        vectors, tokens = self.embed_batch([text])
+        return vectors[0], tokens
+
+
+class LocalProvider(EmbeddingProvider):
+    """In-process CPU embeddings. nomic-embed-text-v1.5 shares the Ollama vector name."""
+
+    remote = False
+
+    def __init__(self, model_id: str = LOCAL_EMBEDDING_MODEL):
+        if TextEmbedding is None:
+            raise RuntimeError("EMBEDDING_PROVIDER=local requires the 'fastembed' package")
+        self.model_id = model_id
+        self.model = TextEmbedding(model_name=model_id)
+        short_name = model_id.split("/")[-1]
+        self.name = "nomic-embed-text" if short_name.startswith("nomic-embed-text") else short_name
+        self.vector_size = len(self.embed("dimension probe")[0])
+
+    def embed_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        vectors = [vector.tolist() for vector in self.model.embed(texts)]
+        return vectors, sum(len(text.split()) for text in texts)
+
+    def embed(self, text: str) -> Tuple[List[float], int]:
+        vectors, tokens = self.embed_batch([text])
+        return vectors[0], tokens
+
+
+def create_provider(kind: str, bedrock_client=None, model_id: str = None) -> EmbeddingProvider:
+    """Build a provider from its EMBEDDING_PROVIDER name."""
+    if kind == "titan":
+        return TitanProvider(bedrock_client, model_id or "amazon.titan-embed-text-v1")
+    if kind == "ollama":
+        return OllamaProvider(model_id or OLLAMA_EMBEDDING_MODEL)
+    if kind == "local":
+        return LocalProvider(model_id or LOCAL_EMBEDDING_MODEL)
+    raise ValueError(f"Unknown embedding provider '{kind}' (expected titan, ollama or local)")
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Load tests for the MCP HTTP bridge.
+
+Both scenarios go through /call/{tool} in-process (httpx ASGI transport)
+with the benchmark's FakeBedrock and in-memory Qdrant.
+
+  noisy     - one tenant floods ingest_document (a Lambda backfill) while
+              other tenants chat through generate_twin_response at a steady
+              rate; repeated with admission control off and on, comparing
+              chat latency, ingest throughput and 429s
+  deadline  - chat clients send X-Deadline-Ms and give up when it passes,
+              while a fraction of model calls stall; repeated with deadline
+              propagation off and on, comparing the generation work done
+              for clients that had already left
+
+Usage:
+  python loadtest.py
+  python loadtest.py --duration 20 --flood-concurrency 64 --chat-rps 10
+  python loadtest.py --scenario deadline --client-timeout 1.5 --spike-rate 0.3
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import httpx
+
+import benchmark
+import main
+from admission import AdmissionController
+from resilience import DEADLINE_HEADER
+
+DOCUMENT = "\n\n".join(
+    f"Backfill paragraph {i}: " + " ".join(f"inventory item {i}-{j} stock level" for j in range(60))
+    for i in range(12)
+)
+QUESTIONS = ["How many 2 inch GI pipes are in stock?", "What is the price of SS elbows?",
+             "Summarize the supplier list", "Who handles technical support?"]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "p50_ms": round(benchmark.percentile(latencies, 50) * 1000),
+        "p99_ms": round(benchmark.percentile(latencies, 99) * 1000),
+    }
+
+
+async def run_scenario(args, admission_on):
+    main.ADMISSION = admission_on
+    main.admission = AdmissionController()
+    app = main.mcp.sse_app()
+    transport = httpx.ASGITransport(app=app)
+    results = {"chat": [], "chat_429": 0, "chat_errors": 0, "ingest_ok": 0, "ingest_429": 0}
+    deadline = time.perf_counter() + args.duration
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://mcp", timeout=120) as client:
+        async def flood(worker):
+            n = 0
+            while time.perf_counter() < deadline:
+                n += 1
+                response = await client.post("/call/ingest_document", json={
+                    "text": DOCUMENT, "tenantId": "tenant-flood",
+                    "s3Key": f"tenant-flood/CEO/backfill-{worker}-{n}.txt", "version": "v1",
+                })
+                if response.status_code == 429:
+                    results["ingest_429"] += 1
+                    # A well-behaved client honours Retry-After
+                    await asyncio.sleep(min(float(response.headers.get("Retry-After", 1)), 2))
+                elif response.status_code == 200:
+                    results["ingest_ok"] += 1
+
+        async def chat(i):
+            start = time.perf_counter()
+            response = await client.post("/call/generate_twin_response", json={
+                "query": QUESTIONS[i % len(QUESTIONS)], "tenantId": f"tenant-chat{i % args.chat_tenants}",
+                "system_prompt": benchmark.BENCH_SYSTEM_PROMPT,
+            })
+            if response.status_code == 429:
+                results["chat_429"] += 1
+            elif response.status_code != 200:
+                results["chat_errors"] += 1
+            else:
+                results["chat"].append(time.perf_counter() - start)
+
+        async def chat_load():
+            tasks, i = [], 0
+            while time.perf_counter() < deadline:
+                tasks.append(asyncio.create_task(chat(i)))
+                i += 1
+                await asyncio.sleep(1.0 / args.chat_rps)
+            await asyncio.gather(*tasks)
+
+        started = time.perf_counter()
+        await asyncio.gather(chat_load(), *(flood(w) for w in range(args.flood_concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        "chat": summarize(results["chat"]),
+        "chat_429": results["chat_429"],
+        "chat_errors": results["chat_errors"],
+        "ingest_per_s": round(results["ingest_ok"] / wall, 1),
+        "ingest_429": results["ingest_429"],
+    }
+
+
+async def run_deadline_scenario(args, fake, propagation_on):
+    main.DEADLINE_PROPAGATION = propagation_on
+    main.admission = AdmissionController()
+    app = main.mcp.sse_app()
+    transport = httpx.ASGITransport(app=app)
+    results = {"answered": [], "abandoned": 0, "deadline_504": 0, "errors": 0}
+    before = dict(fake.calls)
+    deadline = time.perf_counter() + args.duration
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://mcp", timeout=120) as client:
+        async def chat(i):
+            start = time.perf_counter()
+            try:
+                # The client gives up at its deadline, like the pipeline's request timeout
+                response = await asyncio.wait_for(client.post(
+                    "/call/generate_twin_response",
+                    json={"query": f"{QUESTIONS[i % len(QUESTIONS)]} (order {i})",
+                          "tenantId": f"tenant-chat{i % args.chat_tenants}",
+                          "system_prompt": benchmark.BENCH_SYSTEM_PROMPT},
+                    # Deadline slightly inside the client timeout, so the server's 504 arrives first
+                    headers={DEADLINE_HEADER: str(int(args.client_timeout * 1000) - 100)},
+                ), timeout=args.client_timeout)
+            except asyncio.TimeoutError:
+                results["abandoned"] += 1
+                return
+            if response.status_code == 504:
+                results["deadline_504"] += 1
+            elif response.status_code != 200:
+                results["errors"] += 1
+            else:
+                results["answered"].append(time.perf_counter() - start)
+
+        tasks, i = [], 0
+        while time.perf_counter() < deadline:
+            tasks.append(asyncio.create_task(chat(i)))
+            i += 1
+            await asyncio.sleep(1.0 / args.chat_rps)
+        await asyncio.gather(*tasks)
+
+    # Let generations the server kept running after their client left finish, then count them
+    await asyncio.sleep(args.llm_latency_ms / 1000 + args.spike_ms / 1000 + 1)
+    completed = fake.calls["llm_completed"] - before["llm_completed"]
+    return {
+        "answered": summarize(results["answered"]),
+        "abandoned": results["abandoned"],
+        "deadline_504": results["deadline_504"],
+        "errors": results["errors"],
+        "generations_completed": completed,
+        "completed_for_nobody": completed - len(results["answered"]),
+        "streamed_tokens": fake.calls["streamed_tokens"] - before["streamed_tokens"],
+    }
+
+
+async def run_all(args):
+    fake = benchmark.FakeBedrock(
+        embed_latency_ms=args.embed_latency_ms, llm_latency_ms=args.llm_latency_ms,
+        spike_rate=args.spike_rate if args.scenario == "deadline" else 0.0, spike_ms=args.spike_ms,
+    )
+    benchmark.install_fakes(fake)
+    main.TABULAR_FASTPATH = False
+    for tenant in range(args.chat_tenants):
+        await main.ingest_knowledge("Mastro Metals keeps GI pipes, SS elbows and supplier contacts.",
+                                    f"tenant-chat{tenant}")
+    if args.scenario == "deadline":
+        for propagation_on in (False, True):
+            result = await run_deadline_scenario(args, fake, propagation_on)
+            print(f"deadline propagation {'on ' if propagation_on else 'off'}: {result}")
+        return
+    for admission_on in (False, True):
+        result = await run_scenario(args, admission_on)
+        print(f"admission {'on ' if admission_on else 'off'}: {result}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="MCP bridge load tests")
+    parser.add_argument("--scenario", choices=["noisy", "deadline"], default="noisy")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--flood-concurrency", type=int, default=32, help="Concurrent backfill workers")
+    parser.add_argument("--chat-rps", type=float, default=5.0)
+    parser.add_argument("--chat-tenants", type=int, default=3)
+    parser.add_argument("--embed-latency-ms", type=float, default=40.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    parser.add_argument("--client-timeout", type=float, default=1.5,
+                        help="deadline scenario: seconds before a chat client gives up")
+    parser.add_argument("--spike-rate", type=float, default=0.3,
+                        help="deadline scenario: fraction of model calls that stall")
+    parser.add_argument("--spike-ms", type=float, default=3000.0)
+    args = parser.parse_args()
+    asyncio.run(run_all(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,12 +1,40 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import asyncio
 import json
+import math
+import random
+import re
+import uuid
+from datetime import datetime
 import boto3
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from typing import Optional, List
 from mcp.server.fastmcp import FastMCP
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from dotenv import load_dotenv
+import storage_profiles
+import tabular_store
+import usage_store
+from mmap_index import MmapIndex, VECTOR_STORE_DIR
+from embeddings import create_provider
+from retrieval_gate import build_gate, follow_up_query
+from singleflight import SingleFlight, TTLCache, normalize_query
+from warmup import LazyClient, Warmup
+from resilience import (
+    DEADLINE_HEADER, EMBED_DEADLINE, HEDGE_EMBEDDINGS, CallPolicy, Deadline, DeadlineExceeded, LatencyTracker,
+    check_deadline, deadline_var, error_reason, request_deadline,
+)
+from admission import ADMISSION, BULK, INTERACTIVE, AdmissionController, Rejected, retry_after_header
+from metrics import (
+    LLM_DURATION, LLM_TIME_TO_FIRST_TOKEN, REQUEST_ID_HEADER, RETRIEVAL_DECISIONS, STAGE_LATENCY,
+    DEGRADED_TURNS, MODEL_FALLBACKS, STARTUP_SECONDS, TABULAR_ANSWERS, TOOL_CALLS, TOOL_LATENCY,
+    format_timeline, log, record_tokens, render_latest, request_id_var, server_timing, stage_timer, timeline_var,
+)
 
 # Load environment variables
 load_dotenv()
@@ -14,59 +42,591 @@ load_dotenv()
 # Configuration
 QDRANT_HOST = os.getenv("QDRANT_HOST", "qdrant")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6334"))
+# "qdrant", or "mmap" for the embedded index in mmap_index.py (small deployments without a Qdrant container)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
 AWS_REGION = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
-EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
-VECTOR_SIZE = 1536 # Titan embedding size
+# Embeddings: titan (Bedrock), ollama or local (in-process CPU), see embeddings.py.
+# Secondary providers are also written at ingest, as extra named vectors.
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "titan")
+EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL_ID")
+EMBEDDING_SECONDARY_PROVIDERS = [p for p in os.getenv("EMBEDDING_SECONDARY_PROVIDERS", "").split(",") if p]
+
+# Tenancy: "collection" = one Qdrant collection per tenant,
+# "shared" = every tenant in QDRANT_COLLECTION, partitioned by a tenantId payload index
+TENANCY_MODE = os.getenv("TENANCY_MODE", "collection")
+SHARED_COLLECTION = os.getenv("QDRANT_COLLECTION", "digital_twin_knowledge")
+# New collections are created as <name>__<timestamp> behind an alias <name>; every read and write
+# goes through the alias, so reembed.py can swap in a rebuilt collection atomically
+COLLECTION_ALIASES = os.getenv("COLLECTION_ALIASES", "on") == "on"
+TENANT_KEY = "tenantId"
+# Payload keys written by the S3 ingest Lambda; keyword-indexed so filtered HNSW search stays fast
+PERSONA_KEY = "personaId"
+FILENAME_KEY = "filename"
+S3_KEY = "s3Key"
+# Version of the S3 object (ETag) a document's chunks came from; lets a re-ingest swap chunks in place
+VERSION_KEY = "docVersion"
+PAYLOAD_INDEXES = (TENANT_KEY, PERSONA_KEY, FILENAME_KEY, S3_KEY)
+
+# Document ingest: chunk size in characters (matches the n8n ingest workflows)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "2000"))
+
+# Tabular documents are also loaded into a per-tenant SQLite store (tabular_store.py);
+# lookup/aggregate questions on them are answered from matched rows instead of vector search + LLM
+TABULAR_FASTPATH = os.getenv("TABULAR_FASTPATH", "on") == "on"
+
+# Storage profile for newly created collections (see storage_profiles.py)
+DEFAULT_STORAGE_PROFILE = os.getenv("DEFAULT_STORAGE_PROFILE", "small")
+SHARED_STORAGE_PROFILE = os.getenv("SHARED_STORAGE_PROFILE", "large")
+# Coalesce identical concurrent generate_twin_response calls (embeddings and searches always are)
+COALESCE_GENERATE = os.getenv("COALESCE_GENERATE", "off") == "on"
+# Start the query embedding as soon as the retrieval gate sends a chat turn to search (before
+# the tabular store and collection check have answered), and keep query vectors briefly
+PREFETCH_EMBEDDING = os.getenv("PREFETCH_EMBEDDING", "on") == "on"
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "30"))
+
+# Generation models (Router): Fast = Claude 3.5 Haiku, Smart = Claude 3.5 Sonnet
+FAST_MODEL = os.getenv("FAST_MODEL", "anthropic.claude-3-5-haiku-20241022-v1:0")
+SMART_MODEL = os.getenv("SMART_MODEL", "anthropic.claude-3-5-sonnet-20241022-v2:0")
+
+# Batch search: max queries per call and the Reciprocal Rank Fusion constant
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "16"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+COLLECTION_INFO_TTL = int(os.getenv("COLLECTION_INFO_TTL", os.getenv("SEARCH_PARAMS_TTL", "300")))
+# Fraction of search_knowledge_base queries recorded to QUERY_SAMPLE_FILE for tune_search.py (0 = off)
+QUERY_SAMPLE_RATE = float(os.getenv("QUERY_SAMPLE_RATE", "0"))
+QUERY_SAMPLE_FILE = os.getenv("QUERY_SAMPLE_FILE", "/app/data/tuning/queries.jsonl")
+QUERY_SAMPLE_MAX_BYTES = int(os.getenv("QUERY_SAMPLE_MAX_MB", "20")) * 1024 * 1024
+
+# Startup warmup: /health reports ready only after collection metadata is loaded and connections are open.
+# WARMUP_QUERIES ("|"-separated) are pre-embedded and searched once per collection to load its segments.
+WARMUP = os.getenv("WARMUP", "on") == "on"
+WARMUP_QUERIES = [q for q in os.getenv("WARMUP_QUERIES", "").split("|") if q.strip()]
+WARMUP_MAX_COLLECTIONS = int(os.getenv("WARMUP_MAX_COLLECTIONS", "50"))
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "32"))
+BEDROCK_CONNECT_TIMEOUT = float(os.getenv("BEDROCK_CONNECT_TIMEOUT", "5"))
+BEDROCK_READ_TIMEOUT = float(os.getenv("BEDROCK_READ_TIMEOUT", "30"))
+
+# Time budget for one generate_twin_response call (see resilience.py). When the smart model's
+# observed p95 no longer fits, or it is throttled/failing, the turn falls back to FAST_MODEL.
+GENERATE_DEADLINE = float(os.getenv("GENERATE_DEADLINE", "60"))
+LLM_FALLBACK = os.getenv("LLM_FALLBACK", "on") == "on"
+# Request deadlines: callers send X-Deadline-Ms; calls without one get REQUEST_DEADLINE seconds.
+# Work is cancelled when the deadline passes or the client disconnects (checked every
+# DISCONNECT_POLL_SECONDS). A turn with less than DEGRADE_BELOW seconds left degrades: fast
+# model, DEGRADED_SEARCH_LIMIT chunks, 2 history turns and a shorter answer.
+DEADLINE_PROPAGATION = os.getenv("DEADLINE_PROPAGATION", "on") == "on"
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "300"))
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.25"))
+DEGRADE_BELOW = float(os.getenv("DEGRADE_BELOW", "15"))
+DEGRADED_SEARCH_LIMIT = int(os.getenv("DEGRADED_SEARCH_LIMIT", "3"))
 
 # Initialize FastMCP server
 mcp = FastMCP("CloneMind Knowledge Base")
 
-# Initialize Clients
-qdrant_client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-bedrock_client = boto3.client("bedrock-runtime", region_name=AWS_REGION)
-
-def get_embedding(text: str) -> List[float]:
-    """Generate embedding using Bedrock Titan."""
-    body = json.dumps({"inputText": text})
-    response = bedrock_client.invoke_model(
-        body=body,
-        modelId=EMBEDDING_MODEL_ID,
-        accept="application/json",
-        contentType="application/json"
+# Initialize Clients (built on first use or by the warmup thread, so importing this module stays cheap)
+boto_session = boto3.Session(region_name=AWS_REGION)
+qdrant_client = LazyClient("qdrant", lambda: (
+    MmapIndex(VECTOR_STORE_DIR) if VECTOR_BACKEND == "mmap" else QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+))
+bedrock_client = LazyClient("bedrock", lambda: boto_session.client(
+    "bedrock-runtime", config=Config(
+        max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+        read_timeout=BEDROCK_READ_TIMEOUT,
+        # resilience.py owns retries so they respect call deadlines
+        retries={"total_max_attempts": 1},
+    )
+))
+embedder = LazyClient("embedder", lambda: create_provider(EMBEDDING_PROVIDER, bedrock_client, EMBEDDING_MODEL_ID))
+secondary_embedders = [
+    LazyClient(f"embedder_{kind}", lambda kind=kind: create_provider(kind, bedrock_client))
+    for kind in EMBEDDING_SECONDARY_PROVIDERS
+]
+retrieval_gate = build_gate()
+
+embedding_flight = SingleFlight("embedding")
+search_flight = SingleFlight("search")
+generate_flight = SingleFlight("generate")
+query_vectors = TTLCache(EMBED_CACHE_TTL)
+# Fire-and-forget prefetches (kept referenced until they finish)
+_prefetches = set()
+
+model_latency = LatencyTracker()
+call_policy = CallPolicy(model_latency)
+
+def get_embedding(text: str, tenant_id: str = "unknown", provider=None) -> List[float]:
+    """Generate an embedding with the configured provider (query-side model by default).
+
+    Throttles and timeouts are retried within EMBED_DEADLINE; remote providers are hedged.
+    """
+    provider = provider or embedder
+    start = time.perf_counter()
+    with stage_timer("embedding"):
+        vector, tokens = call_policy.call(
+            f"embedding_{provider.name}", lambda: provider.embed(text), request_deadline(EMBED_DEADLINE),
+            hedge=HEDGE_EMBEDDINGS and provider.remote,
+        )
+    record_tokens(provider.model_id, tenant_id, input_tokens=tokens)
+    usage_store.record(tenant_id, "embedding", provider.model_id, tokens, latency_s=time.perf_counter() - start)
+    return vector
+
+def get_embeddings(texts: List[str], tenant_id: str = "unknown", provider=None) -> List[List[float]]:
+    """Embed several texts in one provider batch."""
+    provider = provider or embedder
+    start = time.perf_counter()
+    with stage_timer("embedding"):
+        vectors, tokens = call_policy.call(
+            f"embedding_batch_{provider.name}", lambda: provider.embed_batch(texts),
+            request_deadline(EMBED_DEADLINE * max(1, len(texts))),
+        )
+    record_tokens(provider.model_id, tenant_id, input_tokens=tokens)
+    usage_store.record(tenant_id, "embedding", provider.model_id, tokens, latency_s=time.perf_counter() - start)
+    return vectors
+
+async def embed_query(query: str, tenant_id: str) -> List[float]:
+    """Query embedding off the event loop; identical concurrent queries share one call.
+
+    Vectors don't depend on the tenant, so the key is the provider and normalized text.
+    A vector computed in the last EMBED_CACHE_TTL seconds (e.g. by a prefetch) is reused.
+    """
+    key = (embedder.name, normalize_query(query))
+    vector = query_vectors.get(key)
+    if vector is None:
+        vector = await embedding_flight.do(key, lambda: asyncio.to_thread(get_embedding, query, tenant_id))
+        query_vectors.put(key, vector)
+    return vector
+
+async def retrieval_decision(query: str, messages: Optional[List[dict]] = None):
+    """(needs_retrieval, reason) from the retrieval gate."""
+    if not retrieval_gate:
+        return True, "disabled"
+    with stage_timer("retrieval_gate"):
+        return await asyncio.to_thread(retrieval_gate.decide, query, messages)
+
+def search_query_for(query: str, messages: Optional[List[dict]], reason: str) -> str:
+    """What to search for: the query, or for "yes" to the assistant's question, that exchange."""
+    return follow_up_query(messages) if reason == "follow_up" else query
+
+async def embed_if_retrieving(query: str, tenant_id: str, messages: Optional[List[dict]] = None):
+    """Embed the search query only when the retrieval gate will send the turn to search."""
+    needs_retrieval, reason = await retrieval_decision(query, messages)
+    if needs_retrieval:
+        await embed_query(search_query_for(query, messages, reason), tenant_id)
+
+def prefetch_embedding(query: str, tenant_id: str, messages: Optional[List[dict]] = None, gated: bool = False):
+    """Start embed_query in the background; a later embed_query joins it or hits the cache.
+
+    gated: ask the retrieval gate first (for callers that haven't), so small talk costs no embedding.
+    """
+    coro = embed_if_retrieving(query, tenant_id, messages) if gated else embed_query(query, tenant_id)
+    task = asyncio.create_task(coro)
+    _prefetches.add(task)
+    # Errors resurface in the search that needs the vector; don't log them as unretrieved here
+    task.add_done_callback(lambda t: (_prefetches.discard(t), t.cancelled() or t.exception()))
+    return task
+
+async def collection_ready(collection_name: str) -> bool:
+    with stage_timer("collection_check"):
+        return await asyncio.to_thread(qdrant_client.collection_exists, collection_name)
+
+def collection_vectors() -> dict:
+    """Named vectors (name -> size) that new collections are created with."""
+    return {p.name: p.vector_size for p in [embedder, *secondary_embedders]}
+
+def invoke_llm(model_id: str, request_body: dict, tenant_id: str, deadline: Optional[Deadline] = None) -> str:
+    """Stream a Claude response from Bedrock, recording time-to-first-token and total time.
+
+    The deadline bounds the wait for the first token; an answer already streaming is finished
+    unless the deadline is cancelled (request deadline passed or client gone), which closes
+    the stream so Bedrock stops generating.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    input_tokens = output_tokens = 0
+    parts = []
+
+    response = bedrock_client.invoke_model_with_response_stream(
+        modelId=model_id,
+        body=json.dumps(request_body)
     )
-    response_body = json.loads(response.get("body").read())
-    return response_body.get("embedding")
+    stream = response.get("body")
+    for event in stream:
+        chunk = event.get("chunk")
+        if not chunk:
+            continue
+        data = json.loads(chunk["bytes"])
+        if deadline is not None and (deadline.cancelled or (first_token_at is None and deadline.expired)):
+            if hasattr(stream, "close"):
+                stream.close()
+            record_tokens(model_id, tenant_id, input_tokens=input_tokens, output_tokens=len(parts))
+            usage_store.record(tenant_id, "llm", model_id, input_tokens, len(parts), time.perf_counter() - start)
+            if deadline.cancelled:
+                raise DeadlineExceeded(f"{model_id} stream abandoned after {len(parts)} chunks: request cancelled")
+            raise DeadlineExceeded(f"{model_id} produced no tokens before the deadline")
+        if data.get("type") == "message_start":
+            input_tokens = data.get("message", {}).get("usage", {}).get("input_tokens", 0)
+        elif data.get("type") == "content_block_delta":
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                LLM_TIME_TO_FIRST_TOKEN.labels(model=model_id).observe(first_token_at - start)
+            parts.append(data.get("delta", {}).get("text", ""))
+        elif data.get("type") == "message_delta":
+            output_tokens = data.get("usage", {}).get("output_tokens", output_tokens)
+
+    total = time.perf_counter() - start
+    LLM_DURATION.labels(model=model_id).observe(total)
+    record_tokens(model_id, tenant_id, input_tokens=input_tokens, output_tokens=output_tokens)
+    usage_store.record(tenant_id, "llm", model_id, input_tokens, output_tokens, latency_s=total)
+    ttft_ms = (first_token_at - start) * 1000 if first_token_at else total * 1000
+    log(f"LLM {model_id}: ttft={ttft_ms:.0f}ms total={total * 1000:.0f}ms tokens={input_tokens}/{output_tokens}")
+    return "".join(parts)
+
+def generate_with_fallback(model_id: str, request_body: dict, tenant_id: str, deadline: Deadline) -> str:
+    """invoke_llm along the fallback chain (smart -> fast model).
+
+    A model is skipped when its observed p95 no longer fits the remaining budget, and abandoned
+    for the next one on throttling/5xx/timeouts (each model has its own quota). The last model
+    in the chain is retried within the deadline.
+    """
+    chain = [model_id] + ([FAST_MODEL] if LLM_FALLBACK and model_id != FAST_MODEL else [])
+    for index, current in enumerate(chain):
+        key = f"llm_{current}"
+        call = lambda: invoke_llm(current, request_body, tenant_id, deadline)
+        if index == len(chain) - 1:
+            return call_policy.call(key, call, deadline)
+        expected = model_latency.percentile(key, 95)
+        if expected is not None and expected > deadline.remaining():
+            MODEL_FALLBACKS.labels(from_model=current, to_model=chain[index + 1], reason="deadline").inc()
+            log(f"Falling back from {current}: p95 {expected:.1f}s > {deadline.remaining():.1f}s left")
+            continue
+        try:
+            return call_policy.timed(key, call)
+        except Exception as e:
+            reason = "deadline" if isinstance(e, DeadlineExceeded) else error_reason(e)
+            if reason is None:
+                raise
+            MODEL_FALLBACKS.labels(from_model=current, to_model=chain[index + 1], reason=reason).inc()
+            log(f"Falling back from {current}: {e}")
+
+def qdrant_timeout() -> Optional[int]:
+    """Server-side Qdrant timeout (whole seconds) from the request deadline, if there is one."""
+    deadline = deadline_var.get()
+    return None if deadline is None else max(1, math.ceil(deadline.remaining()))
+
+def collection_for_tenant(tenant_id: str) -> str:
+    """Name of the Qdrant collection holding a tenant's vectors."""
+    if TENANCY_MODE == "shared":
+        return SHARED_COLLECTION
+    return tenant_id.replace("-", "_")
+
+def tenant_filter(tenant_id: str) -> Optional[models.Filter]:
+    """Filter isolating a tenant's points. Mandatory in shared mode, implicit in collection mode."""
+    if TENANCY_MODE != "shared":
+        return None
+    if not tenant_id:
+        raise ValueError("tenantId is required in shared tenancy mode")
+    return models.Filter(must=[
+        models.FieldCondition(key=TENANT_KEY, match=models.MatchValue(value=tenant_id))
+    ])
+
+def search_filter(
+    tenant_id: str,
+    persona_id: Optional[str] = None,
+    documents: Optional[List[str]] = None
+) -> Optional[models.Filter]:
+    """Tenant filter narrowed to one persona and/or a set of documents (filename or s3Key)."""
+    base = tenant_filter(tenant_id)
+    must = list(base.must) if base else []
+    if persona_id:
+        must.append(models.FieldCondition(key=PERSONA_KEY, match=models.MatchValue(value=persona_id)))
+    if documents:
+        must.append(models.Filter(should=[
+            models.FieldCondition(key=FILENAME_KEY, match=models.MatchAny(any=documents)),
+            models.FieldCondition(key=S3_KEY, match=models.MatchAny(any=documents)),
+        ]))
+    return models.Filter(must=must) if must else None
+
+# Shared collection: no global HNSW graph (m=0); build one small graph per tenantId instead (payload_m)
+SHARED_HNSW_OVERRIDES = {"payload_m": 16, "m": 0}
+
+# Collections whose payload indexes were checked by this process
+_indexed_collections = set()
 
-def ensure_collection(collection_name: str):
-    """Ensure a Qdrant collection exists for the tenant."""
+def ensure_payload_indexes(collection_name: str, shared: Optional[bool] = None):
+    """Create any missing keyword indexes (tenant, persona, filename, s3Key) on a collection."""
+    if collection_name in _indexed_collections:
+        return
+    existing = qdrant_client.get_collection(collection_name).payload_schema or {}
+    if shared is None:
+        shared = collection_name == SHARED_COLLECTION and TENANCY_MODE == "shared"
+    for field in PAYLOAD_INDEXES:
+        if field in existing:
+            continue
+        qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field,
+            # is_tenant co-locates each tenant's points on disk in the shared collection
+            field_schema=models.KeywordIndexParams(
+                type=models.KeywordIndexType.KEYWORD, is_tenant=shared and field == TENANT_KEY
+            ),
+        )
+    _indexed_collections.add(collection_name)
+
+PHYSICAL_SUFFIX = re.compile(r"__\d{14}$")
+
+def physical_collection_name(collection_name: str) -> str:
+    """A fresh name for the collection behind an alias: <name>__<UTC timestamp>."""
+    stamp = int(time.time())
+    while True:
+        name = f"{collection_name}__{time.strftime('%Y%m%d%H%M%S', time.gmtime(stamp))}"
+        if not qdrant_client.collection_exists(name):
+            return name
+        stamp += 1
+
+def tenant_collections() -> List[str]:
+    """Collections by the names the server uses: aliases, plus pre-alias collections.
+
+    <name>__<timestamp> collections no alias points at (a rebuild in progress, or one kept
+    for rollback after a swap) are left out.
+    """
+    aliases = qdrant_client.get_aliases().aliases
+    targets = {alias.collection_name for alias in aliases}
+    names = [alias.alias_name for alias in aliases]
+    names += [
+        c.name for c in qdrant_client.get_collections().collections
+        if c.name not in targets and not PHYSICAL_SUFFIX.search(c.name)
+    ]
+    return sorted(names)
+
+def resolve_collection(collection_name: str) -> str:
+    """The collection an alias points at (the name itself when it isn't an alias)."""
+    for alias in qdrant_client.get_aliases().aliases:
+        if alias.alias_name == collection_name:
+            return alias.collection_name
+    return collection_name
+
+def is_legacy_collection(collection_name: str) -> bool:
+    """A pre-alias collection: a real collection under the name the server uses, not an alias."""
+    return resolve_collection(collection_name) == collection_name and qdrant_client.collection_exists(collection_name)
+
+def swap_alias(alias_name: str, collection_name: str) -> Optional[str]:
+    """Point alias_name at collection_name in one atomic alias update; returns the previous target.
+
+    A pre-alias collection under alias_name raises ValueError: Qdrant can't turn a collection into
+    an alias atomically, so it has to be moved behind one first (reembed.py --migrate-legacy).
+    """
+    if is_legacy_collection(alias_name):
+        raise ValueError(f"{alias_name} is a pre-alias collection; move it behind an alias first "
+                         f"(python reembed.py {alias_name} --migrate-legacy)")
+    previous = resolve_collection(alias_name)
+    operations = []
+    if previous != alias_name:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias_name)))
+    else:
+        previous = None
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias_name)
+    ))
+    qdrant_client.update_collection_aliases(change_aliases_operations=operations)
+    _collection_info_cache.pop(alias_name, None)
+    _indexed_collections.discard(alias_name)
+    return previous
+
+def adopt_legacy_collection(alias_name: str, replacement: str, attempts: int = 5):
+    """Replace the pre-alias collection alias_name with an alias of that name to `replacement`.
+
+    `replacement` must already hold everything that should stay (a verified copy, or a restored
+    snapshot). The name doesn't resolve between dropping the collection and creating the alias,
+    typically milliseconds; the alias update is retried, and `replacement` is never dropped here.
+    """
+    log(f"Dropping pre-alias collection {alias_name}; its name becomes an alias to {replacement}")
+    qdrant_client.delete_collection(alias_name)
+    for attempt in range(attempts):
+        try:
+            qdrant_client.update_collection_aliases(change_aliases_operations=[models.CreateAliasOperation(
+                create_alias=models.CreateAlias(collection_name=replacement, alias_name=alias_name)
+            )])
+            break
+        except Exception as e:
+            if attempt == attempts - 1:
+                log(f"Alias {alias_name} -> {replacement} failed: {e}; the points are in {replacement}")
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+    _collection_info_cache.pop(alias_name, None)
+    _indexed_collections.discard(alias_name)
+
+def create_collection(collection_name: str, **kwargs):
+    """Create a collection, behind an alias of that name when COLLECTION_ALIASES is on."""
+    if not COLLECTION_ALIASES:
+        qdrant_client.create_collection(collection_name=collection_name, **kwargs)
+        return
+    physical = physical_collection_name(collection_name)
+    qdrant_client.create_collection(collection_name=physical, **kwargs)
+    swap_alias(collection_name, physical)
+
+def ensure_collection(collection_name: str, profile: Optional[str] = None):
+    """Ensure a Qdrant collection exists for the tenant, with its payload indexes."""
     if not qdrant_client.collection_exists(collection_name):
-        qdrant_client.create_collection(
+        if collection_name == SHARED_COLLECTION and TENANCY_MODE == "shared":
+            create_collection(
+                collection_name,
+                **storage_profiles.create_collection_kwargs(
+                    profile or SHARED_STORAGE_PROFILE, collection_vectors(), SHARED_HNSW_OVERRIDES
+                ),
+            )
+        else:
+            create_collection(
+                collection_name,
+                **storage_profiles.create_collection_kwargs(profile or DEFAULT_STORAGE_PROFILE, collection_vectors()),
+            )
+    # Also backfills indexes on collections created before they were added
+    ensure_payload_indexes(collection_name)
+
+# collection name -> (expires_at, CollectionInfo); refreshed so re-profiling is picked up
+_collection_info_cache = {}
+
+def collection_info(collection_name: str):
+    cached = _collection_info_cache.get(collection_name)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    info = qdrant_client.get_collection(collection_name)
+    _collection_info_cache[collection_name] = (time.monotonic() + COLLECTION_INFO_TTL, info)
+    return info
+
+def search_params_for(collection_name: str, tenant_id: Optional[str] = None) -> Optional[models.SearchParams]:
+    """Search params tuned for the tenant (tune_search.py), else the storage profile's (rescoring for quantized ones)."""
+    profile = storage_profiles.profile_from_collection(collection_info(collection_name))
+    tuned = storage_profiles.tuned_search_params(collection_name, tenant_id, profile, vector_name_for(collection_name))
+    return tuned if tuned is not None else storage_profiles.search_params(profile)
+
+def vector_name_for(collection_name: str, provider=None) -> Optional[str]:
+    """Named vector a provider uses in a collection; None for legacy single-vector collections."""
+    provider = provider or embedder
+    sizes = storage_profiles.vector_sizes(collection_info(collection_name))
+    if provider.name in sizes:
+        return provider.name
+    if sizes.get("") == provider.vector_size:
+        return None
+    raise ValueError(
+        f"Collection '{collection_name}' has no vector for embedding model '{provider.name}' "
+        f"({provider.vector_size} dims); available: {sizes}"
+    )
+
+def chunk_text(text: str, size: int = CHUNK_SIZE) -> List[str]:
+    """Split on blank lines and pack paragraphs into chunks of roughly `size` chars."""
+    chunks, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        paragraph = paragraph.strip()
+        # Paragraphs longer than a chunk are cut at the size limit
+        while len(paragraph) > size:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:size])
+            paragraph = paragraph[size:].strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+def chunk_vectors(collection_name: str, chunks: List[str], tenant_id: str) -> list:
+    """point_vectors for many chunks, one embedding batch per provider."""
+    sizes = storage_profiles.vector_sizes(collection_info(collection_name))
+    if "" in sizes:
+        return get_embeddings(chunks, tenant_id)
+    per_provider = {
+        p.name: get_embeddings(chunks, tenant_id, p)
+        for p in [embedder, *secondary_embedders] if p.name in sizes
+    }
+    return [{name: vectors[i] for name, vectors in per_provider.items()} for i in range(len(chunks))]
+
+def source_filter(tenant_id: str, s3_key: str, keep_version: Optional[str] = None) -> models.Filter:
+    """A tenant's points for one S3 object, optionally excluding one version of it."""
+    base = tenant_filter(tenant_id)
+    must = list(base.must) if base else []
+    must.append(models.FieldCondition(key=S3_KEY, match=models.MatchValue(value=s3_key)))
+    must_not = [models.FieldCondition(key=VERSION_KEY, match=models.MatchValue(value=keep_version))] if keep_version else None
+    return models.Filter(must=must, must_not=must_not)
+
+def delete_source_points(collection_name: str, query_filter: models.Filter) -> int:
+    """Delete every point matching the filter in one call; returns how many there were."""
+    count = qdrant_client.count(collection_name, count_filter=query_filter, exact=True).count
+    if count:
+        qdrant_client.delete(
             collection_name=collection_name,
-            vectors_config=models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE),
+            points_selector=models.FilterSelector(filter=query_filter),
+            wait=True,
         )
+    return count
+
+def point_vectors(collection_name: str, text: str, tenant_id: str):
+    """Vectors for a new point: every configured provider the collection has a slot for."""
+    sizes = storage_profiles.vector_sizes(collection_info(collection_name))
+    if "" in sizes:
+        return get_embedding(text, tenant_id)
+    return {
+        p.name: get_embedding(text, tenant_id, p)
+        for p in [embedder, *secondary_embedders] if p.name in sizes
+    }
 
 @mcp.tool()
-async def search_knowledge_base(query: str, tenantId: str, limit: Optional[int] = 5) -> str:
+async def search_knowledge_base(
+    query: str,
+    tenantId: str,
+    limit: Optional[int] = 5,
+    personaId: Optional[str] = None,
+    documents: Optional[List[str]] = None
+) -> str:
     """
     Search a tenant's specific collection for relevant document chunks.
+    Optionally restrict to one persona's uploads and/or specific documents (filename or s3Key).
     """
+    key = (tenantId, normalize_query(query), limit, personaId, tuple(documents or ()))
+    return await search_flight.do(
+        key, lambda: _search_knowledge_base(query, tenantId, limit, personaId, documents)
+    )
+
+async def _search_knowledge_base(
+    query: str,
+    tenantId: str,
+    limit: Optional[int] = 5,
+    personaId: Optional[str] = None,
+    documents: Optional[List[str]] = None
+) -> str:
     try:
-        collection_name = tenantId.replace("-", "_")
-        
-        # 1. Generate Query Vector
-        vector = get_embedding(query)
+        collection_name = collection_for_tenant(tenantId)
+        query_filter = search_filter(tenantId, personaId, documents)
 
-        # 2. Check if collection exists
-        if not qdrant_client.collection_exists(collection_name):
+        # 1. Query vector and collection check are independent; run them together
+        vector, exists = await asyncio.gather(embed_query(query, tenantId), collection_ready(collection_name))
+        if not exists:
             return "Knowledge base for this tenant has not been initialized yet."
 
-        # 3. Search Qdrant
-        search_result = qdrant_client.search(
-            collection_name=collection_name,
-            query_vector=vector,
-            limit=limit,
-            with_payload=True
-        )
+        # 2. Search Qdrant
+        check_deadline("qdrant_search")
+
+        def run_search():
+            sample_query(query, tenantId, personaId)
+            return qdrant_client.query_points(
+                collection_name=collection_name,
+                query=vector,
+                using=vector_name_for(collection_name),
+                query_filter=query_filter,
+                search_params=search_params_for(collection_name, tenantId),
+                limit=limit,
+                with_payload=True,
+                timeout=qdrant_timeout()
+            ).points
+
+        with stage_timer("qdrant_search"):
+            search_result = await asyncio.to_thread(run_search)
 
         formatted_results = []
         for res in search_result:
@@ -74,6 +634,96 @@ async def search_knowledge_base(query: str, tenantId: str, limit: Optional[int]
             formatted_results.append(f"[Score: {res.score:.4f}] {text}")
 
         return "\n\n".join(formatted_results) if formatted_results else "No relevant information found."
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+def sample_query(query: str, tenant_id: str, persona_id: Optional[str]):
+    """Record a fraction of real queries (same fields as examples/queries) until the file is full."""
+    if QUERY_SAMPLE_RATE <= 0 or random.random() >= QUERY_SAMPLE_RATE:
+        return
+    try:
+        if os.path.exists(QUERY_SAMPLE_FILE) and os.path.getsize(QUERY_SAMPLE_FILE) >= QUERY_SAMPLE_MAX_BYTES:
+            return
+        os.makedirs(os.path.dirname(QUERY_SAMPLE_FILE), exist_ok=True)
+        with open(QUERY_SAMPLE_FILE, "a") as f:
+            f.write(json.dumps({"message": query, "tenantId": tenant_id, "personaId": persona_id}) + "\n")
+    except OSError as e:
+        log(f"Could not record query sample: {e}")
+
+def rrf_fuse(result_lists, limit: int, k: int = RRF_K):
+    """Reciprocal Rank Fusion: score(point) = sum over lists of 1 / (k + rank)."""
+    fused = {}
+    for points in result_lists:
+        for rank, point in enumerate(points, start=1):
+            score, _ = fused.get(point.id, (0.0, point))
+            fused[point.id] = (score + 1.0 / (k + rank), point)
+    return sorted(fused.values(), key=lambda item: item[0], reverse=True)[:limit]
+
+@mcp.tool()
+async def search_knowledge_base_batch(
+    queries: List[str],
+    tenantId: str,
+    limit: Optional[int] = 5,
+    fuse: bool = True,
+    personaId: Optional[str] = None,
+    documents: Optional[List[str]] = None
+) -> str:
+    """
+    Search a tenant's collection with several queries (expansions, multi-part questions) at once.
+    One batched embedding call and one Qdrant round trip; results are fused with Reciprocal Rank
+    Fusion, or returned per query when fuse is false. Same persona/document filters as
+    search_knowledge_base.
+    """
+    try:
+        queries = list(dict.fromkeys(q for q in queries if q and q.strip()))
+        if not queries:
+            return "Error: no queries given"
+        if len(queries) > MAX_BATCH_QUERIES:
+            return f"Error: at most {MAX_BATCH_QUERIES} queries per batch"
+
+        collection_name = collection_for_tenant(tenantId)
+        query_filter = search_filter(tenantId, personaId, documents)
+
+        vectors, exists = await asyncio.gather(
+            asyncio.to_thread(get_embeddings, queries, tenantId), collection_ready(collection_name)
+        )
+        if not exists:
+            return "Knowledge base for this tenant has not been initialized yet."
+        check_deadline("qdrant_search")
+
+        def run_batch():
+            using = vector_name_for(collection_name)
+            params = search_params_for(collection_name, tenantId)
+            responses = qdrant_client.query_batch_points(
+                collection_name=collection_name,
+                requests=[
+                    models.QueryRequest(
+                        query=vector, using=using, filter=query_filter, params=params,
+                        limit=limit, with_payload=True,
+                    )
+                    for vector in vectors
+                ],
+                timeout=qdrant_timeout(),
+            )
+            return [response.points for response in responses]
+
+        with stage_timer("qdrant_search"):
+            result_lists = await asyncio.to_thread(run_batch)
+
+        if fuse:
+            fused = rrf_fuse(result_lists, limit)
+            formatted = [f"[RRF: {score:.4f}] {point.payload.get('text', 'No text found')}" for score, point in fused]
+            return "\n\n".join(formatted) if formatted else "No relevant information found."
+
+        sections = []
+        for query, points in zip(queries, result_lists):
+            lines = [f"[Score: {p.score:.4f}] {p.payload.get('text', 'No text found')}" for p in points]
+            sections.append(f"### {query}\n" + ("\n\n".join(lines) if lines else "No relevant information found."))
+        return "\n\n".join(sections)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return f"Error: {str(e)}"
 
@@ -82,41 +732,105 @@ async def generate_twin_response(
     query: str, 
     tenantId: str, 
     system_prompt: str,
-    messages: Optional[List[dict]] = None
+    messages: Optional[List[dict]] = None,
+    personaId: Optional[str] = None
 ) -> str:
     """
     Full RAG Pipeline: Search -> Route -> Generate.
     This replaces the previous N8N workflow.
+    personaId only attributes the turn's token usage to the persona (see /usage).
     """
+    if COALESCE_GENERATE:
+        key = (tenantId, normalize_query(query), hash(system_prompt), json.dumps(messages or [], sort_keys=True))
+        return await generate_flight.do(
+            key, lambda: _generate_twin_response(query, tenantId, system_prompt, messages)
+        )
+    return await _generate_twin_response(query, tenantId, system_prompt, messages)
+
+def compact_history(messages: Optional[List[dict]], turns: int = 5) -> List[dict]:
+    """Last `turns` non-empty turns of the chat history as Bedrock messages."""
+    history = []
+    for msg in (messages or [])[-turns:]:
+        role = "user" if msg.get("role") == "user" else "assistant"
+        content = msg.get("content", "")
+        if content:
+            history.append({"role": role, "content": [{"text": content}]})
+    return history
+
+async def _generate_twin_response(
+    query: str,
+    tenantId: str,
+    system_prompt: str,
+    messages: Optional[List[dict]] = None
+) -> str:
+    deadline = request_deadline(GENERATE_DEADLINE)
     try:
-        # 1. Search Knowledge Base
-        context = await search_knowledge_base(query, tenantId)
-        
+        # 1. Search Knowledge Base (skipped for small talk and rewrites of the previous answer).
+        # The retrieval gate and tabular lookup run concurrently; once the gate sends the turn to
+        # retrieval, the query embedding starts while the tabular lookup is still running.
+        async def decide():
+            decision = await retrieval_decision(query, messages)
+            if decision[0] and PREFETCH_EMBEDDING:
+                prefetch_embedding(search_query_for(query, messages, decision[1]), tenantId)
+            return decision
+
+        async def lookup_table():
+            if not TABULAR_FASTPATH:
+                return None
+            with stage_timer("tabular"):
+                return await asyncio.to_thread(tabular_store.answer, tenantId, query)
+
+        (needs_retrieval, reason), table_hit = await asyncio.gather(decide(), lookup_table())
+        RETRIEVAL_DECISIONS.labels(decision="retrieve" if needs_retrieval else "skip", reason=reason).inc()
+        context = None
+        if needs_retrieval and TABULAR_FASTPATH:
+            if table_hit and table_hit["answer"]:
+                TABULAR_ANSWERS.labels(outcome="direct").inc()
+                log(f"Answered from tabular store ({table_hit['matched']} rows), no LLM call")
+                return table_hit["answer"]
+            if table_hit:
+                TABULAR_ANSWERS.labels(outcome="context").inc()
+                context = f"Matching rows from the tenant's tables:\n{table_hit['rows']}"
+            else:
+                TABULAR_ANSWERS.labels(outcome="miss").inc()
+        # Little time left: answer from less context, with the fast model, and shorter
+        degraded = deadline.remaining() < DEGRADE_BELOW
+        if degraded:
+            log(f"Degrading turn: {deadline.remaining():.1f}s left")
+        if needs_retrieval and context is None:
+            check_deadline("retrieval")
+            if degraded:
+                DEGRADED_TURNS.labels(action="small_context").inc()
+            context = await search_knowledge_base(
+                search_query_for(query, messages, reason), tenantId, DEGRADED_SEARCH_LIMIT if degraded else 5
+            )
+
         # 2. Intelligent Model selection (Router)
-        # Fast: Claude 3.5 Haiku, Smart: Claude 3.5 Sonnet
-        selected_model = "anthropic.claude-3-5-haiku-20241022-v1:0"
-        
+        selected_model = FAST_MODEL
+
         q = query.lower()
         complex_keywords = ['compare', 'difference', 'calculate', 'optimize', 'why', 'explain']
-        if any(k in q for k in complex_keywords) or len(q.split()) > 20:
-            selected_model = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+        wants_smart = needs_retrieval and (any(k in q for k in complex_keywords) or len(q.split()) > 20)
+        if wants_smart and degraded:
+            DEGRADED_TURNS.labels(action="fast_model").inc()
+            log(f"Routing to Fast Model: {selected_model} (deadline)")
+        elif wants_smart:
+            selected_model = SMART_MODEL
             # Claude 3.5 Sonnet works best with a Chain of Thought instruction for complex queries
             system_prompt += "\n\nFor complex queries, please reason through the knowledge context step-by-step before providing your final answer to ensure maximum accuracy."
-            print(f"Routing to Smart Model: {selected_model}")
+            log(f"Routing to Smart Model: {selected_model}")
         else:
-            print(f"Routing to Fast Model: {selected_model}")
+            log(f"Routing to Fast Model: {selected_model} (retrieval: {reason})")
 
         # 3. Prepare Bedrock Call
-        bedrock_messages = []
-        if messages:
-            for msg in messages[-5:]: # Last 5 for context
-                role = "user" if msg.get("role") == "user" else "assistant"
-                content = msg.get("content", "")
-                if content:
-                    bedrock_messages.append({"role": role, "content": [{"text": content}]})
-        
+        prompt_start = time.perf_counter()
+        bedrock_messages = compact_history(messages, 2 if degraded else 5)
+
         # Add current query with context formatted for better model comprehension
-        rag_prompt = f"""<knowledge_context>
+        if context is None:
+            rag_prompt = query
+        else:
+            rag_prompt = f"""<knowledge_context>
 {context}
 </knowledge_context>
 
@@ -124,23 +838,22 @@ Based on the knowledge context provided above, please answer the following user
 
 User Query: {query}"""
         bedrock_messages.append({"role": "user", "content": [{"text": rag_prompt}]})
+        STAGE_LATENCY.labels(stage="prompt_assembly").observe(time.perf_counter() - prompt_start)
 
         # 4. Invoke Bedrock
-        response = bedrock_client.invoke_model(
-            modelId=selected_model,
-            body=json.dumps({
+        check_deadline("llm")
+        with stage_timer("llm"):
+            answer = await asyncio.to_thread(generate_with_fallback, selected_model, {
                 "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 2048,
+                "max_tokens": 1024 if degraded else 2048,
                 "system": system_prompt,
                 "messages": bedrock_messages,
                 "temperature": 0.7
-            })
-        )
-        
-        response_body = json.loads(response.get("body").read())
-        answer = response_body["content"][0]["text"]
+            }, tenantId, deadline)
         return answer
 
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return f"MCP Error generating response: {str(e)}"
 
@@ -150,13 +863,14 @@ async def ingest_knowledge(text: str, tenantId: str, metadata: Optional[dict] =
     Ingest information into a tenant's private collection.
     """
     try:
-        collection_name = tenantId.replace("-", "_")
-        ensure_collection(collection_name)
-        vector = get_embedding(text)
-        payload = {"text": text, "tenantId": tenantId, **(metadata or {})}
+        collection_name = collection_for_tenant(tenantId)
+        await asyncio.to_thread(ensure_collection, collection_name)
+        vector = await asyncio.to_thread(point_vectors, collection_name, text, tenantId)
+        # tenantId goes last so metadata can never move a point into another tenant
+        payload = {"text": text, **(metadata or {}), TENANT_KEY: tenantId}
         
-        import uuid
-        qdrant_client.upsert(
+        await asyncio.to_thread(
+            qdrant_client.upsert,
             collection_name=collection_name,
             points=[models.PointStruct(id=str(uuid.uuid4()), vector=vector, payload=payload)]
         )
@@ -164,31 +878,365 @@ async def ingest_knowledge(text: str, tenantId: str, metadata: Optional[dict] =
     except Exception as e:
         return f"Error ingesting knowledge: {str(e)}"
 
+@mcp.tool()
+async def ingest_document(
+    text: str,
+    tenantId: str,
+    s3Key: str,
+    version: Optional[str] = None,
+    metadata: Optional[dict] = None
+) -> str:
+    """
+    Ingest (or re-ingest) a whole S3 document: chunk it, write the chunks tagged with the
+    object version, then delete chunks from any previous version in one filtered call.
+    """
+    try:
+        collection_name = collection_for_tenant(tenantId)
+        version = version or uuid.uuid4().hex
+        chunks = chunk_text(text)
+        await asyncio.to_thread(ensure_collection, collection_name)
+
+        if chunks:
+            vectors = await asyncio.to_thread(chunk_vectors, collection_name, chunks, tenantId)
+            base = {**(metadata or {}), S3_KEY: s3Key, VERSION_KEY: version, TENANT_KEY: tenantId}
+            points = [
+                models.PointStruct(
+                    # Deterministic ids: a retried event for the same version overwrites instead of duplicating
+                    id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{tenantId}/{s3Key}/{version}/{index}")),
+                    vector=vector,
+                    payload={"text": chunk, "chunk": index, **base},
+                )
+                for index, (chunk, vector) in enumerate(zip(chunks, vectors))
+            ]
+            check_deadline("upsert")
+            await asyncio.to_thread(qdrant_client.upsert, collection_name=collection_name, points=points, wait=True)
+
+        # New chunks are live before the old ones go, so search never sees the document missing
+        replaced = await asyncio.to_thread(
+            delete_source_points, collection_name, source_filter(tenantId, s3Key, keep_version=version)
+        )
+        rows = 0
+        if TABULAR_FASTPATH:
+            filename = (metadata or {}).get(FILENAME_KEY, "")
+            try:
+                rows = await asyncio.to_thread(tabular_store.load, tenantId, s3Key, text, filename, version)
+            except Exception as e:
+                # The vectors are written; questions fall back to search instead of an older table
+                log(f"Tabular load of {s3Key} for {tenantId} failed: {e}")
+                try:
+                    await asyncio.to_thread(tabular_store.drop, tenantId, s3Key)
+                except Exception as e:
+                    log(f"Dropping the tabular rows of {s3Key} for {tenantId} failed: {e}")
+        log(f"Ingested {s3Key} for {tenantId}: {len(chunks)} chunks, {replaced} old chunks removed, {rows} table rows")
+        return f"Successfully ingested {s3Key} for {tenantId}: {len(chunks)} chunks ({replaced} replaced)."
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return f"Error ingesting document: {str(e)}"
+
+@mcp.tool()
+async def delete_document(tenantId: str, s3Key: str) -> str:
+    """
+    Remove every chunk of an S3 document from a tenant's knowledge base.
+    """
+    try:
+        collection_name = collection_for_tenant(tenantId)
+        await asyncio.to_thread(tabular_store.drop, tenantId, s3Key)
+        if not await asyncio.to_thread(qdrant_client.collection_exists, collection_name):
+            return f"Deleted 0 chunks of {s3Key} for {tenantId}."
+        deleted = await asyncio.to_thread(delete_source_points, collection_name, source_filter(tenantId, s3Key))
+        log(f"Deleted {s3Key} for {tenantId}: {deleted} chunks")
+        return f"Deleted {deleted} chunks of {s3Key} for {tenantId}."
+    except Exception as e:
+        return f"Error deleting document: {str(e)}"
+
+# Startup warmup (see warmup.py)
+_warm_collections = []
+_warm_vectors = {}
+
+def warm_credentials() -> str:
+    """Resolve the AWS credential chain (ECS task role fetch) and build the Bedrock client."""
+    credentials = boto_session.get_credentials()
+    if isinstance(bedrock_client, LazyClient):
+        bedrock_client.get()
+    if credentials is None:
+        return "no credentials"
+    credentials.get_frozen_credentials()
+    return credentials.method
+
+def warm_collections() -> str:
+    """Open the Qdrant connection and cache metadata (profile, vectors) for the tenant collections."""
+    names = tenant_collections()
+    if TENANCY_MODE == "shared":
+        names = [n for n in names if n == SHARED_COLLECTION]
+    _warm_collections[:] = names[:WARMUP_MAX_COLLECTIONS]
+    for name in _warm_collections:
+        collection_info(name)
+    return f"{len(_warm_collections)} of {len(names)} collections"
+
+def warm_embeddings() -> str:
+    """Load embedding models / open Bedrock connections by embedding the warm query set."""
+    queries = WARMUP_QUERIES or ["warmup"]
+    for provider in [embedder, *secondary_embedders]:
+        _warm_vectors.setdefault(provider.name, get_embeddings(queries, "warmup", provider)[0])
+    return f"{len(queries)} queries x {1 + len(secondary_embedders)} providers"
+
+def warm_segments() -> str:
+    """One limit=1 search per collection so Qdrant pages in its index and vector segments."""
+    touched = 0
+    for name in _warm_collections:
+        vector = _warm_vectors.get(embedder.name)
+        if vector is None:
+            qdrant_client.scroll(collection_name=name, limit=1, with_payload=False, with_vectors=False)
+        else:
+            qdrant_client.query_points(
+                collection_name=name, query=vector, using=vector_name_for(name), limit=1,
+                search_params=search_params_for(name), with_payload=False,
+            )
+        touched += 1
+    return f"{touched} collections"
+
+def warm_retrieval_gate() -> str:
+    if retrieval_gate:
+        retrieval_gate.warm()
+    return "ok"
+
+warmup = Warmup([
+    ("credentials", warm_credentials, False),
+    ("collections", warm_collections, True),
+    ("embeddings", warm_embeddings, False),
+    ("segments", warm_segments, False),
+    ("retrieval_gate", warm_retrieval_gate, False),
+], retry_seconds=WARMUP_RETRY_SECONDS)
+
 # Simple HTTP Bridge for the Pipeline
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 from starlette.requests import Request
 
-@mcp.app.route("/call/{tool_name}", methods=["POST"])
+# Tool -> (function, admission priority); chat and search are served ahead of ingestion
+BRIDGE_TOOLS = {
+    "generate_twin_response": (generate_twin_response, INTERACTIVE),
+    "search_knowledge_base": (search_knowledge_base, INTERACTIVE),
+    "search_knowledge_base_batch": (search_knowledge_base_batch, INTERACTIVE),
+    "ingest_knowledge": (ingest_knowledge, BULK),
+    "ingest_document": (ingest_document, BULK),
+    "delete_document": (delete_document, BULK),
+}
+
+admission = AdmissionController()
+_executor_loop = None
+
+def ensure_executor():
+    """Size the loop's default executor (used by asyncio.to_thread) above the admission limit.
+
+    Otherwise admitted calls queue FIFO for one of its min(32, CPUs + 4) threads, and a bulk
+    flood would still starve chat there instead of in the fair queue.
+    """
+    global _executor_loop
+    loop = asyncio.get_running_loop()
+    if _executor_loop is not loop:
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=admission.max_concurrent + 8))
+        _executor_loop = loop
+
+def admission_cost(tool_name: str, arguments: dict) -> float:
+    """Work units: one per query, one per CHUNK_SIZE characters ingested."""
+    if tool_name == "search_knowledge_base_batch":
+        return max(1, len(arguments.get("queries") or []))
+    if tool_name in ("ingest_knowledge", "ingest_document"):
+        return max(1, len(arguments.get("text") or "") / CHUNK_SIZE)
+    return 1
+
+class ClientDisconnected(Exception):
+    """The bridge caller went away before the tool finished."""
+
+def bridge_deadline(request: Request) -> Deadline:
+    """Request deadline from X-Deadline-Ms (milliseconds left when the caller sent it)."""
+    try:
+        return Deadline(float(request.headers[DEADLINE_HEADER]) / 1000)
+    except (KeyError, ValueError):
+        return Deadline(REQUEST_DEADLINE)
+
+async def run_until_done(request: Request, coro, deadline: Deadline):
+    """Await coro; cancel it when the deadline passes or the client disconnects.
+
+    Cancelling the deadline as well reaches work already handed to worker threads: model
+    calls check it, and a streaming generation closes its Bedrock stream.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=min(DISCONNECT_POLL_SECONDS, deadline.remaining()))
+            if done:
+                return task.result()
+            if deadline.expired:
+                raise DeadlineExceeded("request deadline passed")
+            if await request.is_disconnected():
+                raise ClientDisconnected()
+    except BaseException:
+        deadline.cancel()
+        task.cancel()
+        raise
+
+@mcp.custom_route("/call/{tool_name}", methods=["POST"])
 async def call_tool_bridge(request: Request):
     tool_name = request.path_params["tool_name"]
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    headers = {REQUEST_ID_HEADER: request_id}
+    spans = []
+    timeline_var.set(spans)
+    deadline = bridge_deadline(request)
+    if DEADLINE_PROPAGATION:
+        deadline_var.set(deadline)
+    metric_tool = tool_name
+    start = time.perf_counter()
     try:
         arguments = await request.json()
-        if tool_name == "generate_twin_response":
-            result = await generate_twin_response(**arguments)
-        elif tool_name == "search_knowledge_base":
-            result = await search_knowledge_base(**arguments)
-        elif tool_name == "ingest_knowledge":
-            result = await ingest_knowledge(**arguments)
+        if tool_name not in BRIDGE_TOOLS:
+            metric_tool = "unknown"
+            TOOL_CALLS.labels(tool=metric_tool, status="not_found").inc()
+            return JSONResponse({"error": f"Tool {tool_name} not found in bridge"}, status_code=404, headers=headers)
+
+        tool, priority = BRIDGE_TOOLS[tool_name]
+        persona = arguments.get("personaId") or (arguments.get("metadata") or {}).get("personaId")
+
+        async def run():
+            with usage_store.scope(tool_name, persona):
+                if ADMISSION:
+                    ensure_executor()
+                    tenant = str(arguments.get("tenantId") or "unknown")
+                    async with admission.admit(tenant, priority, admission_cost(tool_name, arguments)):
+                        return await tool(**arguments)
+                return await tool(**arguments)
+
+        if DEADLINE_PROPAGATION:
+            result = await run_until_done(request, run(), deadline)
         else:
-            return JSONResponse({"error": f"Tool {tool_name} not found in bridge"}, status_code=404)
-        
-        return JSONResponse({"content": result})
+            result = await run()
+
+        TOOL_CALLS.labels(tool=tool_name, status="ok").inc()
+        return JSONResponse({"content": result}, headers={**headers, "Server-Timing": server_timing(spans)})
+    except Rejected as e:
+        TOOL_CALLS.labels(tool=tool_name, status="rejected").inc()
+        log(f"{tool_name} rejected: {e}")
+        return JSONResponse(
+            {"error": f"Server busy ({e.reason}), retry later"},
+            status_code=429,
+            headers={**headers, "Retry-After": retry_after_header(e.retry_after)},
+        )
+    except DeadlineExceeded as e:
+        TOOL_CALLS.labels(tool=tool_name, status="deadline").inc()
+        log(f"{tool_name} cancelled: {e}")
+        return JSONResponse({"error": f"Deadline exceeded: {e}"}, status_code=504, headers=headers)
+    except ClientDisconnected:
+        TOOL_CALLS.labels(tool=tool_name, status="cancelled").inc()
+        log(f"{tool_name} cancelled: client disconnected")
+        # Nobody is listening; 499 is the conventional "client closed request" status
+        return JSONResponse({"error": "Client disconnected"}, status_code=499, headers=headers)
+    except asyncio.CancelledError:
+        TOOL_CALLS.labels(tool=tool_name, status="cancelled").inc()
+        log(f"{tool_name} cancelled by the server")
+        raise
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        TOOL_CALLS.labels(tool=tool_name, status="error").inc()
+        return JSONResponse({"error": str(e)}, status_code=500, headers=headers)
+    finally:
+        elapsed = time.perf_counter() - start
+        TOOL_LATENCY.labels(tool=metric_tool).observe(elapsed)
+        log(f"{tool_name} finished in {elapsed * 1000:.0f}ms")
+        if spans:
+            log(f"{tool_name} timeline: {format_timeline(start, spans)}")
+
+@mcp.custom_route("/prefetch", methods=["POST"])
+async def prefetch_endpoint(request: Request):
+    """Start embedding a query before its tool call arrives.
+
+    The chat pipeline posts the user message (and the history, for the retrieval gate) here
+    while it is still resolving the user and tenant; the generate_twin_response that follows
+    finds the vector in flight or cached. Turns the gate skips are not embedded.
+    """
+    request_id_var.set(request.headers.get(REQUEST_ID_HEADER) or "-")
+    arguments = await request.json()
+    query = arguments.get("query")
+    if PREFETCH_EMBEDDING and query:
+        prefetch_embedding(query, arguments.get("tenantId") or "unknown", arguments.get("messages"), gated=True)
+    return JSONResponse({"status": "accepted"}, status_code=202)
+
+@mcp.custom_route("/stats", methods=["GET"])
+async def stats_endpoint(request: Request):
+    return JSONResponse({
+        "singleflight": {
+            flight.kind: flight.stats() for flight in (embedding_flight, search_flight, generate_flight)
+        },
+        "admission": admission.stats(),
+        "query_vector_cache": query_vectors.stats(),
+    })
+
+def parse_time(value: Optional[str], default: float) -> float:
+    """Epoch seconds from "", an epoch number, an ISO timestamp, or an age like "30m", "24h", "7d"."""
+    if not value:
+        return default
+    units = {"m": 60, "h": 3600, "d": 86400}
+    if value[-1] in units and value[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+@mcp.custom_route("/usage", methods=["GET"])
+async def usage_endpoint(request: Request):
+    """Token, latency and cost aggregates per tenant over a time window.
+
+    Query parameters: since/until (default last 24h), tenant, group_by (comma-separated
+    tenant,persona,tool,kind,model), bucket (hour/day) and top (most expensive requests).
+    """
+    params = request.query_params
+    try:
+        until = parse_time(params.get("until"), time.time())
+        since = parse_time(params.get("since"), until - 86400)
+        tenant = params.get("tenant") or None
+        group_by = [c for c in params.get("group_by", "tenant").split(",") if c]
+        rows = await asyncio.to_thread(usage_store.summary, since, until, tenant, group_by, params.get("bucket"))
+        top = await asyncio.to_thread(usage_store.top_requests, since, until, tenant, int(params.get("top", "10")))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return JSONResponse({
+        "since": since, "until": until, "tenant": tenant, "group_by": group_by,
+        "rows": rows, "top_requests": top,
+    })
+
+@mcp.custom_route("/health", methods=["GET"])
+async def health_endpoint(request: Request):
+    """Readiness: 200 once warmup has finished, 503 while it is still running."""
+    clients = {"qdrant": qdrant_client, "bedrock": bedrock_client, "embedder": embedder}
+    return JSONResponse({
+        "status": "ready" if warmup.ready else "warming",
+        "import_ms": round(IMPORT_SECONDS * 1000, 1),
+        "warmup": warmup.report(),
+        "clients_built_ms": {
+            name: client.build_ms for name, client in clients.items() if isinstance(client, LazyClient)
+        },
+    }, status_code=200 if warmup.ready else 503)
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request):
+    body, content_type = render_latest()
+    return Response(body, media_type=content_type)
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+STARTUP_SECONDS.labels(phase="import").set(IMPORT_SECONDS)
 
 if __name__ == "__main__":
+    log(f"Imported in {IMPORT_SECONDS * 1000:.0f}ms")
+    if WARMUP:
+        warmup.start()
+    else:
+        warmup.mark_ready()
     transport = os.getenv("MCP_TRANSPORT", "stdio")
     if transport == "sse":
-        mcp.run(transport="sse", host="0.0.0.0", port=8080)
+        mcp.settings.host = "0.0.0.0"
+        mcp.settings.port = 8080
+        mcp.run(transport="sse")
     else:
         mcp.run(transport="stdio")
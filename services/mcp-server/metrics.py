@@ -0,0 +1,168 @@
+"""
+Prometheus metrics and request-id tracing for the MCP server.
+
+Stage timings are recorded per stage (not per tenant) to keep label
+cardinality bounded; token counters and admission queue metrics are the
+only per-tenant series.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Request id of the chat turn being served (set by the HTTP bridge)
+request_id_var = contextvars.ContextVar("request_id", default="-")
+# (stage, start, end) spans of the call being served, for its timeline (set by the HTTP bridge)
+timeline_var = contextvars.ContextVar("timeline", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_LATENCY = Histogram(
+    "mcp_stage_duration_seconds",
+    "Time spent in each RAG pipeline stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "mcp_llm_time_to_first_token_seconds",
+    "Time from Bedrock invocation to the first streamed token",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_DURATION = Histogram(
+    "mcp_llm_duration_seconds",
+    "Total Bedrock generation time",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+TOKENS = Counter(
+    "mcp_tokens_total",
+    "Tokens consumed per model and tenant",
+    ["model", "tenant", "direction"],
+)
+RETRIEVAL_DECISIONS = Counter(
+    "mcp_retrieval_gate_total",
+    "Retrieval gate decisions per chat turn",
+    ["decision", "reason"],
+)
+COALESCED_CALLS = Counter(
+    "mcp_singleflight_total",
+    "Embedding/search/generation calls executed vs coalesced onto an in-flight call",
+    ["kind", "result"],
+)
+STARTUP_SECONDS = Gauge(
+    "mcp_startup_seconds",
+    "Process startup cost: import, lazy client builds and each warmup step",
+    ["phase"],
+)
+TABULAR_ANSWERS = Counter(
+    "mcp_tabular_answers_total",
+    "Tabular fast-path outcomes: answered directly, matched rows used as context, or no match",
+    ["outcome"],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "mcp_admission_queue_depth",
+    "Bridge calls waiting for an admission slot",
+    ["tenant", "priority"],
+)
+ADMISSION_WAIT = Histogram(
+    "mcp_admission_wait_seconds",
+    "Time bridge calls spent queued before admission (or rejection)",
+    ["tenant", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "mcp_admission_rejected_total",
+    "Bridge calls answered 429: rate limit, full queue or queue timeout",
+    ["tenant", "priority", "reason"],
+)
+BEDROCK_RETRIES = Counter(
+    "mcp_model_retries_total",
+    "Embedding/LLM calls retried after a throttle, 5xx or timeout",
+    ["kind", "reason"],
+)
+HEDGED_REQUESTS = Counter(
+    "mcp_hedged_requests_total",
+    "Hedged embedding requests sent, and how often the hedge answered first",
+    ["kind", "result"],
+)
+MODEL_FALLBACKS = Counter(
+    "mcp_model_fallbacks_total",
+    "Generations moved to the next model in the fallback chain",
+    ["from_model", "to_model", "reason"],
+)
+DEGRADED_TURNS = Counter(
+    "mcp_degraded_turns_total",
+    "Chat turns degraded because little of the request deadline was left",
+    ["action"],
+)
+TOOL_CALLS = Counter(
+    "mcp_tool_calls_total",
+    "Tool calls received through the HTTP bridge",
+    ["tool", "status"],
+)
+TOOL_LATENCY = Histogram(
+    "mcp_tool_duration_seconds",
+    "End-to-end tool latency through the HTTP bridge",
+    ["tool"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Record the duration of a pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        STAGE_LATENCY.labels(stage=stage).observe(end - start)
+        spans = timeline_var.get()
+        if spans is not None:
+            spans.append((stage, start, end))
+
+
+def format_timeline(started: float, spans: list) -> str:
+    """Stages as +offset/duration from the call start, with how much of their time overlapped.
+
+    busy is the sum of stage durations, critical the wall time covered by at least one stage.
+    """
+    spans = sorted(spans, key=lambda span: span[1])
+    busy = sum(end - start for _, start, end in spans)
+    critical, covered_until = 0.0, None
+    for _, start, end in spans:
+        if covered_until is None or start >= covered_until:
+            critical += end - start
+            covered_until = end
+        elif end > covered_until:
+            critical += end - covered_until
+            covered_until = end
+    stages = " ".join(f"{name}+{(start - started) * 1000:.0f}/{(end - start) * 1000:.0f}ms" for name, start, end in spans)
+    return f"{stages} | busy={busy * 1000:.0f}ms critical={critical * 1000:.0f}ms overlap={(busy - critical) * 1000:.0f}ms"
+
+
+def server_timing(spans: list) -> str:
+    """Server-Timing header value (durations in ms) for the recorded stages."""
+    return ", ".join(f"{name};dur={(end - start) * 1000:.1f}" for name, start, end in spans)
+
+
+def record_tokens(model: str, tenant_id: str, input_tokens: int = 0, output_tokens: int = 0):
+    if input_tokens:
+        TOKENS.labels(model=model, tenant=tenant_id, direction="input").inc(input_tokens)
+    if output_tokens:
+        TOKENS.labels(model=model, tenant=tenant_id, direction="output").inc(output_tokens)
+
+
+def log(message: str):
+    """Print with the current request id so a chat turn can be traced across services."""
+    print(f"[req={request_id_var.get()}] {message}")
+
+
+def render_latest():
+    """Return (body, content_type) for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
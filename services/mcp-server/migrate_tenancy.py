@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Migrate per-tenant Qdrant collections into the shared tenancy collection.
+
+Copies points (vectors + payload) from each per-tenant collection into
+QDRANT_COLLECTION, stamping the tenantId payload key that shared mode
+filters on. Point ids are preserved, so re-running the migration is
+idempotent and an interrupted run can simply be started again.
+
+Usage:
+  python migrate_tenancy.py --dry-run
+  python migrate_tenancy.py tenant_acme tenant_globex
+  python migrate_tenancy.py --all --delete-source
+
+After migrating, run the MCP server with TENANCY_MODE=shared.
+"""
+
+import argparse
+import sys
+
+from qdrant_client.http import models
+
+import main
+import storage_profiles
+
+
+def source_collections(args):
+    if args.collections:
+        return args.collections
+    return [n for n in main.tenant_collections() if n != main.SHARED_COLLECTION]
+
+
+def check_vector_size(collection_name):
+    """Return the collection's vector name -> size map."""
+    return storage_profiles.vector_sizes(main.qdrant_client.get_collection(collection_name))
+
+
+def legacy_vector_target(source_sizes, target_sizes):
+    """Named vector to move a legacy unnamed vector into, if the sizes line up."""
+    if list(source_sizes) != [""]:
+        return None
+    name = main.embedder.name
+    return name if target_sizes.get(name) == source_sizes[""] else None
+
+
+def migrate_collection(collection_name, batch_size, dry_run, rename_vector=None):
+    """Copy one per-tenant collection into the shared collection. Returns points copied."""
+    copied = 0
+    offset = None
+    fallback_tenant = collection_name.replace("_", "-")
+    while True:
+        points, offset = main.qdrant_client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if not points:
+            break
+
+        batch = []
+        for point in points:
+            payload = dict(point.payload or {})
+            payload.setdefault(main.TENANT_KEY, fallback_tenant)
+            vector = {rename_vector: point.vector} if rename_vector else point.vector
+            batch.append(models.PointStruct(id=point.id, vector=vector, payload=payload))
+
+        if not dry_run:
+            main.qdrant_client.upsert(collection_name=main.SHARED_COLLECTION, points=batch, wait=True)
+        copied += len(batch)
+        print(f"   {collection_name}: {copied} points", end="\r")
+
+        if offset is None:
+            break
+    print()
+    return copied
+
+
+def verify(collection_name):
+    """Compare the source count with the shared count for every tenant found in the source."""
+    tenants = set()
+    offset = None
+    while True:
+        points, offset = main.qdrant_client.scroll(
+            collection_name=collection_name, limit=1000, offset=offset,
+            with_payload=[main.TENANT_KEY], with_vectors=False,
+        )
+        tenants.update((p.payload or {}).get(main.TENANT_KEY, collection_name.replace("_", "-")) for p in points)
+        if offset is None:
+            break
+
+    source_count = main.qdrant_client.count(collection_name, exact=True).count
+    target_count = sum(
+        main.qdrant_client.count(main.SHARED_COLLECTION, count_filter=main.tenant_filter(t), exact=True).count
+        for t in tenants
+    )
+    return source_count, target_count
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Move per-tenant collections into the shared collection")
+    parser.add_argument("collections", nargs="*", help="Source collections (default: all except the shared one)")
+    parser.add_argument("--all", action="store_true", help="Migrate every collection except the shared one")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--dry-run", action="store_true", help="Scroll sources without writing")
+    parser.add_argument("--delete-source", action="store_true", help="Drop each source after a verified copy")
+    args = parser.parse_args()
+
+    if not args.collections and not args.all:
+        parser.error("name the collections to migrate or pass --all")
+
+    # Shared-mode helpers (tenant_filter, ensure_collection) must behave as in shared mode
+    main.TENANCY_MODE = "shared"
+    collections = source_collections(args)
+    print(f"Migrating {len(collections)} collection(s) into '{main.SHARED_COLLECTION}'")
+
+    if not args.dry_run:
+        main.ensure_collection(main.SHARED_COLLECTION)
+    target_size = check_vector_size(main.SHARED_COLLECTION) if not args.dry_run else main.collection_vectors()
+
+    failures = 0
+    for name in collections:
+        source_size = check_vector_size(name)
+        rename_vector = legacy_vector_target(source_size, target_size)
+        if source_size != target_size and not rename_vector:
+            print(f"❌ {name}: vectors {source_size} do not match shared collection ({target_size}), skipping")
+            failures += 1
+            continue
+
+        copied = migrate_collection(name, args.batch_size, args.dry_run, rename_vector)
+        if args.dry_run:
+            print(f"✅ {name}: {copied} points would be copied")
+            continue
+
+        source_count, target_count = verify(name)
+        if target_count < source_count:
+            print(f"❌ {name}: only {target_count}/{source_count} points found in shared collection")
+            failures += 1
+            continue
+
+        print(f"✅ {name}: {source_count} points migrated")
+        if args.delete_source:
+            main.qdrant_client.delete_collection(main.resolve_collection(name))
+            print(f"   dropped {name}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
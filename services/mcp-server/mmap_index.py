@@ -0,0 +1,863 @@
+"""
+Embedded vector index for small deployments (VECTOR_BACKEND=mmap).
+
+Stands in for the Qdrant client inside the MCP server: main.py and the
+maintenance scripts call the same methods (create_collection, upsert,
+query_points, scroll, count, delete, aliases, ...) and get the same
+qdrant_client model objects back, so search_knowledge_base, ingest_knowledge
+and the rest work unchanged without a Qdrant container.
+
+One directory per collection under VECTOR_STORE_DIR:
+
+  meta.json      - named vectors (size, distance) and payload indexes
+  <n>.f16        - one float16 matrix per named vector (rows x size), memory
+                   mapped; cosine vectors are normalized on write so a search
+                   is one matrix-vector product over the matching rows
+  payloads.bin   - payload JSON, appended; read only for returned points
+  rows.jsonl     - append-only row log: point id, payload location, vectors
+                   present and the payload's short scalar fields (tenant,
+                   persona, s3Key, version); deletes are logged as tombstones.
+                   Replayed at open into id -> row and per-field code arrays
+                   that filters are evaluated against with NumPy
+
+Upserting an existing id tombstones its old row; once dead rows outnumber live
+ones the collection is rewritten. Writes go to the page cache, so they survive
+a process crash but not a host crash (snapshots are not supported; back up the
+directory or rebuild from S3 with reconcile_s3.py).
+
+Filters support must/should/must_not, MatchValue, MatchAny, MatchExcept,
+IsEmpty, IsNull, HasId and HasVector, which is everything the server builds.
+Any other condition (ranges, full-text, geo, nested) is rejected with a
+ValueError before the call touches the collection. Snapshot calls raise
+RuntimeError; snapshots.py checks VECTOR_BACKEND before making them.
+"""
+
+import json
+import os
+import shutil
+import threading
+import uuid
+from array import array
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+from qdrant_client.http import models
+
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "/app/data/vectors")
+# Rows scored per block: bounds the float32 scratch copy of the float16 matrix
+SEARCH_BLOCK_BYTES = int(os.getenv("MMAP_SEARCH_BLOCK_MB", "8")) * 1024 * 1024
+# float32 copies of recently searched matrices kept in RAM (0 = always score from the files)
+CACHE_BYTES = int(os.getenv("MMAP_CACHE_MB", "64")) * 1024 * 1024
+# Payload values longer than this (chunk text) aren't kept in memory for filtering
+MAX_FILTER_VALUE_CHARS = 256
+MIN_CAPACITY = 1024
+COMPACT_MIN_DEAD = 1000
+
+COMPLETED = models.UpdateResult(operation_id=0, status=models.UpdateStatus.COMPLETED)
+
+
+def normalize_id(point_id):
+    """Qdrant ids are unsigned ints or UUIDs (returned in canonical form)."""
+    if isinstance(point_id, (int, np.integer)) and not isinstance(point_id, bool):
+        return int(point_id)
+    return str(uuid.UUID(str(point_id)))
+
+
+def id_key(point_id):
+    """Scroll order: integer ids first, then UUIDs, as Qdrant does."""
+    return (0, point_id, "") if isinstance(point_id, int) else (1, 0, point_id)
+
+
+def grow_mask(mask: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.zeros(capacity, dtype=bool)
+    grown[:len(mask)] = mask
+    return grown
+
+
+def unsupported_condition(query_filter):
+    """The first condition in a Filter the mmap backend can't evaluate, or None."""
+    if query_filter is None:
+        return None
+    for condition in [*(query_filter.must or []), *(query_filter.should or []), *(query_filter.must_not or [])]:
+        if isinstance(condition, models.Filter):
+            nested = unsupported_condition(condition)
+            if nested is not None:
+                return nested
+        elif isinstance(condition, models.FieldCondition):
+            if not isinstance(condition.match, (models.MatchValue, models.MatchAny, models.MatchExcept)) \
+                    or any(getattr(condition, field, None) is not None
+                           for field in ("range", "geo_bounding_box", "geo_radius", "geo_polygon", "values_count")):
+                return condition
+        elif not isinstance(condition, (models.HasIdCondition, models.HasVectorCondition,
+                                        models.IsEmptyCondition, models.IsNullCondition)):
+            return condition
+    return None
+
+
+def unsupported_filter(condition) -> ValueError:
+    return ValueError(
+        f"mmap vector backend can't evaluate filter condition {condition!r}: it supports "
+        "must/should/must_not with MatchValue, MatchAny, MatchExcept, IsEmpty, IsNull, HasId and "
+        "HasVector; use VECTOR_BACKEND=qdrant for other filters"
+    )
+
+
+def check_filter(query_filter):
+    """Reject a Filter the mmap backend can't evaluate before any work is done."""
+    condition = unsupported_condition(query_filter)
+    if condition is not None:
+        raise unsupported_filter(condition)
+
+
+def filterable(value) -> bool:
+    if isinstance(value, str):
+        return len(value) <= MAX_FILTER_VALUE_CHARS
+    return value is None or isinstance(value, (bool, int, float))
+
+
+class Column:
+    """One payload field as int codes per row; lists are matched per element.
+
+    -1 is missing or an empty list, -2 a non-empty list, -4 an explicit null
+    (IsNull matches only that, as in Qdrant; IsEmpty matches all three).
+    """
+
+    NULL = -4
+
+    def __init__(self):
+        self.codes = array("i")
+        self.values = {}
+        self.lists = {}
+
+    def code(self, value) -> int:
+        if value is None:
+            return self.NULL
+        key = (type(value).__name__, value)
+        if key not in self.values:
+            self.values[key] = len(self.values)
+        return self.values[key]
+
+    def append(self, row: int, value):
+        if row > len(self.codes):
+            self.codes.extend([-1] * (row - len(self.codes)))
+        if isinstance(value, list):
+            self.lists[row] = {self.code(v) for v in value if filterable(v)}
+            self.codes.append(-2 if value else -1)
+        else:
+            self.codes.append(self.code(value))
+
+    def lookup(self, value) -> int:
+        return self.values.get((type(value).__name__, value), -3)
+
+    def mask(self, n: int, values) -> np.ndarray:
+        """Rows whose value (or any list element) is one of `values`."""
+        codes = np.frombuffer(self.codes, dtype=np.int32)[:n]
+        if len(codes) < n:
+            codes = np.concatenate([codes, np.full(n - len(codes), -1, dtype=np.int32)])
+        wanted = [self.lookup(v) for v in values]
+        mask = np.isin(codes, wanted)
+        wanted = set(wanted)
+        for row, members in self.lists.items():
+            if row < n and members & wanted:
+                mask[row] = True
+        return mask
+
+    def empty(self, n: int) -> np.ndarray:
+        codes = np.frombuffer(self.codes, dtype=np.int32)[:n]
+        mask = np.ones(n, dtype=bool)
+        mask[:len(codes)] = (codes == -1) | (codes == self.NULL)
+        return mask
+
+    def null(self, n: int) -> np.ndarray:
+        codes = np.frombuffer(self.codes, dtype=np.int32)[:n]
+        mask = np.zeros(n, dtype=bool)
+        mask[:len(codes)] = codes == self.NULL
+        return mask
+
+
+class RamCache:
+    """float32 copies of recently searched vector matrices, least recently used evicted past the budget.
+
+    Scoring float16 rows is dominated by the float16 -> float32 conversion; with a cached
+    copy a hot collection's search is one BLAS matrix-vector product. Rows are only ever
+    appended, so a cached copy is extended rather than rebuilt after an upsert.
+    """
+
+    def __init__(self, budget_bytes: int = CACHE_BYTES):
+        self.budget = budget_bytes
+        self.used = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            matrix = self._entries.get(key)
+            if matrix is not None:
+                self._entries.move_to_end(key)
+            return matrix
+
+    def put(self, key, matrix: np.ndarray):
+        with self._lock:
+            self._drop(key)
+            if matrix.nbytes > self.budget:
+                return
+            while self.used + matrix.nbytes > self.budget:
+                self._drop(next(iter(self._entries)))
+            self._entries[key] = matrix
+            self.used += matrix.nbytes
+
+    def invalidate(self, path: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._drop(key)
+
+    def _drop(self, key):
+        matrix = self._entries.pop(key, None)
+        if matrix is not None:
+            self.used -= matrix.nbytes
+
+
+class Collection:
+    def __init__(self, path: str, cache: RamCache):
+        self.path = path
+        self.cache = cache
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Open the files and replay the row log (again after compaction)."""
+        self.cache.invalidate(self.path)
+        with open(os.path.join(self.path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.ids = []
+        self.rows = {}
+        self.locations = array("q")
+        self.alive = np.zeros(0, dtype=bool)
+        self.has_vector = {name: np.zeros(0, dtype=bool) for name in self.meta["vectors"]}
+        self.columns = {}
+        self.unfilterable = set()
+        self.matrices = {}
+        self._sorted = None
+        self._replay()
+        self._payloads = open(os.path.join(self.path, "payloads.bin"), "ab+")
+        self._log = open(os.path.join(self.path, "rows.jsonl"), "a")
+        for name in self.meta["vectors"]:
+            self._map(name, max(MIN_CAPACITY, len(self.ids)))
+
+    # ---- storage ---------------------------------------------------------
+
+    def _matrix_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{self.meta['files'][name]}.f16")
+
+    def _map(self, name: str, capacity: int):
+        """(Re)map a vector file with room for `capacity` rows, growing it if needed."""
+        size = self.meta["vectors"][name]["size"]
+        path = self._matrix_path(name)
+        with open(path, "ab") as f:
+            if f.tell() < capacity * size * 2:
+                f.truncate(capacity * size * 2)
+        old = self.matrices.get(name)
+        if old is not None:
+            old.flush()
+        self.matrices[name] = np.memmap(path, dtype=np.float16, mode="r+", shape=(capacity, size))
+
+    def _grow(self, n: int):
+        """Make room for rows up to n, doubling the row masks and vector files."""
+        if n > len(self.alive):
+            capacity = max(n, 2 * len(self.alive), MIN_CAPACITY)
+            self.alive = grow_mask(self.alive, capacity)
+            self.has_vector = {name: grow_mask(mask, capacity) for name, mask in self.has_vector.items()}
+        for name, matrix in self.matrices.items():
+            if matrix.shape[0] < n:
+                self._map(name, max(n, matrix.shape[0] * 2))
+
+    def _index_row(self, row: int, record: dict):
+        point_id = record["id"]
+        old = self.rows.get(point_id)
+        if old is not None:
+            self.alive[old] = False
+        self.ids.append(point_id)
+        self.rows[point_id] = row
+        self.locations.extend((record["o"], record["n"]))
+        self.alive[row] = True
+        for name in record["v"]:
+            self.has_vector[name][row] = True
+        for key, value in record["f"].items():
+            if key in self.unfilterable:
+                continue
+            self.columns.setdefault(key, Column()).append(row, value)
+        for key in record.get("u", ()):
+            self.unfilterable.add(key)
+            self.columns.pop(key, None)
+        self._sorted = None
+
+    def _replay(self):
+        path = os.path.join(self.path, "rows.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        self._grow(sum(1 for r in records if "id" in r))
+        for record in records:
+            if "id" in record:
+                self._index_row(len(self.ids), record)
+            else:
+                for point_id in record["d"]:
+                    row = self.rows.pop(point_id, None)
+                    if row is not None:
+                        self.alive[row] = False
+
+    def close(self):
+        for matrix in self.matrices.values():
+            matrix.flush()
+        self._payloads.close()
+        self._log.close()
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    @property
+    def dead(self) -> int:
+        return len(self.ids) - len(self.rows)
+
+    # ---- writes ----------------------------------------------------------
+
+    def vector_dict(self, vector) -> dict:
+        if isinstance(vector, dict):
+            return vector
+        if "" not in self.meta["vectors"]:
+            raise ValueError(f"Collection has named vectors {list(self.meta['vectors'])}; got an unnamed vector")
+        return {"": vector}
+
+    def upsert(self, points):
+        with self.lock:
+            start = len(self.ids)
+            self._grow(start + len(points))
+            lines = []
+            for offset, point in enumerate(points):
+                row = start + offset
+                point_id = normalize_id(point.id)
+                vectors = self.vector_dict(point.vector or {})
+                for name, vector in vectors.items():
+                    params = self.meta["vectors"].get(name)
+                    if params is None:
+                        raise ValueError(f"Wrong vector name '{name}'; collection has {list(self.meta['vectors'])}")
+                    values = np.asarray(vector, dtype=np.float32)
+                    if values.shape != (params["size"],):
+                        raise ValueError(f"Vector '{name}' has {values.size} dims, expected {params['size']}")
+                    if params["distance"] == models.Distance.COSINE:
+                        norm = np.linalg.norm(values)
+                        values = values / norm if norm else values
+                    self.matrices[name][row] = values
+                payload = point.payload or {}
+                blob = json.dumps(payload, ensure_ascii=False).encode()
+                self._payloads.seek(0, os.SEEK_END)
+                location = self._payloads.tell()
+                self._payloads.write(blob)
+                fields = {k: v for k, v in payload.items()
+                          if filterable(v) or (isinstance(v, list) and all(filterable(x) for x in v))}
+                record = {"id": point_id, "o": location, "n": len(blob), "v": list(vectors), "f": fields}
+                unfilterable = [k for k in payload if k not in fields and k not in self.unfilterable]
+                if unfilterable:
+                    record["u"] = unfilterable
+                self._index_row(row, record)
+                lines.append(json.dumps(record, ensure_ascii=False))
+            self._payloads.flush()
+            self._log.write("\n".join(lines) + "\n")
+            self._log.flush()
+
+    def delete(self, point_ids):
+        with self.lock:
+            removed = []
+            for point_id in point_ids:
+                row = self.rows.pop(point_id, None)
+                if row is not None:
+                    self.alive[row] = False
+                    removed.append(point_id)
+            if removed:
+                self._log.write(json.dumps({"d": removed}) + "\n")
+                self._log.flush()
+                self._sorted = None
+            return len(removed)
+
+    # ---- reads -----------------------------------------------------------
+
+    def payload(self, row: int, with_payload=True):
+        if not with_payload:
+            return None
+        location, length = self.locations[2 * row], self.locations[2 * row + 1]
+        payload = json.loads(os.pread(self._payloads.fileno(), length, location)) if length else {}
+        if isinstance(with_payload, list):
+            return {k: payload[k] for k in with_payload if k in payload}
+        return payload
+
+    def vectors(self, row: int, with_vectors=False):
+        if not with_vectors:
+            return None
+        names = with_vectors if isinstance(with_vectors, list) else list(self.meta["vectors"])
+        vectors = {name: self.matrices[name][row].astype(np.float32).tolist()
+                   for name in names if self.has_vector[name][row]}
+        if list(self.meta["vectors"]) == [""]:
+            return vectors.get("")
+        return vectors
+
+    def record(self, row: int, with_payload=True, with_vectors=False) -> models.Record:
+        return models.Record(id=self.ids[row], payload=self.payload(row, with_payload),
+                             vector=self.vectors(row, with_vectors))
+
+    def mask(self, query_filter) -> np.ndarray:
+        """Live rows matching a Filter (None = every live row)."""
+        n = len(self.ids)
+        mask = self.alive[:n].copy()
+        if query_filter is not None:
+            mask &= self._filter(query_filter, n)
+        return mask
+
+    def _filter(self, query_filter: models.Filter, n: int) -> np.ndarray:
+        mask = np.ones(n, dtype=bool)
+        for condition in query_filter.must or []:
+            mask &= self._condition(condition, n)
+        if query_filter.should:
+            any_of = np.zeros(n, dtype=bool)
+            for condition in query_filter.should:
+                any_of |= self._condition(condition, n)
+            mask &= any_of
+        for condition in query_filter.must_not or []:
+            mask &= ~self._condition(condition, n)
+        return mask
+
+    def _condition(self, condition, n: int) -> np.ndarray:
+        if isinstance(condition, models.Filter):
+            return self._filter(condition, n)
+        if isinstance(condition, models.HasIdCondition):
+            mask = np.zeros(n, dtype=bool)
+            rows = [self.rows[i] for i in map(normalize_id, condition.has_id) if i in self.rows]
+            mask[rows] = True
+            return mask
+        if isinstance(condition, models.HasVectorCondition):
+            return self.has_vector[condition.has_vector][:n].copy()
+        if isinstance(condition, models.IsEmptyCondition):
+            return self._field_mask(condition.is_empty.key, n, empty=True)
+        if isinstance(condition, models.IsNullCondition):
+            return self._field_mask(condition.is_null.key, n, null=True)
+        if isinstance(condition, models.FieldCondition) and condition.match is not None:
+            match = condition.match
+            if isinstance(match, models.MatchValue):
+                return self._field_mask(condition.key, n, values=[match.value])
+            if isinstance(match, models.MatchAny):
+                return self._field_mask(condition.key, n, values=match.any)
+            if isinstance(match, models.MatchExcept):
+                values = getattr(match, "except_", None) or getattr(match, "except")
+                return ~self._field_mask(condition.key, n, values=values) & ~self._field_mask(condition.key, n, empty=True)
+        raise unsupported_filter(condition)
+
+    def _field_mask(self, key: str, n: int, values=None, empty=False, null=False) -> np.ndarray:
+        if key in self.unfilterable:
+            # Long values aren't held in memory: read the payloads (slow, not used by the server)
+            mask = np.zeros(n, dtype=bool)
+            for row in np.flatnonzero(self.alive[:n]):
+                payload = self.payload(int(row))
+                value = payload.get(key)
+                if null:
+                    mask[row] = key in payload and value is None
+                elif empty:
+                    mask[row] = value in (None, [], "")
+                else:
+                    mask[row] = any(v in values for v in (value if isinstance(value, list) else [value]))
+            return mask
+        column = self.columns.get(key)
+        if column is None:
+            return np.full(n, empty, dtype=bool)
+        if null:
+            return column.null(n)
+        return column.empty(n) if empty else column.mask(n, values)
+
+    def search(self, query, using: str, query_filter, limit: int, offset: int = 0, score_threshold=None):
+        """(row, score) pairs of the best matches, highest score first."""
+        with self.lock:
+            params = self.meta["vectors"].get(using)
+            if params is None:
+                raise ValueError(f"Wrong vector name '{using}'; collection has {list(self.meta['vectors'])}")
+            vector = np.asarray(query, dtype=np.float32)
+            if params["distance"] == models.Distance.COSINE:
+                norm = np.linalg.norm(vector)
+                vector = vector / norm if norm else vector
+            n = len(self.ids)
+            mask = self.mask(query_filter) & self.has_vector[using][:n]
+            rows = np.flatnonzero(mask)
+            cached = self.cached_matrix(using, n)
+            if cached is not None:
+                # Scoring every row and picking is cheaper than gathering most of them
+                scores = (cached @ vector)[rows] if 4 * len(rows) > n else cached[rows] @ vector
+            else:
+                matrix = self.matrices[using]
+                scores = np.empty(len(rows), dtype=np.float32)
+                block = max(256, SEARCH_BLOCK_BYTES // (params["size"] * 4))
+                contiguous = len(rows) == n
+                for start in range(0, len(rows), block):
+                    chunk = rows[start:start + block]
+                    vectors = matrix[chunk[0]:chunk[-1] + 1] if contiguous else matrix[chunk]
+                    scores[start:start + len(chunk)] = vectors.astype(np.float32) @ vector
+        if score_threshold is not None:
+            keep = scores >= score_threshold
+            rows, scores = rows[keep], scores[keep]
+        k = min(len(rows), limit + offset)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")][offset:]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def cached_matrix(self, name: str, n: int):
+        """float32 rows [:n] of a vector from the RAM cache, extended with new rows; None if too big."""
+        if n * self.meta["vectors"][name]["size"] * 4 > self.cache.budget:
+            return None
+        key = (self.path, name)
+        cached = self.cache.get(key)
+        if cached is None or len(cached) < n:
+            done = 0 if cached is None else len(cached)
+            fresh = self.matrices[name][done:n].astype(np.float32)
+            cached = fresh if cached is None else np.concatenate([cached, fresh])
+            self.cache.put(key, cached)
+        return cached[:n]
+
+    def sorted_rows(self) -> list:
+        """Live rows in id order (scroll order), cached until the next write."""
+        if self._sorted is None:
+            self._sorted = sorted(self.rows.values(), key=lambda row: id_key(self.ids[row]))
+        return self._sorted
+
+
+class MmapIndex:
+    """The subset of QdrantClient the MCP server uses, over memory-mapped per-collection files."""
+
+    def __init__(self, path: str = VECTOR_STORE_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._collections = {}
+        self._cache = RamCache()
+        self._lock = threading.RLock()
+        self._aliases_path = os.path.join(path, "aliases.json")
+
+    # ---- collections and aliases -----------------------------------------
+
+    def _aliases(self) -> dict:
+        if not os.path.exists(self._aliases_path):
+            return {}
+        with open(self._aliases_path) as f:
+            return json.load(f)
+
+    def _save_aliases(self, aliases: dict):
+        tmp = f"{self._aliases_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(aliases, f)
+        os.replace(tmp, self._aliases_path)
+
+    def _resolve(self, name: str) -> str:
+        return self._aliases().get(name, name)
+
+    def _dir(self, name: str) -> str:
+        if not name or "/" in name or name.startswith("."):
+            raise ValueError(f"Invalid collection name '{name}'")
+        return os.path.join(self.path, name)
+
+    def _collection(self, name: str) -> Collection:
+        name = self._resolve(name)
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                if not os.path.exists(os.path.join(self._dir(name), "meta.json")):
+                    raise ValueError(f"Collection `{name}` doesn't exist!")
+                collection = self._collections[name] = Collection(self._dir(name), self._cache)
+            return collection
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return os.path.exists(os.path.join(self._dir(self._resolve(collection_name)), "meta.json"))
+
+    def get_collections(self):
+        # Dot-prefixed directories are compactions in progress
+        names = sorted(d for d in os.listdir(self.path)
+                       if not d.startswith(".") and os.path.exists(os.path.join(self.path, d, "meta.json")))
+        return models.CollectionsResponse(collections=[models.CollectionDescription(name=n) for n in names])
+
+    def get_aliases(self):
+        return models.CollectionsAliasesResponse(aliases=[
+            models.AliasDescription(alias_name=alias, collection_name=target)
+            for alias, target in sorted(self._aliases().items())
+        ])
+
+    def update_collection_aliases(self, change_aliases_operations, **kwargs) -> bool:
+        """Apply alias changes together (one aliases.json write), like Qdrant's atomic update."""
+        with self._lock:
+            aliases = self._aliases()
+            for operation in change_aliases_operations:
+                if isinstance(operation, models.DeleteAliasOperation):
+                    aliases.pop(operation.delete_alias.alias_name, None)
+                elif isinstance(operation, models.CreateAliasOperation):
+                    create = operation.create_alias
+                    if not self.collection_exists(create.collection_name):
+                        raise ValueError(f"Collection `{create.collection_name}` doesn't exist!")
+                    aliases[create.alias_name] = create.collection_name
+                elif isinstance(operation, models.RenameAliasOperation):
+                    rename = operation.rename_alias
+                    aliases[rename.new_alias_name] = aliases.pop(rename.old_alias_name)
+            self._save_aliases(aliases)
+        return True
+
+    def create_collection(self, collection_name: str, vectors_config, **kwargs) -> bool:
+        """HNSW, quantization and optimizer settings don't apply here and are ignored."""
+        path = self._dir(collection_name)
+        if os.path.exists(os.path.join(path, "meta.json")):
+            raise ValueError(f"Collection `{collection_name}` already exists!")
+        if isinstance(vectors_config, models.VectorParams):
+            vectors_config = {"": vectors_config}
+        vectors = {}
+        for name, params in vectors_config.items():
+            distance = models.Distance(params.distance)
+            if distance not in (models.Distance.COSINE, models.Distance.DOT):
+                raise ValueError(f"mmap vector backend supports Cosine and Dot distance, not {distance}")
+            vectors[name] = {"size": params.size, "distance": distance.value}
+        os.makedirs(path, exist_ok=True)
+        meta = {"vectors": vectors, "files": {name: f"v{i}" for i, name in enumerate(vectors)}, "payload_schema": {}}
+        with open(os.path.join(path, "meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+        return True
+
+    def delete_collection(self, collection_name: str, **kwargs) -> bool:
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+            if collection is not None:
+                collection.close()
+            path = self._dir(collection_name)
+            self._cache.invalidate(path)
+            if not os.path.exists(path):
+                return False
+            shutil.rmtree(path)
+            aliases = self._aliases()
+            remaining = {a: c for a, c in aliases.items() if c != collection_name}
+            if remaining != aliases:
+                self._save_aliases(remaining)
+        return True
+
+    def update_collection(self, collection_name: str, **kwargs) -> bool:
+        """Storage profiles are a Qdrant concept; accepted so reprofile_collections.py is harmless."""
+        self._collection(collection_name)
+        return True
+
+    def get_collection(self, collection_name: str):
+        collection = self._collection(collection_name)
+        vectors = {
+            name: models.VectorParams(size=params["size"], distance=params["distance"], on_disk=True)
+            for name, params in collection.meta["vectors"].items()
+        }
+        return SimpleNamespace(
+            status=models.CollectionStatus.GREEN,
+            points_count=collection.count,
+            indexed_vectors_count=0,
+            segments_count=1,
+            config=SimpleNamespace(
+                params=SimpleNamespace(vectors=vectors.get("") if list(vectors) == [""] else vectors),
+                quantization_config=None,
+                hnsw_config=None,
+            ),
+            payload_schema={
+                field: models.PayloadIndexInfo(data_type=schema, points=collection.count)
+                for field, schema in collection.meta["payload_schema"].items()
+            },
+        )
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None, **kwargs):
+        """Every short payload field is filterable already; the index is recorded for get_collection."""
+        collection = self._collection(collection_name)
+        with collection.lock:
+            # A schema type, or index params (KeywordIndexParams etc.) carrying one
+            schema = getattr(field_schema, "type", field_schema)
+            schema = getattr(schema, "value", schema) or "keyword"
+            collection.meta["payload_schema"][field_name] = schema
+            with open(os.path.join(collection.path, "meta.json.tmp"), "w") as f:
+                json.dump(collection.meta, f)
+            os.replace(os.path.join(collection.path, "meta.json.tmp"), os.path.join(collection.path, "meta.json"))
+        return COMPLETED
+
+    # ---- points ----------------------------------------------------------
+
+    def upsert(self, collection_name: str, points, wait: bool = True, **kwargs):
+        collection = self._collection(collection_name)
+        collection.upsert(list(points))
+        self._maybe_compact(collection_name, collection)
+        return COMPLETED
+
+    def delete(self, collection_name: str, points_selector, wait: bool = True, **kwargs):
+        if isinstance(points_selector, models.FilterSelector):
+            check_filter(points_selector.filter)
+        collection = self._collection(collection_name)
+        with collection.lock:
+            if isinstance(points_selector, models.FilterSelector):
+                rows = np.flatnonzero(collection.mask(points_selector.filter))
+                point_ids = [collection.ids[row] for row in rows]
+            else:
+                selected = points_selector.points if isinstance(points_selector, models.PointIdsList) else points_selector
+                point_ids = [normalize_id(i) for i in selected]
+            collection.delete(point_ids)
+        self._maybe_compact(collection_name, collection)
+        return COMPLETED
+
+    def count(self, collection_name: str, count_filter=None, exact: bool = True, **kwargs):
+        check_filter(count_filter)
+        collection = self._collection(collection_name)
+        with collection.lock:
+            count = collection.count if count_filter is None else int(collection.mask(count_filter).sum())
+        return models.CountResult(count=count)
+
+    def retrieve(self, collection_name: str, ids, with_payload=True, with_vectors=False, **kwargs):
+        collection = self._collection(collection_name)
+        with collection.lock:
+            rows = [collection.rows.get(normalize_id(i)) for i in ids]
+            return [collection.record(row, with_payload, with_vectors) for row in rows if row is not None]
+
+    def scroll(self, collection_name: str, scroll_filter=None, limit: int = 10, offset=None,
+               with_payload=True, with_vectors=False, **kwargs):
+        """Points in id order from `offset` (an id); returns (records, next offset or None)."""
+        check_filter(scroll_filter)
+        collection = self._collection(collection_name)
+        with collection.lock:
+            ordered = collection.sorted_rows()
+            start = 0
+            if offset is not None:
+                key = id_key(normalize_id(offset))
+                lo, hi = 0, len(ordered)
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if id_key(collection.ids[ordered[mid]]) < key:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                start = lo
+            mask = collection.mask(scroll_filter) if scroll_filter is not None else None
+            records, next_offset = [], None
+            for row in ordered[start:]:
+                if mask is not None and not mask[row]:
+                    continue
+                if len(records) == limit:
+                    next_offset = collection.ids[row]
+                    break
+                records.append(collection.record(row, with_payload, with_vectors))
+            return records, next_offset
+
+    def query_points(self, collection_name: str, query=None, using=None, query_filter=None, search_params=None,
+                     limit: int = 10, offset: int = 0, with_payload=True, with_vectors=False,
+                     score_threshold=None, **kwargs):
+        """Exact (brute-force) nearest neighbours; search_params are ignored."""
+        check_filter(query_filter)
+        collection = self._collection(collection_name)
+        if isinstance(query, models.NearestQuery):
+            query = query.nearest
+        hits = collection.search(query, using or "", query_filter, limit, offset or 0, score_threshold)
+        with collection.lock:
+            points = [
+                models.ScoredPoint(id=collection.ids[row], version=0, score=score,
+                                   payload=collection.payload(row, with_payload),
+                                   vector=collection.vectors(row, with_vectors))
+                for row, score in hits
+            ]
+        return models.QueryResponse(points=points)
+
+    def query_batch_points(self, collection_name: str, requests, **kwargs):
+        for request in requests:
+            check_filter(request.filter)
+        return [
+            self.query_points(
+                collection_name, query=request.query, using=request.using, query_filter=request.filter,
+                limit=request.limit or 10, offset=request.offset or 0,
+                with_payload=True if request.with_payload is None else request.with_payload,
+                with_vectors=request.with_vector or False, score_threshold=request.score_threshold,
+            )
+            for request in requests
+        ]
+
+    def set_payload(self, collection_name: str, payload: dict, points=None, wait: bool = True, **kwargs):
+        """Merge `payload` into the selected points (a Filter, ids or None for all); rewrites their rows."""
+        if isinstance(points, models.Filter):
+            check_filter(points)
+        collection = self._collection(collection_name)
+        with collection.lock:
+            if points is None or isinstance(points, models.Filter):
+                rows = np.flatnonzero(collection.mask(points))
+            else:
+                rows = [collection.rows[i] for i in map(normalize_id, points) if i in collection.rows]
+            self._rewrite(collection, rows, lambda record, row: record.payload.update(payload))
+        self._maybe_compact(collection_name, collection)
+        return COMPLETED
+
+    def update_vectors(self, collection_name: str, points, wait: bool = True, **kwargs):
+        """Add or replace named vectors on existing points (models.PointVectors)."""
+        collection = self._collection(collection_name)
+        with collection.lock:
+            updates = {collection.rows[i]: v.vector for v in points
+                       if (i := normalize_id(v.id)) in collection.rows}
+
+            def apply(record, row):
+                vectors = collection.vector_dict(record.vector or {})
+                vectors.update(collection.vector_dict(updates[row]))
+                record.vector = vectors
+
+            self._rewrite(collection, list(updates), apply)
+        self._maybe_compact(collection_name, collection)
+        return COMPLETED
+
+    def _rewrite(self, collection: Collection, rows, change, batch_size: int = 256):
+        rows = [int(r) for r in rows]
+        for start in range(0, len(rows), batch_size):
+            batch = []
+            for row in rows[start:start + batch_size]:
+                record = collection.record(row, with_payload=True, with_vectors=True)
+                record.payload = record.payload or {}
+                change(record, row)
+                batch.append(models.PointStruct(id=record.id, vector=record.vector or {}, payload=record.payload))
+            collection.upsert(batch)
+
+    def _maybe_compact(self, collection_name: str, collection: Collection):
+        if collection.dead >= COMPACT_MIN_DEAD and collection.dead > collection.count:
+            self.compact(collection_name)
+
+    def compact(self, collection_name: str):
+        """Rewrite a collection without its dead rows (stale upserts and deletes)."""
+        collection = self._collection(collection_name)
+        with collection.lock:
+            name = os.path.basename(collection.path)
+            tmp = os.path.join(self.path, f".{name}.compact")
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(collection.meta, f)
+            fresh = Collection(tmp, RamCache(0))
+            rows = sorted(collection.rows.values())
+            for start in range(0, len(rows), 1024):
+                fresh.upsert([
+                    models.PointStruct(id=r.id, vector=r.vector or {}, payload=r.payload or {})
+                    for r in (collection.record(row, True, True) for row in rows[start:start + 1024])
+                ])
+            fresh.close()
+            collection.close()
+            old = os.path.join(self.path, f".{name}.old")
+            os.replace(collection.path, old)
+            os.replace(tmp, collection.path)
+            shutil.rmtree(old, ignore_errors=True)
+            collection.load()
+
+    def close(self):
+        with self._lock:
+            for collection in self._collections.values():
+                collection.close()
+            self._collections.clear()
+
+    # ---- unsupported -----------------------------------------------------
+
+    def create_snapshot(self, *args, **kwargs):
+        raise RuntimeError("Snapshots need Qdrant (VECTOR_BACKEND=qdrant); with VECTOR_BACKEND=mmap back up "
+                           "VECTOR_STORE_DIR instead and clone tenants with snapshots.py clone --method copy")
+
+    recover_snapshot = delete_snapshot = create_snapshot
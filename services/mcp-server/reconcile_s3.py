@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Reconcile the knowledge base with the documents bucket.
+
+Lists S3 (keys and ETags) and the s3Key/docVersion payloads in Qdrant,
+then fixes drift in bulk:
+  orphaned - indexed but no longer in S3: chunks deleted, one filtered
+             delete per tenant
+  missing  - in S3 but never indexed
+  stale    - indexed from a different version (ETag) than the live object
+Missing and stale objects are re-triggered by copying each object onto
+itself, which fires the normal ObjectCreated -> Lambda -> ingest_document
+path (text extraction lives in the Lambda, not here).
+
+Points without an s3Key (direct ingest_knowledge calls) are left alone, and
+so are objects under SNAPSHOT_PREFIX (snapshots.py backups, when they share
+the documents bucket): they are never listed, so never re-triggered.
+
+Usage:
+  python reconcile_s3.py --bucket digital-twin-docs --dry-run
+  python reconcile_s3.py --bucket digital-twin-docs --prefix tenant-acme/
+"""
+
+import argparse
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import boto3
+from qdrant_client.http import models
+
+import main
+
+DELETE_BATCH = 1000
+# snapshots.py's key prefix in the bucket; those objects are backups, not documents
+SNAPSHOT_PREFIX = os.getenv("SNAPSHOT_PREFIX", "_snapshots").strip("/") + "/"
+
+
+def list_bucket(s3, bucket, prefix):
+    """S3 key -> ETag (unquoted) for every document under the prefix (snapshot backups excluded)."""
+    objects = {}
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith("/") and not obj["Key"].startswith(SNAPSHOT_PREFIX):
+                objects[obj["Key"]] = obj["ETag"].strip('"')
+    return objects
+
+
+def indexed_sources(prefix):
+    """(collection, tenant, s3Key) -> set of indexed versions, for keys under the prefix."""
+    if main.TENANCY_MODE == "shared":
+        collections = [main.SHARED_COLLECTION]
+    else:
+        collections = [name for name in main.tenant_collections() if name != main.SHARED_COLLECTION]
+
+    sources = defaultdict(set)
+    for collection_name in collections:
+        offset = None
+        while True:
+            points, offset = main.qdrant_client.scroll(
+                collection_name=collection_name,
+                scroll_filter=models.Filter(must_not=[models.IsEmptyCondition(is_empty=models.PayloadField(key=main.S3_KEY))]),
+                limit=1000,
+                offset=offset,
+                with_payload=[main.TENANT_KEY, main.S3_KEY, main.VERSION_KEY],
+                with_vectors=False,
+            )
+            for point in points:
+                payload = point.payload or {}
+                key = payload.get(main.S3_KEY)
+                if not key or not key.startswith(prefix):
+                    continue
+                tenant = payload.get(main.TENANT_KEY, collection_name.replace("_", "-"))
+                sources[(collection_name, tenant, key)].add(payload.get(main.VERSION_KEY))
+            if offset is None:
+                break
+    return sources
+
+
+def delete_orphans(orphans):
+    """Delete chunks for (collection, tenant, key) triples, batching keys per tenant."""
+    grouped = defaultdict(list)
+    for collection_name, tenant, key in orphans:
+        grouped[(collection_name, tenant)].append(key)
+
+    deleted = 0
+    for (collection_name, tenant), keys in grouped.items():
+        base = main.tenant_filter(tenant)
+        for start in range(0, len(keys), DELETE_BATCH):
+            batch = keys[start:start + DELETE_BATCH]
+            must = list(base.must) if base else []
+            must.append(models.FieldCondition(key=main.S3_KEY, match=models.MatchAny(any=batch)))
+            deleted += main.delete_source_points(collection_name, models.Filter(must=must))
+    return deleted
+
+
+def retrigger(s3, bucket, keys):
+    """Copy each object onto itself so S3 emits ObjectCreated and the Lambda re-ingests it."""
+    stamp = datetime.now(timezone.utc).isoformat()
+    failed = 0
+    for key in keys:
+        try:
+            head = s3.head_object(Bucket=bucket, Key=key)
+            s3.copy_object(
+                Bucket=bucket, Key=key,
+                CopySource={"Bucket": bucket, "Key": key},
+                MetadataDirective="REPLACE",
+                Metadata={**head.get("Metadata", {}), "reindexed-at": stamp},
+                ContentType=head.get("ContentType", "binary/octet-stream"),
+            )
+        except Exception as e:
+            print(f"❌ re-trigger {key}: {e}")
+            failed += 1
+    return failed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Fix drift between the documents bucket and Qdrant")
+    parser.add_argument("--bucket", default=os.getenv("S3_BUCKET"), help="Documents bucket (default: $S3_BUCKET)")
+    parser.add_argument("--prefix", default="", help="Only reconcile keys under this prefix, e.g. tenant-acme/")
+    parser.add_argument("--endpoint-url", default=os.getenv("S3_ENDPOINT") or os.getenv("AWS_S3_ENDPOINT"),
+                        help="S3 endpoint (LocalStack)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report drift")
+    parser.add_argument("--skip-delete", action="store_true", help="Don't delete orphaned chunks")
+    parser.add_argument("--skip-reingest", action="store_true", help="Don't re-trigger missing/stale objects")
+    args = parser.parse_args()
+
+    if not args.bucket:
+        parser.error("--bucket (or S3_BUCKET) is required")
+
+    s3 = boto3.client("s3", endpoint_url=args.endpoint_url)
+    objects = list_bucket(s3, args.bucket, args.prefix)
+    sources = indexed_sources(args.prefix)
+    indexed_keys = {key for _, _, key in sources}
+
+    orphans = [source for source in sources if source[2] not in objects]
+    missing = sorted(key for key in objects if key not in indexed_keys)
+    stale = sorted({key for (_, _, key), versions in sources.items() if key in objects and versions != {objects[key]}})
+
+    print(f"S3: {len(objects)} objects, indexed: {len(indexed_keys)} documents")
+    print(f"   orphaned: {len(orphans)}, missing: {len(missing)}, stale: {len(stale)}")
+    for label, keys in (("orphaned", [key for _, _, key in orphans]), ("missing", missing), ("stale", stale)):
+        for key in keys[:20]:
+            print(f"   {label}: {key}")
+        if len(keys) > 20:
+            print(f"   ... {len(keys) - 20} more {label}")
+
+    if args.dry_run:
+        sys.exit(0)
+
+    failures = 0
+    if orphans and not args.skip_delete:
+        print(f"🗑️  deleted {delete_orphans(orphans)} orphaned chunks")
+    if (missing or stale) and not args.skip_reingest:
+        failures = retrigger(s3, args.bucket, missing + stale)
+        print(f"🔁 re-triggered {len(missing) + len(stale) - failures} objects")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Re-embed collections for a new embedding model without search downtime.
+
+Run it with the embedding settings being moved to (EMBEDDING_PROVIDER,
+EMBEDDING_MODEL_ID, EMBEDDING_SECONDARY_PROVIDERS) while the server keeps
+running on the old ones. For each collection:
+
+  build     - a shadow collection <name>__<timestamp> gets the collection's
+              existing named vectors plus the new ones. Points are scrolled
+              from the live collection; existing vectors are copied and only
+              the new models are embedded, from the stored chunk text, at no
+              more than --rate chunks/s so live traffic keeps its headroom
+  catch up  - points written or deleted on the live collection since the
+              build started are applied to the shadow
+  swap      - once the shadow's count matches, the <name> alias moves to it
+              in one atomic Qdrant operation; points that reached the old
+              collection in between are copied over afterwards
+
+Searches resolve <name> through the alias, and the shadow keeps the old
+vectors, so the running server answers throughout; restart it with the new
+settings at any point after the swap. The replaced collection is kept for
+--rollback until --drop-old.
+
+A pre-alias collection (created before COLLECTION_ALIASES) is first moved
+behind an alias of its own name: it is copied as is, vectors included, into
+<name>__<timestamp>, caught up until both hold the same points, and only
+then dropped and replaced by the alias. The copy is the source of the
+re-embed, so it is what the catch-up after the swap reads from and what
+--rollback returns to. --migrate-legacy does only this step.
+
+Progress is saved to REEMBED_STATE after every batch, and re-running the same
+command resumes from the last saved scroll offset.
+
+Usage:
+  EMBEDDING_MODEL_ID=amazon.titan-embed-text-v2:0 python reembed.py --all --dry-run
+  EMBEDDING_MODEL_ID=amazon.titan-embed-text-v2:0 python reembed.py --all --rate 50
+  python reembed.py tenant_acme --drop-vectors     # leave out vectors the new settings don't use
+  python reembed.py --status
+  python reembed.py tenant_acme --rollback
+  python reembed.py --all --drop-old
+  python reembed.py tenant_acme --migrate-legacy
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+from qdrant_client.http import models
+
+import main
+import storage_profiles
+import usage_store
+from admission import TokenBucket
+
+REEMBED_STATE = os.getenv("REEMBED_STATE", "/app/data/reembed/state.json")
+REEMBED_RATE = float(os.getenv("REEMBED_RATE", "20"))
+# Catch-up passes before the swap; each one only sees writes made during the previous
+CATCH_UP_PASSES = 3
+
+
+def load_state():
+    if not os.path.exists(REEMBED_STATE):
+        return {}
+    with open(REEMBED_STATE) as f:
+        return json.load(f)
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(REEMBED_STATE) or ".", exist_ok=True)
+    tmp = REEMBED_STATE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, REEMBED_STATE)
+
+
+def plan(collection_name, drop_vectors=False):
+    """(vectors to copy, providers to embed with, target name -> size) for a collection."""
+    source_sizes = storage_profiles.vector_sizes(main.qdrant_client.get_collection(collection_name))
+    providers = [main.embedder, *main.secondary_embedders]
+    embed = [p for p in providers if source_sizes.get(p.name) != p.vector_size]
+    embedded_names = {p.name for p in embed}
+    # A legacy unnamed vector can't sit next to named ones; it is re-embedded under its provider's name
+    copy = {
+        name: size for name, size in source_sizes.items()
+        if name and name not in embedded_names and (not drop_vectors or name in main.collection_vectors())
+    }
+    return copy, embed, {**copy, **{p.name: p.vector_size for p in embed}}
+
+
+def is_shared(collection_name):
+    return collection_name == main.SHARED_COLLECTION and main.TENANCY_MODE == "shared"
+
+
+def create_shadow(collection_name, target_sizes):
+    shadow = main.physical_collection_name(collection_name)
+    info = main.qdrant_client.get_collection(collection_name)
+    main.qdrant_client.create_collection(
+        collection_name=shadow,
+        **storage_profiles.create_collection_kwargs(
+            storage_profiles.profile_from_collection(info), target_sizes,
+            main.SHARED_HNSW_OVERRIDES if is_shared(collection_name) else None,
+        ),
+    )
+    main.ensure_payload_indexes(shadow, shared=is_shared(collection_name))
+    return shadow
+
+
+class Rebuilder:
+    """Copies points from the live collection into the shadow, embedding the new vectors."""
+
+    def __init__(self, collection_name, entry, copy, embed, rate, batch_size):
+        self.collection_name = collection_name
+        self.entry = entry
+        self.copy = list(copy)
+        self.embed = embed
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(rate, max(rate, batch_size))
+
+    def throttle(self, chunks):
+        while True:
+            wait = self.bucket.take(chunks)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def vectors_for(self, points, providers):
+        """New vectors per point index, embedded per tenant so usage is attributed to its owner."""
+        fallback_tenant = self.collection_name.replace("_", "-")
+        by_tenant = defaultdict(list)
+        for index, point in enumerate(points):
+            if (point.payload or {}).get("text"):
+                by_tenant[point.payload.get(main.TENANT_KEY, fallback_tenant)].append(index)
+
+        vectors = defaultdict(dict)
+        for tenant_id, indexes in by_tenant.items():
+            texts = [points[i].payload["text"] for i in indexes]
+            self.throttle(len(texts))
+            for provider in providers:
+                for i, vector in zip(indexes, main.get_embeddings(texts, tenant_id, provider)):
+                    vectors[i][provider.name] = vector
+        return vectors
+
+    def write(self, points):
+        """Upsert points into the shadow under their own ids; returns how many were embedded."""
+        if not points:
+            return 0
+        started = time.perf_counter()
+        new_vectors = self.vectors_for(points, self.embed) if self.embed else {}
+        batch = []
+        for index, point in enumerate(points):
+            existing = point.vector if isinstance(point.vector, dict) else {}
+            vector = {name: existing[name] for name in self.copy if name in existing}
+            vector.update(new_vectors.get(index, {}))
+            batch.append(models.PointStruct(id=point.id, vector=vector, payload=point.payload))
+        main.qdrant_client.upsert(collection_name=self.entry["shadow"], points=batch, wait=True)
+
+        embedded = len(new_vectors)
+        self.entry["copied"] += len(points)
+        self.entry["embedded"] += embedded
+        self.entry["skipped"] += len(points) - embedded if self.embed else 0
+        self.entry["seconds"] += time.perf_counter() - started
+        return embedded
+
+    def build(self, state):
+        """Scroll the live collection from the saved offset to the end."""
+        source = self.entry["source"]
+        total = main.qdrant_client.count(source, exact=True).count
+        while True:
+            points, offset = main.qdrant_client.scroll(
+                collection_name=source, limit=self.batch_size, offset=self.entry["offset"],
+                with_payload=True, with_vectors=self.copy or False,
+            )
+            self.write(points)
+            self.entry["offset"] = offset
+            save_state(state)
+            print(f"   {self.collection_name}: {self.entry['copied']}/{total} points, "
+                  f"{chunks_per_second(self.entry)} chunks/s", end="\r")
+            if offset is None:
+                print()
+                return
+
+    def catch_up(self, source, delete_extra=True):
+        """Apply points added to (and, optionally, removed from) `source` since they were copied."""
+        source_ids, shadow_ids = point_ids(source), point_ids(self.entry["shadow"])
+        missing = [point_id for point_id in source_ids if point_id not in shadow_ids]
+        extra = [point_id for point_id in shadow_ids if point_id not in source_ids] if delete_extra else []
+        for start in range(0, len(missing), self.batch_size):
+            self.write(main.qdrant_client.retrieve(
+                collection_name=source, ids=missing[start:start + self.batch_size],
+                with_payload=True, with_vectors=self.copy or False,
+            ))
+        if extra:
+            main.qdrant_client.delete(
+                collection_name=self.entry["shadow"], points_selector=models.PointIdsList(points=extra), wait=True,
+            )
+        return len(missing), len(extra)
+
+
+    def fill_missing(self, providers):
+        """Embed, in place, vectors that points written by a server still on the old settings lack."""
+        filled = 0
+        for provider in providers:
+            offset = None
+            while True:
+                points, offset = main.qdrant_client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=models.Filter(must_not=[models.HasVectorCondition(has_vector=provider.name)]),
+                    limit=self.batch_size, offset=offset, with_payload=True, with_vectors=False,
+                )
+                vectors = self.vectors_for(points, [provider])
+                if vectors:
+                    main.qdrant_client.update_vectors(
+                        collection_name=self.collection_name, wait=True,
+                        points=[models.PointVectors(id=points[i].id, vector=v) for i, v in vectors.items()],
+                    )
+                filled += len(vectors)
+                if offset is None:
+                    break
+        return filled
+
+
+def point_ids(collection_name):
+    ids, offset = set(), None
+    while True:
+        points, offset = main.qdrant_client.scroll(
+            collection_name=collection_name, limit=1000, offset=offset, with_payload=False, with_vectors=False,
+        )
+        ids.update(point.id for point in points)
+        if offset is None:
+            return ids
+
+
+def copy_points(source, target, ids=None, batch_size=256):
+    """Copy points (all, or just `ids`) with their payloads and vectors as stored; returns how many."""
+    copied, offset = 0, None
+    while True:
+        if ids is None:
+            points, offset = main.qdrant_client.scroll(
+                collection_name=source, limit=batch_size, offset=offset, with_payload=True, with_vectors=True,
+            )
+        else:
+            batch, ids = ids[:batch_size], ids[batch_size:]
+            points = main.qdrant_client.retrieve(source, ids=batch, with_payload=True, with_vectors=True)
+            offset = ids or None
+        if points:
+            main.qdrant_client.upsert(collection_name=target, wait=True, points=[
+                models.PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points
+            ])
+        copied += len(points)
+        if offset is None:
+            return copied
+
+
+def migrate_legacy(collection_name, state, batch_size):
+    """Move a pre-alias collection behind an alias of its own name, via a verified copy. False if not done."""
+    entry = state.get(collection_name)
+    if entry and entry["status"] == "migrating" and main.qdrant_client.collection_exists(entry["shadow"]):
+        copy = entry["shadow"]
+        print(f"🔁 {collection_name}: resuming the move behind an alias -> {copy}")
+    else:
+        info = main.qdrant_client.get_collection(collection_name)
+        copy = main.physical_collection_name(collection_name)
+        kwargs = storage_profiles.create_collection_kwargs(
+            storage_profiles.profile_from_collection(info), {},
+            main.SHARED_HNSW_OVERRIDES if is_shared(collection_name) else None,
+        )
+        # Same vectors as the original, the unnamed legacy vector included
+        kwargs["vectors_config"] = info.config.params.vectors
+        main.qdrant_client.create_collection(collection_name=copy, **kwargs)
+        main.ensure_payload_indexes(copy, shared=is_shared(collection_name))
+        state[collection_name] = {
+            "status": "migrating", "source": collection_name, "shadow": copy,
+            "vectors": storage_profiles.vector_sizes(info), "embedding": [], "offset": None,
+            "copied": 0, "embedded": 0, "skipped": 0, "seconds": 0.0, "previous": None,
+            "started_at": time.time(),
+        }
+        save_state(state)
+        print(f"🔧 {collection_name}: pre-alias collection, copying it to {copy}")
+        copy_points(collection_name, copy, batch_size=batch_size)
+
+    for _ in range(CATCH_UP_PASSES):
+        source_ids, copy_ids = point_ids(collection_name), point_ids(copy)
+        missing = [point_id for point_id in source_ids if point_id not in copy_ids]
+        extra = [point_id for point_id in copy_ids if point_id not in source_ids]
+        copy_points(collection_name, copy, ids=missing, batch_size=batch_size)
+        if extra:
+            main.qdrant_client.delete(collection_name=copy, points_selector=models.PointIdsList(points=extra), wait=True)
+        if not missing and not extra:
+            break
+
+    source_count = main.qdrant_client.count(collection_name, exact=True).count
+    copy_count = main.qdrant_client.count(copy, exact=True).count
+    if copy_count != source_count:
+        print(f"❌ {collection_name}: copy has {copy_count}/{source_count} points, not replacing it "
+              "(writes still arriving? re-run to resume)")
+        return False
+    main.adopt_legacy_collection(collection_name, copy)
+    state[collection_name].update(status="migrated", copied=copy_count, migrated_at=time.time())
+    save_state(state)
+    print(f"✅ {collection_name}: {copy_count} points, now an alias -> {copy}")
+    return True
+
+
+def chunks_per_second(entry):
+    return round(entry["embedded"] / entry["seconds"], 1) if entry["seconds"] else 0.0
+
+
+def reembed(collection_name, state, args):
+    """Build, catch up and swap one collection. Returns False if it had to stop short."""
+    if main.is_legacy_collection(collection_name) and not migrate_legacy(collection_name, state, args.batch_size):
+        return False
+    copy, embed, target_sizes = plan(collection_name, args.drop_vectors)
+    entry = state.get(collection_name)
+    resumable = entry and entry["status"] == "building" and entry["vectors"] == target_sizes \
+        and main.qdrant_client.collection_exists(entry["shadow"])
+    if not resumable:
+        if not embed and len(copy) == len(storage_profiles.vector_sizes(main.qdrant_client.get_collection(collection_name))):
+            rebuilder = Rebuilder(collection_name, None, copy, embed, args.rate, args.batch_size)
+            with usage_store.scope("reembed", None):
+                filled = rebuilder.fill_missing([main.embedder, *main.secondary_embedders])
+            print(f"✅ {collection_name}: already has {sorted(target_sizes)}, filled {filled} points missing one")
+            return True
+        source = main.resolve_collection(collection_name)
+        entry = state[collection_name] = {
+            "status": "building", "source": source, "shadow": create_shadow(collection_name, target_sizes),
+            "vectors": target_sizes, "embedding": [p.model_id for p in embed], "offset": None,
+            "copied": 0, "embedded": 0, "skipped": 0, "seconds": 0.0, "previous": None,
+            "started_at": time.time(),
+        }
+        save_state(state)
+        print(f"🔧 {collection_name}: copying {sorted(copy)}, embedding {[p.name for p in embed]} -> {entry['shadow']}")
+    else:
+        print(f"🔁 {collection_name}: resuming at {entry['copied']} points -> {entry['shadow']}")
+
+    rebuilder = Rebuilder(collection_name, entry, copy, embed, args.rate, args.batch_size)
+    with usage_store.scope("reembed", None):
+        rebuilder.build(state)
+        for _ in range(CATCH_UP_PASSES):
+            missing, extra = rebuilder.catch_up(entry["source"])
+            save_state(state)
+            if not missing and not extra:
+                break
+            print(f"   {collection_name}: caught up {missing} new and {extra} deleted points")
+
+        source_count = main.qdrant_client.count(entry["source"], exact=True).count
+        shadow_count = main.qdrant_client.count(entry["shadow"], exact=True).count
+        if shadow_count != source_count:
+            print(f"❌ {collection_name}: shadow has {shadow_count}/{source_count} points, not swapping "
+                  "(writes still arriving? re-run to resume)")
+            return False
+
+        previous = main.swap_alias(collection_name, entry["shadow"])
+        entry.update(status="swapped", previous=previous, swapped_at=time.time())
+        save_state(state)
+        if previous:
+            # Writes that reached the old collection between the last catch-up and the swap
+            missing, _ = rebuilder.catch_up(previous, delete_extra=False)
+            if missing:
+                print(f"   {collection_name}: copied {missing} points written during the swap")
+        save_state(state)
+
+    print(f"✅ {collection_name}: {entry['copied']} points, {entry['embedded']} embedded "
+          f"({entry['skipped']} without text), {chunks_per_second(entry)} chunks/s, alias -> {entry['shadow']}")
+    return True
+
+
+def rollback(collection_name, state):
+    entry = state.get(collection_name)
+    if not entry or not entry.get("previous") or not main.qdrant_client.collection_exists(entry["previous"]):
+        print(f"❌ {collection_name}: no replaced collection to roll back to")
+        return False
+    main.swap_alias(collection_name, entry["previous"])
+    entry["status"] = "rolled_back"
+    save_state(state)
+    print(f"↩️  {collection_name}: alias -> {entry['previous']} ({entry['shadow']} kept)")
+    return True
+
+
+def drop_old(collection_name, state):
+    entry = state.get(collection_name)
+    if not entry or entry["status"] != "swapped":
+        print(f"❌ {collection_name}: not swapped, nothing to drop")
+        return False
+    if entry.get("previous") and main.qdrant_client.collection_exists(entry["previous"]):
+        main.qdrant_client.delete_collection(entry["previous"])
+        print(f"🗑️  {collection_name}: dropped {entry['previous']}")
+    entry.update(status="done", previous=None)
+    save_state(state)
+    return True
+
+
+def print_status(state):
+    for collection_name, entry in sorted(state.items()):
+        print(f"{collection_name}: {entry['status']}, {entry['copied']} points, {entry['embedded']} embedded, "
+              f"{chunks_per_second(entry)} chunks/s, shadow {entry['shadow']}, previous {entry.get('previous')}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Re-embed collections into shadow collections and swap aliases")
+    parser.add_argument("collections", nargs="*", help="Collections (alias names) to re-embed")
+    parser.add_argument("--all", action="store_true", help="Every collection the server uses")
+    parser.add_argument("--rate", type=float, default=REEMBED_RATE, help="Chunks embedded per second")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--drop-vectors", action="store_true",
+                        help="Leave out vectors the current settings don't use (old servers can't search the result)")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the plan")
+    parser.add_argument("--status", action="store_true", help="Show saved progress")
+    parser.add_argument("--rollback", action="store_true", help="Point the alias back at the replaced collection")
+    parser.add_argument("--drop-old", action="store_true", help="Delete replaced collections after a swap")
+    parser.add_argument("--migrate-legacy", action="store_true",
+                        help="Only move pre-alias collections behind an alias of their own name")
+    args = parser.parse_args()
+
+    state = load_state()
+    if args.status:
+        print_status(state)
+        sys.exit(0)
+    if not args.collections and not args.all:
+        parser.error("name the collections to re-embed or pass --all")
+    names = args.collections or main.tenant_collections()
+
+    failures = 0
+    for name in names:
+        if args.rollback:
+            failures += not rollback(name, state)
+        elif args.drop_old:
+            failures += not drop_old(name, state)
+        elif args.migrate_legacy:
+            if main.is_legacy_collection(name):
+                failures += not migrate_legacy(name, state, args.batch_size)
+            else:
+                print(f"✅ {name}: already behind an alias")
+        elif args.dry_run:
+            copy, embed, _ = plan(name, args.drop_vectors)
+            points = main.qdrant_client.count(name, exact=True).count
+            eta = points / args.rate if embed else 0
+            legacy = " (pre-alias, moved behind an alias first)" if main.is_legacy_collection(name) else ""
+            print(f"{name}{legacy}: {points} points, copy {sorted(copy)}, embed {[p.name for p in embed]}, ~{eta:.0f}s at {args.rate}/s")
+        else:
+            failures += not reembed(name, state, args)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Move existing Qdrant collections onto storage profiles (see storage_profiles.py).
+
+Without --profile each collection gets the profile matching its size
+(PROFILE_LARGE_THRESHOLD / PROFILE_ARCHIVE_THRESHOLD). Qdrant applies the
+change in the background by re-optimizing segments; search keeps working.
+Missing payload indexes (tenantId, personaId, filename, s3Key) are created too.
+
+Usage:
+  python reprofile_collections.py --dry-run
+  python reprofile_collections.py tenant_acme --profile large
+  python reprofile_collections.py --all
+"""
+
+import argparse
+
+import main
+import storage_profiles
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Apply storage profiles to existing collections")
+    parser.add_argument("collections", nargs="*", help="Collections to re-profile")
+    parser.add_argument("--all", action="store_true", help="Re-profile every collection")
+    parser.add_argument("--profile", choices=sorted(storage_profiles.PROFILES),
+                        help="Force a profile instead of choosing by size")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the plan")
+    args = parser.parse_args()
+
+    if not args.collections and not args.all:
+        parser.error("name the collections to re-profile or pass --all")
+
+    names = args.collections or main.tenant_collections()
+    total_before = total_after = 0.0
+
+    for name in names:
+        info = main.qdrant_client.get_collection(name)
+        points = info.points_count or 0
+        sizes = storage_profiles.vector_sizes(info)
+        vector_size = sum(sizes.values())
+        current = storage_profiles.profile_from_collection(info)
+        target = args.profile or storage_profiles.profile_for_size(points)
+        if not args.dry_run:
+            main.ensure_payload_indexes(name)
+
+        before = storage_profiles.estimated_vector_memory_mb(current, points, vector_size)
+        after = storage_profiles.estimated_vector_memory_mb(target, points, vector_size)
+        total_before += before
+        total_after += after
+
+        if current == target and not args.profile:
+            print(f"✅ {name}: {points} points, already '{current}' (~{before:.1f} MB)")
+            continue
+
+        print(f"🔧 {name}: {points} points, '{current}' -> '{target}' (~{before:.1f} MB -> ~{after:.1f} MB)")
+        if args.dry_run:
+            continue
+
+        # The shared collection keeps its per-tenant HNSW layout
+        overrides = main.SHARED_HNSW_OVERRIDES if name == main.SHARED_COLLECTION else None
+        main.qdrant_client.update_collection(
+            collection_name=name,
+            **storage_profiles.update_collection_kwargs(target, sizes.keys(), overrides),
+        )
+
+    print(f"\nEstimated vector RAM: ~{total_before:.1f} MB -> ~{total_after:.1f} MB")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,221 @@
+"""
+Resilient Bedrock (and Ollama) invocation: deadlines, adaptive retries,
+hedged embeddings and latency tracking for model fallback.
+
+  Deadline      - absolute time budget for a chat turn or an embedding;
+                  retries, hedges and fallbacks never run past it. The HTTP
+                  bridge turns the caller's X-Deadline-Ms into a request
+                  deadline; stage budgets are children of it, and cancelling
+                  it (client gone) stops model calls already in worker threads
+  RetryBudget   - retries spend tokens, successes earn a fraction back, so a
+                  sustained throttle storm turns retries off instead of
+                  multiplying load (same idea as the AWS SDK retry quota)
+  CallPolicy    - retryable errors (throttling, 5xx, timeouts) are retried
+                  with full-jitter backoff; embeddings can be hedged: when
+                  the first attempt is still running after the observed p95,
+                  a second identical request is sent and the first answer wins
+  LatencyTracker - rolling per-key latency window (p95 for hedge delays and
+                   for deciding whether a model still fits the deadline)
+
+botocore's own retries are disabled on the Bedrock client so this layer
+owns every retry decision.
+"""
+
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from metrics import BEDROCK_RETRIES, HEDGED_REQUESTS
+
+DEADLINE_HEADER = "X-Deadline-Ms"
+# Deadline of the call being served (set by the HTTP bridge)
+deadline_var = contextvars.ContextVar("deadline", default=None)
+
+EMBED_DEADLINE = float(os.getenv("EMBED_DEADLINE", "5"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "2"))
+HEDGE_EMBEDDINGS = os.getenv("HEDGE_EMBEDDINGS", "on") == "on"
+# Delay before the hedge: observed p95, clamped, and the default until enough samples exist
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.02"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "0.25"))
+# At most this fraction of calls may be hedged
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+
+RETRYABLE_CODES = {
+    "ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException",
+    "InternalServerException", "ModelNotReadyException", "ModelTimeoutException",
+}
+RETRYABLE_NAMES = {
+    "ReadTimeoutError", "ConnectTimeoutError", "EndpointConnectionError", "ConnectionClosedError",
+    "ReadTimeout", "ConnectTimeout", "ConnectionError", "ChunkedEncodingError",
+}
+
+
+class DeadlineExceeded(Exception):
+    """The call's time budget ran out."""
+
+
+class Deadline:
+    def __init__(self, seconds: float, parent: Optional["Deadline"] = None):
+        self.expires_at = time.monotonic() + seconds
+        self.parent = parent
+        self._cancelled = False
+
+    def cancel(self):
+        """Expire now, along with every child (the caller is gone)."""
+        self._cancelled = True
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled or (self.parent is not None and self.parent.cancelled)
+
+    def remaining(self) -> float:
+        if self.cancelled:
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def child(self, seconds: float) -> "Deadline":
+        """A sub-budget that never outlives this one."""
+        return Deadline(min(seconds, self.remaining()), parent=self)
+
+
+def request_deadline(seconds: float) -> Deadline:
+    """A stage budget of `seconds`, capped by (and cancelled with) the request deadline."""
+    parent = deadline_var.get()
+    return parent.child(seconds) if parent is not None else Deadline(seconds)
+
+
+def check_deadline(stage: str):
+    """Don't start `stage` once the request deadline has passed or the caller has gone."""
+    deadline = deadline_var.get()
+    if deadline is not None and deadline.expired:
+        raise DeadlineExceeded(f"request deadline passed before {stage}")
+
+
+def error_reason(error: Exception) -> Optional[str]:
+    """Short reason if the error is worth retrying (throttle, 5xx, timeout), else None."""
+    response = getattr(error, "response", None)
+    code = response.get("Error", {}).get("Code") if isinstance(response, dict) else None
+    if code in RETRYABLE_CODES:
+        return "throttled" if "Throttl" in code or "TooMany" in code else "unavailable"
+    if type(error).__name__ in RETRYABLE_NAMES:
+        return "timeout"
+    return None
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: str, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class RetryBudget:
+    """Token bucket for retries and hedges: spend 1 per extra request, earn `refill` per success."""
+
+    def __init__(self, capacity: float = 10.0, refill: float = 0.1):
+        self.capacity = capacity
+        self.refill = refill
+        self.tokens = capacity
+        self._lock = threading.Lock()
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def earn(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.refill)
+
+
+class CallPolicy:
+    def __init__(self, tracker: LatencyTracker, max_attempts: int = RETRY_MAX_ATTEMPTS,
+                 hedge_ratio: float = HEDGE_MAX_RATIO, hedge_workers: int = 16):
+        self.tracker = tracker
+        self.max_attempts = max_attempts
+        self.retry_budget = RetryBudget()
+        self.hedge_budget = RetryBudget(capacity=5.0, refill=hedge_ratio)
+        self._pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="hedge")
+
+    def hedge_delay(self, key: str) -> float:
+        p95 = self.tracker.percentile(key, 95)
+        return HEDGE_DEFAULT_DELAY if p95 is None else max(HEDGE_MIN_DELAY, p95)
+
+    def timed(self, key: str, fn: Callable):
+        start = time.perf_counter()
+        result = fn()
+        self.tracker.observe(key, time.perf_counter() - start)
+        return result
+
+    def _hedged(self, key: str, fn: Callable, deadline: Deadline):
+        first = self._pool.submit(self.timed, key, fn)
+        futures = [first]
+        done, _ = wait(futures, timeout=min(self.hedge_delay(key), deadline.remaining()))
+        if not done and not deadline.expired and self.hedge_budget.spend():
+            HEDGED_REQUESTS.labels(kind=key, result="sent").inc()
+            futures.append(self._pool.submit(self.timed, key, fn))
+
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"{key} exceeded its deadline")
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        HEDGED_REQUESTS.labels(kind=key, result="won").inc()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, key: str, fn: Callable, deadline: Deadline, hedge: bool = False):
+        """Run fn() with retries (and optionally a hedge) inside the deadline."""
+        attempt = 0
+        while True:
+            if deadline.expired:
+                raise DeadlineExceeded(f"{key} deadline passed")
+            try:
+                if hedge:
+                    result = self._hedged(key, fn, deadline)
+                else:
+                    result = self.timed(key, fn)
+                self.retry_budget.earn()
+                self.hedge_budget.earn()
+                return result
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                reason = error_reason(e)
+                attempt += 1
+                if reason is None or attempt >= self.max_attempts:
+                    raise
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+                if delay >= deadline.remaining() or not self.retry_budget.spend():
+                    raise
+                BEDROCK_RETRIES.labels(kind=key, reason=reason).inc()
+                time.sleep(delay)
@@ -0,0 +1,142 @@
+"""
+Retrieval-necessity gate: decides whether a chat turn needs a knowledge base search.
+
+Heuristics run first and catch greetings, thanks/acknowledgements and
+rewrite requests about the previous answer ("rephrase that shorter").
+A bare "yes"/"no"/"sure" that answers a question the assistant just asked
+is not small talk: it is retrieved with the previous user and assistant turn
+as the search query (follow_up_query). Anything the heuristics can't place
+is sent to retrieval, unless the
+optional local classifier (RETRIEVAL_GATE_MODEL=local) is confident it
+is small talk. When in doubt the gate always retrieves.
+"""
+
+import math
+import os
+import re
+from typing import List, Optional, Tuple
+
+from metrics import log
+
+RETRIEVAL_GATE = os.getenv("RETRIEVAL_GATE", "on") == "on"
+RETRIEVAL_GATE_MODEL = os.getenv("RETRIEVAL_GATE_MODEL", "")
+RETRIEVAL_GATE_THRESHOLD = float(os.getenv("RETRIEVAL_GATE_THRESHOLD", "0.1"))
+
+SMALL_TALK = re.compile(
+    r"^(hi|hello|hey|hiya|yo|good (morning|afternoon|evening)|thanks?( you)?( so much| a lot)?|thx|ty|"
+    r"ok(ay)?|k|cool|great|nice|awesome|perfect|got it|understood|sounds good|bye|goodbye|see you|"
+    r"cheers|yes|no|yep|nope|sure|lol|haha|:\)|👍)"
+    r"([ ,]+(there|again|team|bot|twin|mate))?[\s!.?]*$",
+    re.IGNORECASE,
+)
+
+# Small talk on its own, but an answer when the assistant's last turn asked a question
+CONFIRMATION = re.compile(r"^(yes|no|yep|nope|sure|ok(ay)?|k)([ ,]+please)?[\s!.]*$", re.IGNORECASE)
+# Characters of the assistant's question kept in a follow-up's search query
+FOLLOW_UP_CHARS = 1000
+
+# Requests that only transform the previous answer
+REWRITE = re.compile(
+    r"^(please |can you |could you )?(re-?phrase|rewrite|re-?word|shorten|summari[sz]e|simplify|translate|"
+    r"make (it|that|this) (shorter|longer|simpler|clearer|more \w+|less \w+)|"
+    r"(say|explain) (it|that|this) (again|differently|more simply)|"
+    r"(in|as) (bullet points|a table|a list|one sentence)|tl;?dr|shorter|more concise)\b",
+    re.IGNORECASE,
+)
+REWRITE_TARGET = re.compile(r"\b(it|that|this|above|previous|your (answer|response|reply|last))\b", re.IGNORECASE)
+
+SMALL_TALK_EXAMPLES = [
+    "hi there", "thanks a lot", "how are you today", "good morning", "you are awesome",
+    "ok great", "what is your name", "have a nice day", "that was helpful, thank you",
+]
+KNOWLEDGE_EXAMPLES = [
+    "what was our Q4 revenue", "how many units are in stock", "what is the price of the 2 inch pipe",
+    "summarize the strategic plan", "who is the head of engineering", "what is our refund policy",
+    "compare sales between regions", "list our main products",
+]
+
+
+def _last(messages: Optional[List[dict]], role: str) -> str:
+    for message in reversed(messages or []):
+        if message.get("role") == role and isinstance(message.get("content"), str):
+            return message["content"].strip()
+    return ""
+
+
+def asked_question(messages: Optional[List[dict]]) -> bool:
+    """Whether the last assistant turn ends by asking the user something."""
+    last = _last(messages, "assistant")
+    return "?" in last[-200:]
+
+
+def follow_up_query(messages: Optional[List[dict]]) -> str:
+    """Search query for a short answer to the assistant's question: the previous user turn and the question."""
+    return f"{_last(messages, 'user')}\n{_last(messages, 'assistant')[-FOLLOW_UP_CHARS:]}".strip()
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class RetrievalGate:
+    def __init__(self, embed_fn=None, threshold: float = RETRIEVAL_GATE_THRESHOLD):
+        # embed_fn(text) -> vector; only used for turns the heuristics leave undecided
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self._prototypes = None
+
+    def warm(self):
+        """Load the classifier model and embed the prototypes ahead of the first undecided turn."""
+        if self.embed_fn and self._prototypes is None:
+            self._prototypes = (
+                [self.embed_fn(t) for t in SMALL_TALK_EXAMPLES],
+                [self.embed_fn(t) for t in KNOWLEDGE_EXAMPLES],
+            )
+
+    def _classifier_margin(self, query: str) -> float:
+        """Max similarity to small talk minus max similarity to knowledge questions."""
+        self.warm()
+        vector = self.embed_fn(query)
+        small_talk, knowledge = self._prototypes
+        return max(_cosine(vector, p) for p in small_talk) - max(_cosine(vector, p) for p in knowledge)
+
+    def decide(self, query: str, messages: Optional[List[dict]] = None) -> Tuple[bool, str]:
+        """Return (needs_retrieval, reason)."""
+        text = (query or "").strip()
+        if not text:
+            return False, "empty"
+        if CONFIRMATION.match(text) and asked_question(messages):
+            return True, "follow_up"
+        if SMALL_TALK.match(text):
+            return False, "small_talk"
+        has_history = any(m.get("role") == "assistant" for m in (messages or []))
+        # "summarize that" / "shorter" skip retrieval; "summarize the strategic plan" does not
+        if has_history and REWRITE.match(text) and (len(text.split()) <= 2 or REWRITE_TARGET.search(text)):
+            return False, "rewrite"
+        if self.embed_fn and len(text.split()) <= 12 and "?" not in text and not re.search(r"\d", text):
+            try:
+                if self._classifier_margin(text) > self.threshold:
+                    return False, "classifier"
+            except Exception as e:
+                log(f"Retrieval gate classifier failed, retrieving: {e}")
+        return True, "default"
+
+
+def build_gate() -> Optional[RetrievalGate]:
+    """Gate configured from the environment, or None when disabled."""
+    if not RETRIEVAL_GATE:
+        return None
+    if RETRIEVAL_GATE_MODEL != "local":
+        return RetrievalGate()
+    from embeddings import LocalProvider
+    model_id = os.getenv("RETRIEVAL_GATE_EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
+    provider = []
+
+    def embed_fn(text):
+        # The ONNX model loads on first use (or during warmup), not at import
+        if not provider:
+            provider.append(LocalProvider(model_id))
+        return provider[0].embed(text)[0]
+    return RetrievalGate(embed_fn)
@@ -0,0 +1,106 @@
+"""
+Single-flight request coalescing.
+
+Concurrent calls with the same key share one in-flight execution: the
+first caller starts the work, later callers await the same task. The
+task is shielded, so a caller that goes away does not cancel the work
+for everyone else waiting on it. The shared work runs under the first
+caller's request deadline (stage budgets and Qdrant timeouts derive from
+it); a later caller waits no longer than its own deadline, and runs the
+work itself if the shared run ran out of the first caller's time while
+its own has some left. Nothing is cached once the call completes; this
+only collapses simultaneous duplicates.
+
+TTLCache keeps a result for a few seconds after it completes, for work
+started ahead of the caller that needs it (a prefetched query embedding).
+"""
+
+import asyncio
+import contextvars
+import re
+import time
+
+from metrics import COALESCED_CALLS
+from resilience import DeadlineExceeded, deadline_var
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a query for coalescing keys."""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+class SingleFlight:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._inflight = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """Run `fn()` (a coroutine factory) once per key among concurrent callers."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            COALESCED_CALLS.labels(kind=self.kind, result="coalesced").inc()
+            return await self._join(task, fn)
+
+        self.executed += 1
+        COALESCED_CALLS.labels(kind=self.kind, result="executed").inc()
+        # Runs in a copy of this caller's context, request deadline included
+        task = asyncio.get_running_loop().create_task(fn(), context=contextvars.copy_context())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _join(self, task, fn):
+        """Await another caller's run within this caller's own deadline."""
+        deadline = deadline_var.get()
+        if deadline is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("request deadline passed waiting for a coalesced call")
+        except DeadlineExceeded:
+            # The first caller's deadline was shorter (or it went away); retry on ours
+            if deadline.expired:
+                raise
+            return await fn()
+
+    def stats(self) -> dict:
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        if len(self._entries) >= self.max_entries:
+            self._entries = {k: e for k, e in self._entries.items() if e[0] > now}
+            while len(self._entries) >= self.max_entries:
+                # Oldest insertion first
+                self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (now + self.ttl, value)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Qdrant snapshots in S3, fast tenant restore and template cloning.
+
+  upload   - snapshot a tenant's collection and stream it from Qdrant's REST
+             API straight into a multipart S3 upload (no local copy), with
+             the tenant's tabular SQLite store and a JSON manifest next to it
+  restore  - recover a tenant's collection from its latest (or a named)
+             snapshot: Qdrant downloads it itself from a presigned URL, so
+             nothing passes through this process and nothing is re-embedded
+  clone    - provision a new tenant from a template tenant: the template's
+             collection is snapshotted and recovered under the new name
+             (per-tenant mode), or its points are copied with their vectors
+             (shared mode, or --method copy); tenantId is rewritten and every
+             point records clonedFrom. No Bedrock calls are made.
+  list     - snapshots stored for a tenant
+
+Snapshots live under s3://$SNAPSHOT_BUCKET/$SNAPSHOT_PREFIX/<tenant>/. Cloned
+chunks keep the template's s3Key/docVersion, so they point at the template's
+documents; reconcile_s3.py treats them like any other indexed source.
+
+Per-collection snapshots need TENANCY_MODE=collection; in shared mode a tenant
+is only a filter, so clone copies points and upload/restore are refused.
+The same holds for VECTOR_BACKEND=mmap, which has no Qdrant snapshots.
+
+Usage:
+  python snapshots.py upload tenant-template
+  python snapshots.py restore tenant-acme
+  python snapshots.py restore tenant-acme --snapshot tenant_acme-....snapshot
+  python snapshots.py clone tenant-template tenant-newco
+  python snapshots.py clone tenant-template tenant-newco --from-s3
+  python snapshots.py list tenant-template
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from qdrant_client.http import models
+
+import main
+import storage_profiles
+import tabular_store
+
+SNAPSHOT_BUCKET = os.getenv("SNAPSHOT_BUCKET") or os.getenv("S3_BUCKET")
+SNAPSHOT_PREFIX = os.getenv("SNAPSHOT_PREFIX", "_snapshots").strip("/")
+S3_ENDPOINT = os.getenv("S3_ENDPOINT") or os.getenv("AWS_S3_ENDPOINT")
+# S3 endpoint as Qdrant sees it, for presigned download URLs (LocalStack: http://localstack:4566)
+SNAPSHOT_FETCH_ENDPOINT = os.getenv("SNAPSHOT_FETCH_ENDPOINT") or S3_ENDPOINT
+QDRANT_REST_URL = os.getenv("QDRANT_REST_URL", f"http://{main.QDRANT_HOST}:6333").rstrip("/")
+# Qdrant's snapshots_path inside its container; clones recover from here without leaving Qdrant
+QDRANT_SNAPSHOTS_PATH = os.getenv("QDRANT_SNAPSHOTS_PATH", "/qdrant/snapshots")
+PRESIGN_SECONDS = 3600
+CLONE_BATCH = 256
+
+TRANSFER = TransferConfig(multipart_chunksize=64 * 1024 * 1024, max_concurrency=4)
+
+
+def s3_client(endpoint_url=None):
+    return boto3.client("s3", endpoint_url=endpoint_url or S3_ENDPOINT)
+
+
+def snapshot_key(tenant_id, name, suffix=""):
+    return f"{SNAPSHOT_PREFIX}/{tenant_id}/{name}{suffix}"
+
+
+def require_collection_mode(action):
+    if main.TENANCY_MODE == "shared":
+        raise ValueError(f"{action} needs TENANCY_MODE=collection; in shared mode a tenant has no collection of its own")
+    if main.VECTOR_BACKEND == "mmap":
+        raise ValueError(f"{action} needs Qdrant; VECTOR_BACKEND=mmap has no snapshots")
+
+
+def point_count(collection_name, tenant_id=None):
+    count_filter = main.tenant_filter(tenant_id) if tenant_id else None
+    return main.qdrant_client.count(collection_name, count_filter=count_filter, exact=True).count
+
+
+def forget_collection(collection_name):
+    """Drop per-process caches for a collection whose contents were replaced underneath them."""
+    main._collection_info_cache.pop(collection_name, None)
+    main._indexed_collections.discard(collection_name)
+
+
+def recover_target(collection_name):
+    """Collection a snapshot is recovered into: a fresh one to swap the alias onto, or the name itself."""
+    return main.physical_collection_name(collection_name) if main.COLLECTION_ALIASES else collection_name
+
+
+def publish(collection_name, recovered):
+    """Make a recovered collection live under collection_name; the one it replaces is dropped."""
+    if recovered != collection_name and main.is_legacy_collection(collection_name):
+        # Being replaced by the snapshot anyway: no copy to keep, the name just becomes an alias
+        main.adopt_legacy_collection(collection_name, recovered)
+    elif recovered != collection_name:
+        previous = main.swap_alias(collection_name, recovered)
+        if previous:
+            main.qdrant_client.delete_collection(previous)
+    forget_collection(collection_name)
+
+
+def upload(s3, bucket, tenant_id):
+    """Snapshot the tenant's collection into S3; returns the manifest."""
+    require_collection_mode("upload")
+    # Snapshots belong to the physical collection behind the alias
+    collection_name = main.resolve_collection(main.collection_for_tenant(tenant_id))
+    started = time.perf_counter()
+    snapshot = main.qdrant_client.create_snapshot(collection_name=collection_name, wait=True)
+    try:
+        url = f"{QDRANT_REST_URL}/collections/{collection_name}/snapshots/{snapshot.name}"
+        # The response body is read in multipart-sized pieces and uploaded as it arrives
+        with urllib.request.urlopen(url) as response:
+            s3.upload_fileobj(response, bucket, snapshot_key(tenant_id, snapshot.name), Config=TRANSFER)
+    finally:
+        main.qdrant_client.delete_snapshot(collection_name=collection_name, snapshot_name=snapshot.name)
+
+    manifest = {
+        "tenant": tenant_id,
+        "collection": collection_name,
+        "snapshot": snapshot.name,
+        "size": snapshot.size,
+        "checksum": getattr(snapshot, "checksum", None),
+        "points": point_count(collection_name),
+        "embedding": main.embedder.name,
+        "tabular": None,
+        "created_at": time.time(),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tabular.sqlite")
+        if tabular_store.backup(tenant_id, path):
+            manifest["tabular"] = snapshot_key(tenant_id, snapshot.name, ".tabular.sqlite")
+            s3.upload_file(path, bucket, manifest["tabular"])
+    s3.put_object(
+        Bucket=bucket, Key=snapshot_key(tenant_id, snapshot.name, ".json"),
+        Body=json.dumps(manifest).encode("utf-8"), ContentType="application/json",
+    )
+    manifest["seconds"] = round(time.perf_counter() - started, 2)
+    return manifest
+
+
+def list_snapshots(s3, bucket, tenant_id):
+    """Manifests stored for a tenant, oldest first."""
+    manifests = []
+    prefix = f"{SNAPSHOT_PREFIX}/{tenant_id}/"
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".json"):
+                body = s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+                manifests.append(json.loads(body))
+    return sorted(manifests, key=lambda m: m["created_at"])
+
+
+def find_manifest(s3, bucket, tenant_id, name=None):
+    manifests = list_snapshots(s3, bucket, tenant_id)
+    if name:
+        manifests = [m for m in manifests if m["snapshot"] == name]
+    if not manifests:
+        raise LookupError(f"no snapshot {name or 'found'} for {tenant_id} in s3://{bucket}/{SNAPSHOT_PREFIX}/{tenant_id}/")
+    return manifests[-1]
+
+
+def recover_from_s3(fetch_s3, bucket, manifest, collection_name):
+    """Have Qdrant download and recover the snapshot into collection_name (replacing it)."""
+    location = fetch_s3.generate_presigned_url(
+        "get_object", Params={"Bucket": bucket, "Key": snapshot_key(manifest["tenant"], manifest["snapshot"])},
+        ExpiresIn=PRESIGN_SECONDS,
+    )
+    main.qdrant_client.recover_snapshot(
+        collection_name=collection_name, location=location, checksum=manifest.get("checksum"),
+        priority=models.SnapshotPriority.SNAPSHOT, wait=True,
+    )
+
+
+def download_tabular(s3, bucket, manifest, tenant_id):
+    if not manifest.get("tabular"):
+        return False
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tabular.sqlite")
+        s3.download_file(bucket, manifest["tabular"], path)
+        tabular_store.restore(tenant_id, path)
+    return True
+
+
+def restore(s3, fetch_s3, bucket, tenant_id, name=None):
+    """Recover a tenant's collection (and tabular store) from S3; returns the manifest used."""
+    require_collection_mode("restore")
+    manifest = find_manifest(s3, bucket, tenant_id, name)
+    started = time.perf_counter()
+    collection_name = main.collection_for_tenant(tenant_id)
+    # Behind an alias the restore is a swap: searches see the old contents until the new ones are ready
+    recovered = recover_target(collection_name)
+    recover_from_s3(fetch_s3, bucket, manifest, recovered)
+    publish(collection_name, recovered)
+    main.ensure_payload_indexes(collection_name)
+    download_tabular(s3, bucket, manifest, tenant_id)
+    return {**manifest, "restored_points": point_count(collection_name),
+            "seconds": round(time.perf_counter() - started, 2)}
+
+
+def retag(collection_name, template_id, tenant_id):
+    """Point every point of a recovered collection at its new tenant."""
+    main.qdrant_client.set_payload(
+        collection_name=collection_name,
+        payload={main.TENANT_KEY: tenant_id, "clonedFrom": template_id},
+        points=models.Filter(),
+        wait=True,
+    )
+
+
+def clone_snapshot(template_id, tenant_id, target):
+    """Snapshot the template inside Qdrant and recover it as `target`."""
+    source = main.resolve_collection(main.collection_for_tenant(template_id))
+    snapshot = main.qdrant_client.create_snapshot(collection_name=source, wait=True)
+    try:
+        main.qdrant_client.recover_snapshot(
+            collection_name=target,
+            location=f"file://{QDRANT_SNAPSHOTS_PATH}/{source}/{snapshot.name}",
+            priority=models.SnapshotPriority.SNAPSHOT,
+            wait=True,
+        )
+    finally:
+        main.qdrant_client.delete_snapshot(collection_name=source, snapshot_name=snapshot.name)
+    retag(target, template_id, tenant_id)
+
+
+def clone_copy(template_id, tenant_id, batch_size=CLONE_BATCH):
+    """Copy the template's points (vectors included) to the new tenant; returns points copied."""
+    source = main.collection_for_tenant(template_id)
+    target = main.collection_for_tenant(tenant_id)
+    if source != target:
+        # Same named vectors and profile as the template, so the vectors fit as they are
+        info = main.qdrant_client.get_collection(source)
+        main.create_collection(
+            target,
+            **storage_profiles.create_collection_kwargs(
+                storage_profiles.profile_from_collection(info), storage_profiles.vector_sizes(info)
+            ),
+        )
+    main.ensure_payload_indexes(target)
+
+    copied, offset = 0, None
+    while True:
+        points, offset = main.qdrant_client.scroll(
+            collection_name=source, scroll_filter=main.tenant_filter(template_id),
+            limit=batch_size, offset=offset, with_payload=True, with_vectors=True,
+        )
+        if points:
+            main.qdrant_client.upsert(collection_name=target, wait=True, points=[
+                models.PointStruct(
+                    # Deterministic: re-running an interrupted clone overwrites instead of duplicating
+                    id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{tenant_id}/clone/{point.id}")),
+                    vector=point.vector,
+                    payload={**(point.payload or {}), main.TENANT_KEY: tenant_id, "clonedFrom": template_id},
+                )
+                for point in points
+            ])
+            copied += len(points)
+        if offset is None:
+            return copied
+
+
+def clone(template_id, tenant_id, method="auto", s3=None, fetch_s3=None, bucket=None):
+    """Provision tenant_id with the template's knowledge and tables; no embeddings are computed."""
+    if template_id == tenant_id:
+        raise ValueError("template and new tenant must differ")
+    target = main.collection_for_tenant(tenant_id)
+    if main.TENANCY_MODE == "shared":
+        if point_count(target, tenant_id):
+            raise ValueError(f"{tenant_id} already has points; delete them before cloning")
+        method = "copy"
+    elif main.qdrant_client.collection_exists(target):
+        raise ValueError(f"collection {target} already exists; delete it before cloning")
+    if main.VECTOR_BACKEND == "mmap":
+        method = "copy"
+    if method == "auto":
+        method = "s3" if s3 is not None else "snapshot"
+
+    started = time.perf_counter()
+    tables = False
+    if method == "s3":
+        manifest = find_manifest(s3, bucket, template_id)
+        recovered = recover_target(target)
+        recover_from_s3(fetch_s3, bucket, manifest, recovered)
+        retag(recovered, template_id, tenant_id)
+        publish(target, recovered)
+        tables = download_tabular(s3, bucket, manifest, tenant_id)
+    elif method == "snapshot":
+        recovered = recover_target(target)
+        clone_snapshot(template_id, tenant_id, recovered)
+        publish(target, recovered)
+    else:
+        clone_copy(template_id, tenant_id)
+    main.ensure_payload_indexes(target)
+    if method != "s3":
+        tables = tabular_store.copy_tenant(template_id, tenant_id)
+    return {
+        "template": template_id,
+        "tenant": tenant_id,
+        "collection": target,
+        "method": method,
+        "points": point_count(target, tenant_id if main.TENANCY_MODE == "shared" else None),
+        "tabular": tables,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Qdrant snapshots in S3 and template tenant cloning")
+    parser.add_argument("--bucket", default=SNAPSHOT_BUCKET, help="Snapshot bucket (default: $SNAPSHOT_BUCKET or $S3_BUCKET)")
+    parser.add_argument("--endpoint-url", default=S3_ENDPOINT, help="S3 endpoint (LocalStack)")
+    parser.add_argument("--fetch-endpoint-url", default=SNAPSHOT_FETCH_ENDPOINT,
+                        help="S3 endpoint as reachable from Qdrant, for presigned URLs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("upload", help="Snapshot a tenant into S3")
+    command.add_argument("tenant")
+    command = commands.add_parser("restore", help="Recover a tenant from its S3 snapshot")
+    command.add_argument("tenant")
+    command.add_argument("--snapshot", help="Snapshot name (default: latest)")
+    command = commands.add_parser("clone", help="Provision a tenant from a template tenant")
+    command.add_argument("template")
+    command.add_argument("tenant")
+    command.add_argument("--method", choices=["auto", "snapshot", "copy"], default="auto",
+                         help="snapshot = recover a Qdrant snapshot, copy = scroll and upsert points")
+    command.add_argument("--from-s3", action="store_true", help="Clone from the template's latest S3 snapshot")
+    command = commands.add_parser("list", help="Snapshots stored for a tenant")
+    command.add_argument("tenant")
+    args = parser.parse_args()
+
+    needs_s3 = args.command != "clone" or args.from_s3
+    if needs_s3 and not args.bucket:
+        parser.error("--bucket (or SNAPSHOT_BUCKET / S3_BUCKET) is required")
+    s3 = s3_client(args.endpoint_url) if needs_s3 else None
+    fetch_s3 = s3_client(args.fetch_endpoint_url) if needs_s3 else None
+
+    try:
+        if args.command == "upload":
+            result = upload(s3, args.bucket, args.tenant)
+        elif args.command == "restore":
+            result = restore(s3, fetch_s3, args.bucket, args.tenant, args.snapshot)
+        elif args.command == "clone":
+            method = "s3" if args.from_s3 else args.method
+            result = clone(args.template, args.tenant, method, s3, fetch_s3, args.bucket)
+        else:
+            for manifest in list_snapshots(s3, args.bucket, args.tenant):
+                print(json.dumps(manifest))
+            sys.exit(0)
+    except (ValueError, LookupError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ {args.command}: {json.dumps(result)}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,194 @@
+"""
+Named Qdrant storage profiles for tenant collections.
+
+  small   - float32 vectors and HNSW in RAM, no quantization (best recall, small tenants)
+  large   - int8 scalar quantization in RAM, float32 originals on disk, rescoring
+  archive - binary quantization in RAM, originals and HNSW on disk, heavier oversampling
+
+Approximate RAM per million 1536-dim vectors (vectors only, excluding HNSW links):
+  small ~6.1 GB, large ~1.5 GB, archive ~0.2 GB
+
+Search params per profile can be overridden per tenant by tune_search.py,
+which measures recall against latency and writes SEARCH_TUNING_FILE.
+"""
+
+import json
+import os
+from typing import Optional
+
+from qdrant_client.http import models
+
+PROFILE_LARGE_THRESHOLD = int(os.getenv("PROFILE_LARGE_THRESHOLD", "20000"))
+PROFILE_ARCHIVE_THRESHOLD = int(os.getenv("PROFILE_ARCHIVE_THRESHOLD", "1000000"))
+# Per-tenant search params recommended by tune_search.py
+SEARCH_TUNING_FILE = os.getenv("SEARCH_TUNING_FILE", "/app/data/tuning/search_params.json")
+
+PROFILES = {
+    "small": {
+        "on_disk": False,
+        "quantization": None,
+        "hnsw": {"m": 16, "ef_construct": 100, "on_disk": False},
+        "memmap_threshold_kb": None,
+        "search": {"rescore": False, "oversampling": None},
+    },
+    "large": {
+        "on_disk": True,
+        "quantization": "scalar",
+        "hnsw": {"m": 16, "ef_construct": 128, "on_disk": False},
+        "memmap_threshold_kb": 20000,
+        "search": {"rescore": True, "oversampling": 2.0},
+    },
+    "archive": {
+        "on_disk": True,
+        "quantization": "binary",
+        "hnsw": {"m": 8, "ef_construct": 64, "on_disk": True},
+        "memmap_threshold_kb": 1000,
+        "search": {"rescore": True, "oversampling": 3.0},
+    },
+}
+
+
+def get_profile(name: str) -> dict:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown storage profile '{name}'. Choose from: {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def profile_for_size(points_count: int) -> str:
+    """Pick a profile from the number of points in a collection."""
+    if points_count >= PROFILE_ARCHIVE_THRESHOLD:
+        return "archive"
+    if points_count >= PROFILE_LARGE_THRESHOLD:
+        return "large"
+    return "small"
+
+
+def quantization_config(name: str):
+    kind = get_profile(name)["quantization"]
+    if kind == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if kind == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def hnsw_config(name: str, overrides: Optional[dict] = None) -> models.HnswConfigDiff:
+    return models.HnswConfigDiff(**{**get_profile(name)["hnsw"], **(overrides or {})})
+
+
+def optimizers_config(name: str) -> Optional[models.OptimizersConfigDiff]:
+    threshold = get_profile(name)["memmap_threshold_kb"]
+    if threshold is None:
+        return None
+    return models.OptimizersConfigDiff(memmap_threshold=threshold)
+
+
+def vector_sizes(info) -> dict:
+    """Map of vector name -> size for a collection ("" is the legacy unnamed vector)."""
+    vectors = info.config.params.vectors
+    if isinstance(vectors, models.VectorParams):
+        return {"": vectors.size}
+    return {name: params.size for name, params in (vectors or {}).items()}
+
+
+def create_collection_kwargs(name: str, vectors: dict, hnsw_overrides: Optional[dict] = None) -> dict:
+    """Keyword arguments for QdrantClient.create_collection under a profile.
+
+    `vectors` maps named vector -> size, one entry per embedding model.
+    """
+    profile = get_profile(name)
+    return {
+        "vectors_config": {
+            vector_name: models.VectorParams(size=size, distance=models.Distance.COSINE, on_disk=profile["on_disk"])
+            for vector_name, size in vectors.items()
+        },
+        "hnsw_config": hnsw_config(name, hnsw_overrides),
+        "quantization_config": quantization_config(name),
+        "optimizers_config": optimizers_config(name),
+    }
+
+
+def update_collection_kwargs(name: str, vector_names, hnsw_overrides: Optional[dict] = None) -> dict:
+    """Keyword arguments for QdrantClient.update_collection to move a collection onto a profile."""
+    profile = get_profile(name)
+    return {
+        "vectors_config": {
+            vector_name: models.VectorParamsDiff(on_disk=profile["on_disk"]) for vector_name in vector_names
+        },
+        "hnsw_config": hnsw_config(name, hnsw_overrides),
+        "quantization_config": quantization_config(name) or models.Disabled.DISABLED,
+        "optimizers_config": optimizers_config(name),
+    }
+
+
+def profile_from_collection(info) -> str:
+    """Infer which profile a collection is on from its quantization settings."""
+    quantization = info.config.quantization_config
+    if isinstance(quantization, models.BinaryQuantization):
+        return "archive"
+    if isinstance(quantization, models.ScalarQuantization):
+        return "large"
+    return "small"
+
+
+def search_params(name: str) -> Optional[models.SearchParams]:
+    """Search-time params for a profile (rescoring with oversampling on quantized profiles)."""
+    search = get_profile(name)["search"]
+    if not search["rescore"]:
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(rescore=True, oversampling=search["oversampling"])
+    )
+
+
+# (mtime, recommendations) of SEARCH_TUNING_FILE; re-read when tune_search.py rewrites it
+_tuning = (None, {})
+
+
+def load_tuning(path: str = SEARCH_TUNING_FILE) -> dict:
+    """{collection: {tenant: recommendation}} from tune_search.py; empty when it hasn't run."""
+    global _tuning
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return {}
+    if _tuning[0] != mtime:
+        try:
+            with open(path) as f:
+                _tuning = (mtime, json.load(f))
+        except (OSError, ValueError):
+            # A hand-edited file that doesn't parse: fall back to profile defaults
+            _tuning = (mtime, {})
+    return _tuning[1]
+
+
+def tuned_search_params(collection_name: str, tenant_id: Optional[str], profile: str,
+                        vector_name: Optional[str]) -> Optional[models.SearchParams]:
+    """Tuned params for a tenant's searches, or None when there are none or they are stale.
+
+    Only the tenant's own entry applies, or a "*" entry for the collection (added by hand;
+    also what warmup, which has no tenant, uses). A recommendation only holds for the profile
+    and embedding vector it was measured on; after re-profiling or re-embedding the profile
+    defaults apply until the next tuning run.
+    """
+    entries = load_tuning().get(collection_name, {})
+    entry = entries.get(tenant_id) if tenant_id else None
+    if entry is None:
+        entry = entries.get("*")
+    if entry is None or entry.get("profile") != profile or entry.get("vector") != (vector_name or ""):
+        return None
+    return models.SearchParams(**entry["params"])
+
+
+def estimated_vector_memory_mb(name: str, points_count: int, vector_size: int) -> float:
+    """RAM needed for the in-memory vector representation under a profile."""
+    kind = get_profile(name)["quantization"]
+    if kind == "scalar":
+        bytes_per_vector = vector_size
+    elif kind == "binary":
+        bytes_per_vector = vector_size / 8
+    else:
+        bytes_per_vector = vector_size * 4
+    return points_count * bytes_per_vector / (1024 * 1024)
@@ -0,0 +1,417 @@
+"""
+Structured-data fast path for tabular tenant documents.
+
+At ingest, documents that parse as tables are also loaded into a per-tenant
+SQLite database (one table per document, every column indexed):
+
+  csv / tsv      - delimited text (XLSX arrives as CSV, converted by the Lambda)
+  aligned        - whitespace-aligned columns under a header line
+  records        - "Key: value | Key: value" lines, as in inventory listings,
+                   with the enclosing section and item headings as columns
+
+Lookup and aggregate questions ("how many 2 inch GI pipes", "total stock of
+Tata Steel pipes", "price of 1 inch SS elbows") are then answered from the
+matched rows without an LLM call. When a question matches rows but isn't a
+plain lookup, only those rows are returned to be used as context.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+TABULAR_STORE_DIR = os.getenv("TABULAR_STORE_DIR", "/app/data/tabular")
+# Most rows a direct answer lists before falling back to LLM + row context
+TABULAR_MAX_DIRECT_ROWS = int(os.getenv("TABULAR_MAX_DIRECT_ROWS", "5"))
+TABULAR_MAX_CONTEXT_ROWS = int(os.getenv("TABULAR_MAX_CONTEXT_ROWS", "20"))
+MIN_TABLE_ROWS = 3
+
+NUMBER = re.compile(r"^[₹$€£]?\s*(\d[\d,]*(?:\.\d+)?|\.\d+)\s*(?:[a-zA-Z%]+\.?|/\s*\w+)*$")
+CURRENCY = re.compile(r"^\s*([₹$€£])\s*[\d.]")
+KV_PAIR = re.compile(r"^\s*([A-Za-z][\w ()./-]{0,40}?)\s*:\s*(.+?)\s*$")
+# "Elbows 90° - 1 inch: 850 pieces @ ₹45/piece"
+QTY_AT_PRICE = re.compile(r"^\s*[-•*]?\s*(.+?):\s*([\d,]+)\s*([a-zA-Z]+)?\s*@\s*([₹$€£]?\s*[\d,]+(?:\.\d+)?)(?:\s*/\s*\w+)?\s*$")
+SECTION = re.compile(r"^\s*SECTION\s+\w+\s*[-:]\s*(.+?)\s*$", re.IGNORECASE)
+ITEM_HEADING = re.compile(r"^\s*\d+\.\s+(.+?)\s*$")
+RULE = re.compile(r"^\s*[=\-_]{5,}\s*$")
+
+TOKEN = re.compile(r"[a-z0-9]+(?:[/.x][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "is", "are", "do", "does", "we", "our", "have",
+    "has", "what", "whats", "which", "how", "many", "much", "there", "any", "and", "or", "with",
+    "me", "tell", "show", "list", "all", "total", "sum", "count", "number", "available", "left",
+    "currently", "right", "now", "at", "by", "per", "it", "its", "i", "you", "can", "please",
+}
+QUANTITY_WORDS = {"stock", "quantity", "qty", "units", "unit", "pieces", "piece", "inventory", "count", "available", "many"}
+PRICE_WORDS = {"price", "cost", "rate", "much", "priced", "costs"}
+AGGREGATE = re.compile(r"\b(total|sum|overall|altogether|combined|in all)\b", re.IGNORECASE)
+QUANTITY_COLUMNS = ("stock", "quantity", "qty", "units", "count", "pieces", "inventory")
+PRICE_COLUMNS = ("price", "cost", "rate", "unit_price", "mrp")
+
+
+def _stem(token: str) -> str:
+    return token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+
+
+def token_list(text: str) -> List[str]:
+    return [_stem(t) for t in TOKEN.findall((text or "").lower())]
+
+
+def tokens(text: str) -> set:
+    return set(token_list(text))
+
+
+def _bigrams(words: List[str]) -> set:
+    return set(zip(words, words[1:]))
+
+
+def _column_name(raw: str) -> str:
+    name = re.sub(r"[^a-z0-9]+", "_", raw.strip().lower()).strip("_") or "col"
+    return name if not name[0].isdigit() else f"c_{name}"
+
+
+def _column_names(header: List[str]) -> List[str]:
+    """Column names for a header row; blank or repeated headers get a suffix (col, col_2, ...)."""
+    names = []
+    for raw in header:
+        name, n = _column_name(raw), 1
+        while name in names:
+            n += 1
+            name = f"{_column_name(raw)}_{n}"
+        names.append(name)
+    return names
+
+
+def _currencies(cells) -> dict:
+    """column -> currency symbol of its first amount written with one ('$12.50' -> '$')."""
+    found = {}
+    for column, raw in cells:
+        match = CURRENCY.match(str(raw or ""))
+        if match:
+            found.setdefault(column, match.group(1))
+    return found
+
+
+def _value(raw: str, column: str = ""):
+    """Number for bare numbers and for quantity/price cells ('450 pieces', '₹1,450/piece').
+
+    Other cells with units ('3 inch', '2.0mm') stay text so they remain searchable as written.
+    """
+    raw = (raw or "").strip()
+    match = NUMBER.match(raw)
+    numeric_column = column.startswith(QUANTITY_COLUMNS + PRICE_COLUMNS)
+    if match and (numeric_column or not re.search(r"[a-zA-Z]", raw)):
+        number = float(match.group(1).replace(",", ""))
+        return int(number) if number.is_integer() else number
+    return raw
+
+
+# --- parsing ---------------------------------------------------------------
+
+def _parse_delimited(text: str, delimiter: str):
+    reader = csv.reader(io.StringIO(text), delimiter=delimiter)
+    rows = [r for r in reader if any(cell.strip() for cell in r)]
+    if len(rows) <= MIN_TABLE_ROWS or len(rows[0]) < 2:
+        return None
+    width = len(rows[0])
+    if sum(len(r) == width for r in rows) < 0.9 * len(rows):
+        return None
+    columns = _column_names(rows[0])
+    body = [r for r in rows[1:] if len(r) == width]
+    currencies = _currencies((c, v) for r in body for c, v in zip(columns, r))
+    return columns, [{c: _value(v, c) for c, v in zip(columns, r)} for r in body], currencies
+
+
+def _parse_aligned(text: str):
+    lines = [l for l in text.splitlines() if l.strip() and not RULE.match(l)]
+    split = [re.split(r"\s{2,}|\t", l.strip()) for l in lines]
+    # Longest run of lines with the same column count (>= 3)
+    best, start = (0, 0), 0
+    for i in range(1, len(split) + 1):
+        if i == len(split) or len(split[i]) != len(split[start]):
+            if len(split[start]) >= 3 and i - start > best[1] - best[0]:
+                best = (start, i)
+            start = i
+    if best[1] - best[0] <= MIN_TABLE_ROWS:
+        return None
+    header, *body = split[best[0]:best[1]]
+    if any(isinstance(_value(c), (int, float)) for c in header):
+        return None
+    columns = _column_names(header)
+    currencies = _currencies((c, v) for r in body for c, v in zip(columns, r))
+    return columns, [{c: _value(v, c) for c, v in zip(columns, r)} for r in body], currencies
+
+
+def _parse_records(text: str):
+    """Key-value records grouped by blank lines, tagged with section and item headings."""
+    rows, current, currencies = [], {}, {}
+    section = item = ""
+
+    def flush():
+        nonlocal current
+        if len([k for k in current if k not in ("section", "item")]) >= 2:
+            rows.append(current)
+        current = {}
+
+    for line in text.splitlines():
+        if not line.strip():
+            flush()
+            continue
+        if RULE.match(line):
+            continue
+        if SECTION.match(line):
+            flush()
+            section, item = SECTION.match(line).group(1), ""
+            continue
+        qty = QTY_AT_PRICE.match(line)
+        if qty:
+            flush()
+            name, quantity, unit, price = qty.groups()
+            rows.append({"section": section, "item": f"{item} - {name}".strip(" -"),
+                         "stock": _value(quantity, "stock"), "unit": unit or "", "price": _value(price, "price")})
+            currencies = {**_currencies([("price", price)]), **currencies}
+            continue
+        pairs = [KV_PAIR.match(part) for part in line.split("|")]
+        if len(pairs) >= 2 and all(pairs):
+            current.setdefault("section", section)
+            current.setdefault("item", item)
+            for pair in pairs:
+                key, value = pair.groups()
+                column = _column_name(key)
+                current[column] = _value(value, column)
+                currencies = {**_currencies([(column, value)]), **currencies}
+                unit = re.search(r"\d\s*([a-zA-Z]+)\s*$", value)
+                if unit and column in QUANTITY_COLUMNS:
+                    current["unit"] = unit.group(1)
+            continue
+        heading = ITEM_HEADING.match(line)
+        if heading:
+            flush()
+            item = heading.group(1)
+        else:
+            flush()
+    flush()
+    if len(rows) < MIN_TABLE_ROWS:
+        return None
+    columns = list(dict.fromkeys(k for row in rows for k in row))
+    return columns, rows, currencies
+
+
+def parse_table(text: str, filename: str = ""):
+    """(columns, rows, currencies) if the document is tabular, else None.
+
+    currencies maps amount columns to the symbol their values were written with.
+    """
+    ext = filename.lower().rsplit(".", 1)[-1] if "." in filename else ""
+    if ext in ("csv", "xlsx", "xls"):
+        return _parse_delimited(text, ",")
+    if ext == "tsv":
+        return _parse_delimited(text, "\t")
+    sample = "\n".join(text.splitlines()[:20])
+    for delimiter in ("\t", ","):
+        counts = [line.count(delimiter) for line in sample.splitlines() if line.strip()]
+        if len(counts) > MIN_TABLE_ROWS and counts[0] >= 1 and sum(c == counts[0] for c in counts) >= 0.9 * len(counts):
+            table = _parse_delimited(text, delimiter)
+            if table:
+                return table
+    return _parse_records(text) or _parse_aligned(text)
+
+
+# --- storage ---------------------------------------------------------------
+
+def _db_path(tenant_id: str) -> str:
+    return os.path.join(TABULAR_STORE_DIR, re.sub(r"[^A-Za-z0-9_-]", "_", tenant_id) + ".sqlite")
+
+
+@contextmanager
+def _connect(tenant_id: str):
+    """Connection to the tenant's database; commits on success and always closes."""
+    os.makedirs(TABULAR_STORE_DIR, exist_ok=True)
+    conn = sqlite3.connect(_db_path(tenant_id))
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "s3_key TEXT PRIMARY KEY, table_name TEXT, filename TEXT, version TEXT, "
+                "columns TEXT, row_count INTEGER, loaded_at REAL, currencies TEXT)"
+            )
+            # Stores written before currencies were recorded (their prices render without a symbol)
+            if "currencies" not in {row[1] for row in conn.execute("PRAGMA table_info(documents)")}:
+                conn.execute("ALTER TABLE documents ADD COLUMN currencies TEXT")
+            yield conn
+    finally:
+        conn.close()
+
+
+def _table_name(s3_key: str) -> str:
+    digest = hashlib.md5(s3_key.encode("utf-8")).hexdigest()[:8]
+    return "t_" + re.sub(r"[^a-z0-9]+", "_", s3_key.lower()).strip("_")[-48:] + f"_{digest}"
+
+
+def load(tenant_id: str, s3_key: str, text: str, filename: str = "", version: Optional[str] = None) -> int:
+    """Parse and (re)load a document; returns rows stored (0 if not tabular)."""
+    table = parse_table(text, filename or s3_key)
+    if not table:
+        drop(tenant_id, s3_key)
+        return 0
+    columns, rows, currencies = table
+    name = _table_name(s3_key)
+    drop(tenant_id, s3_key)
+    with _connect(tenant_id) as conn:
+        conn.execute(f'CREATE TABLE "{name}" (' + ", ".join(f'"{c}"' for c in columns) + ")")
+        conn.executemany(
+            f'INSERT INTO "{name}" VALUES (' + ", ".join("?" for _ in columns) + ")",
+            [[row.get(c) for c in columns] for row in rows],
+        )
+        for column in columns:
+            conn.execute(f'CREATE INDEX "{name}_{column}" ON "{name}" ("{column}")')
+        conn.execute(
+            "INSERT OR REPLACE INTO documents "
+            "(s3_key, table_name, filename, version, columns, row_count, loaded_at, currencies) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (s3_key, name, filename, version, json.dumps(columns), len(rows), time.time(), json.dumps(currencies)),
+        )
+    return len(rows)
+
+
+def drop(tenant_id: str, s3_key: str):
+    if not os.path.exists(_db_path(tenant_id)):
+        return
+    with _connect(tenant_id) as conn:
+        found = conn.execute("SELECT table_name FROM documents WHERE s3_key = ?", (s3_key,)).fetchone()
+        if found:
+            conn.execute(f'DROP TABLE IF EXISTS "{found[0]}"')
+            conn.execute("DELETE FROM documents WHERE s3_key = ?", (s3_key,))
+
+
+def backup(tenant_id: str, path: str) -> bool:
+    """Consistent copy of the tenant's database to `path` (safe while it is being written); False if none."""
+    if not os.path.exists(_db_path(tenant_id)):
+        return False
+    source, target = sqlite3.connect(_db_path(tenant_id)), sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    return True
+
+
+def restore(tenant_id: str, path: str):
+    """Replace the tenant's database with the one at `path`."""
+    os.makedirs(TABULAR_STORE_DIR, exist_ok=True)
+    source, target = sqlite3.connect(path), sqlite3.connect(_db_path(tenant_id))
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+def copy_tenant(source_tenant: str, target_tenant: str) -> bool:
+    """Give target_tenant a copy of source_tenant's tables; False if the source has none."""
+    os.makedirs(TABULAR_STORE_DIR, exist_ok=True)
+    return backup(source_tenant, _db_path(target_tenant))
+
+
+# --- answering -------------------------------------------------------------
+
+def _pick_column(columns: List[str], candidates) -> Optional[str]:
+    for candidate in candidates:
+        for column in columns:
+            if column == candidate or column.startswith(candidate):
+                return column
+    return None
+
+
+def _describe(row: dict, columns: List[str]) -> str:
+    return " | ".join(f"{c}: {row[c]}" for c in columns if row.get(c) not in (None, ""))
+
+
+def _fmt(number) -> str:
+    return f"{number:,.2f}".rstrip("0").rstrip(".") if isinstance(number, float) else f"{number:,}"
+
+
+def answer(tenant_id: str, question: str) -> Optional[dict]:
+    """Match a question against the tenant's tables.
+
+    Returns None when nothing matches, else a dict with "rows" (context text) and,
+    for plain lookups/aggregates, "answer" (a complete reply needing no LLM).
+    """
+    if not os.path.exists(_db_path(tenant_id)):
+        return None
+    words = tokens(question)
+    terms = words - STOPWORDS - QUANTITY_WORDS - PRICE_WORDS
+    if not terms:
+        return None
+    phrases = _bigrams([t for t in token_list(question) if t in terms])
+
+    matches = []
+    with _connect(tenant_id) as conn:
+        conn.row_factory = sqlite3.Row
+        for doc in conn.execute("SELECT * FROM documents").fetchall():
+            columns = json.loads(doc["columns"])
+            currencies = json.loads(doc["currencies"] or "{}")
+            # Narrow with LIKE filters on the longest terms, then score the candidates in Python
+            where = " OR ".join(f'LOWER(CAST("{c}" AS TEXT)) LIKE ?' for c in columns)
+            candidates = set()
+            for term in sorted(terms, key=len, reverse=True)[:4]:
+                for row in conn.execute(f'SELECT rowid, * FROM "{doc["table_name"]}" WHERE {where}',
+                                        [f"%{term}%"] * len(columns)):
+                    candidates.add(tuple(row))
+            for values in candidates:
+                row = dict(zip(["rowid", *columns], values))
+                cells = [token_list(str(row[c])) for c in columns if c != "section" and row[c] is not None]
+                specific = set().union(*cells) if cells else set()
+                general = tokens(str(row.get("section") or ""))
+                # Terms only found in the section heading count half; adjacent pairs ("3 inch") add a bonus
+                score = len(terms & specific) + 0.5 * len((terms & general) - specific)
+                score += 0.5 * len(phrases & set().union(*(_bigrams(c) for c in cells)))
+                if score:
+                    matches.append((score, currencies, columns, row))
+    if not matches:
+        return None
+
+    best = max(score for score, *_ in matches)
+    # Require most of the question's terms to match, so "refund policy" doesn't hit the inventory
+    if best < max(1, math.ceil(0.6 * len(terms))):
+        return None
+    top = [m for m in matches if m[0] == best]
+    rows_text = "\n".join(_describe(row, columns) for _, _, columns, row in top[:TABULAR_MAX_CONTEXT_ROWS])
+    result = {"rows": rows_text, "matched": len(top), "answer": None}
+
+    wants_price = bool(words & PRICE_WORDS) and not ({"stock", "units", "unit", "quantity", "many"} & words)
+    wants_quantity = bool(words & QUANTITY_WORDS) and not wants_price
+    if not (wants_price or wants_quantity) or len(top) > TABULAR_MAX_DIRECT_ROWS and not AGGREGATE.search(question):
+        return result
+
+    lines, total = [], 0
+    for _, currencies, columns, row in top:
+        column = _pick_column(columns, PRICE_COLUMNS if wants_price else QUANTITY_COLUMNS)
+        if column is None or not isinstance(row.get(column), (int, float)):
+            return result
+        label = " / ".join(str(row[c]) for c in columns if c not in (column, "rowid", "unit")
+                           and isinstance(row.get(c), str) and row[c])
+        unit = row.get("unit") or ""
+        value = f"{currencies.get(column, '')}{_fmt(row[column])}" if wants_price else f"{_fmt(row[column])} {unit}".strip()
+        lines.append(f"- {label}: {value}")
+        total += row[column]
+
+    if wants_quantity and (len(top) > 1 or AGGREGATE.search(question)):
+        unit = top[0][3].get("unit") or "units"
+        header = f"Total: {_fmt(total)} {unit} across {len(top)} matching items."
+    elif wants_price:
+        header = "Price:" if len(top) == 1 else "Prices:"
+    else:
+        header = "In stock:"
+    if len(top) > TABULAR_MAX_DIRECT_ROWS:
+        lines = lines[:TABULAR_MAX_DIRECT_ROWS] + [f"- ... and {len(top) - TABULAR_MAX_DIRECT_ROWS} more"]
+    result["answer"] = header + "\n" + "\n".join(lines)
+    return result
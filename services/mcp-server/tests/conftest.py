@@ -0,0 +1,30 @@
+"""Hermetic setup for the MCP server tests: local data dirs, fake Bedrock, in-memory Qdrant."""
+
+import os
+import sys
+import tempfile
+
+DATA_DIR = tempfile.mkdtemp(prefix="mcp-tests-")
+os.environ.setdefault("USAGE_DB", os.path.join(DATA_DIR, "usage.sqlite"))
+os.environ.setdefault("TABULAR_STORE_DIR", os.path.join(DATA_DIR, "tabular"))
+os.environ.setdefault("SEARCH_TUNING_FILE", os.path.join(DATA_DIR, "search_params.json"))
+os.environ.setdefault("QUERY_SAMPLE_FILE", os.path.join(DATA_DIR, "queries.jsonl"))
+os.environ.setdefault("VECTOR_STORE_DIR", os.path.join(DATA_DIR, "vectors"))
+os.environ.setdefault("REEMBED_STATE", os.path.join(DATA_DIR, "reembed", "state.json"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """main with FakeBedrock and a fresh in-memory Qdrant."""
+    import benchmark
+    import main
+
+    benchmark.install_fakes(benchmark.FakeBedrock())
+    main.query_vectors._entries.clear()
+    return main
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pytest
+
+from resilience import Deadline, DeadlineExceeded, deadline_var
+from singleflight import SingleFlight
+
+
+async def with_deadline(seconds, coro_fn):
+    deadline_var.set(Deadline(seconds))
+    return await coro_fn()
+
+
+def test_shared_run_sees_first_callers_deadline():
+    flight = SingleFlight("test")
+
+    async def work():
+        return deadline_var.get()
+
+    seen = asyncio.run(with_deadline(7, lambda: flight.do("k", work)))
+    assert seen is not None and 6 < seen.remaining() <= 7
+
+
+def test_joiner_waits_only_its_own_deadline():
+    flight = SingleFlight("test")
+
+    async def slow():
+        await asyncio.sleep(1)
+        return "done"
+
+    async def scenario():
+        first = asyncio.create_task(with_deadline(5, lambda: flight.do("k", slow)))
+        await asyncio.sleep(0.01)
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await with_deadline(0.1, lambda: flight.do("k", slow))
+        assert time.monotonic() - start < 0.5
+        assert await first == "done"
+
+    asyncio.run(scenario())
+
+
+def test_joiner_retries_when_first_callers_deadline_ran_out():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.1)
+        if deadline_var.get().expired:
+            raise DeadlineExceeded("first caller's deadline")
+        return "done"
+
+    async def scenario():
+        first = asyncio.create_task(with_deadline(0.05, lambda: flight.do("k", work)))
+        await asyncio.sleep(0.01)
+        second = await with_deadline(5, lambda: flight.do("k", work))
+        with pytest.raises(DeadlineExceeded):
+            await first
+        return second
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_search_with_nearly_expired_deadline(server):
+    asyncio.run(server.ingest_knowledge("Q4 revenue was 5M", "tenant-acme"))
+    timeouts = []
+    query_points = server.qdrant_client.query_points
+
+    def recording_query_points(*args, **kwargs):
+        timeouts.append(kwargs.get("timeout"))
+        return query_points(*args, **kwargs)
+
+    server.qdrant_client.query_points = recording_query_points
+
+    async def search(seconds):
+        deadline_var.set(Deadline(seconds))
+        return await server.search_knowledge_base("Q4 revenue?", "tenant-acme")
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(search(0))
+    assert timeouts == []
+
+    asyncio.run(search(2.5))
+    assert timeouts == [3]
+
+
+def test_query_embedding_budget_is_child_of_request_deadline(server):
+    seen = []
+    get_embedding = server.get_embedding
+
+    def recording_get_embedding(text, tenant_id):
+        seen.append(deadline_var.get())
+        return get_embedding(text, tenant_id)
+
+    server.get_embedding = recording_get_embedding
+
+    async def embed():
+        deadline = Deadline(7)
+        deadline_var.set(deadline)
+        await server.embed_query("Q4 revenue?", "tenant-acme")
+        return deadline
+
+    deadline = asyncio.run(embed())
+    assert seen == [deadline]
@@ -0,0 +1,173 @@
+import uuid
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+import mmap_index
+from mmap_index import MmapIndex
+
+VECTORS = {"titan": models.VectorParams(size=4, distance=models.Distance.COSINE)}
+POINT_UUID = str(uuid.UUID(int=7))
+
+
+def fixture_points():
+    """A small mixed fixture: int and uuid ids, keyword/list/missing/null fields, a point without a vector."""
+    points = []
+    for i in range(1, 7):
+        payload = {"tenantId": "acme" if i % 2 else "globex", "tags": ["a", "b"] if i < 3 else ["c"],
+                   "text": f"chunk {i}"}
+        if i == 4:
+            payload["persona"] = None
+        elif i != 5:
+            payload["persona"] = "cfo" if i < 4 else "ceo"
+        points.append(models.PointStruct(id=i, vector={"titan": [1.0, i / 6, (i % 3) / 3, 0.1]}, payload=payload))
+    points.append(models.PointStruct(id=POINT_UUID, vector={"titan": [0.2, 0.9, 0.1, 0.4]},
+                                     payload={"tenantId": "acme", "persona": "cfo", "tags": [], "text": "uuid"}))
+    points.append(models.PointStruct(id=8, vector={}, payload={"tenantId": "acme", "text": "no vector"}))
+    return points
+
+
+def load(client):
+    client.create_collection("docs", vectors_config=VECTORS)
+    client.upsert("docs", points=fixture_points(), wait=True)
+    return client
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = load(MmapIndex(str(tmp_path)))
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def qdrant():
+    return load(QdrantClient(location=":memory:"))
+
+
+def ids(client, query_filter):
+    points, _ = client.scroll("docs", scroll_filter=query_filter, limit=100)
+    return sorted(str(p.id) for p in points)
+
+
+def match(key, value):
+    return models.FieldCondition(key=key, match=models.MatchValue(value=value))
+
+
+FILTERS = {
+    "must": models.Filter(must=[match("tenantId", "acme")]),
+    "should": models.Filter(should=[match("persona", "ceo"), match("tags", "b")]),
+    "must_not": models.Filter(must_not=[match("tenantId", "acme")]),
+    "nested": models.Filter(must=[match("tenantId", "acme"), models.Filter(should=[match("persona", "cfo")])]),
+    "match_any": models.Filter(must=[models.FieldCondition(key="tags", match=models.MatchAny(any=["a", "c"]))]),
+    "match_except": models.Filter(must=[
+        models.FieldCondition(key="persona", match=models.MatchExcept(**{"except": ["cfo"]}))
+    ]),
+    "is_empty": models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="persona"))]),
+    "is_null": models.Filter(must=[models.IsNullCondition(is_null=models.PayloadField(key="persona"))]),
+    "has_id": models.Filter(must=[models.HasIdCondition(has_id=[2, POINT_UUID, 99])]),
+    "has_vector": models.Filter(must=[models.HasVectorCondition(has_vector="titan")]),
+}
+
+
+@pytest.mark.parametrize("name", sorted(FILTERS))
+def test_filter_conditions_match_qdrant(index, qdrant, name):
+    assert ids(index, FILTERS[name]) == ids(qdrant, FILTERS[name])
+    assert index.count("docs", count_filter=FILTERS[name]).count == qdrant.count("docs", count_filter=FILTERS[name]).count
+
+
+def test_unsupported_condition_is_rejected_up_front(index):
+    ranged = models.Filter(must=[models.FieldCondition(key="version", range=models.Range(gte=2))])
+    for call in (
+        lambda: index.query_points("docs", query=[1, 0, 0, 0], using="titan", query_filter=ranged),
+        lambda: index.scroll("docs", scroll_filter=ranged),
+        lambda: index.count("docs", count_filter=ranged),
+        lambda: index.delete("docs", points_selector=models.FilterSelector(filter=ranged)),
+        lambda: index.set_payload("docs", payload={"x": 1}, points=ranged),
+    ):
+        with pytest.raises(ValueError, match="VECTOR_BACKEND=qdrant"):
+            call()
+    assert index.count("docs").count == 8
+
+
+def test_snapshots_raise_a_clear_error(index):
+    with pytest.raises(RuntimeError, match="Snapshots need Qdrant"):
+        index.create_snapshot(collection_name="docs")
+    with pytest.raises(RuntimeError, match="Snapshots need Qdrant"):
+        index.recover_snapshot(collection_name="docs", location="file:///x")
+
+
+def test_search_matches_qdrant(index, qdrant):
+    query = [0.9, 0.4, 0.3, 0.1]
+    for query_filter in (None, FILTERS["must"], FILTERS["should"]):
+        ours = index.query_points("docs", query=query, using="titan", query_filter=query_filter, limit=4).points
+        theirs = qdrant.query_points("docs", query=query, using="titan", query_filter=query_filter, limit=4).points
+        assert [str(p.id) for p in ours] == [str(p.id) for p in theirs]
+        assert [p.score for p in ours] == pytest.approx([p.score for p in theirs], abs=1e-3)
+        assert [p.payload for p in ours] == [p.payload for p in theirs]
+
+
+def test_upsert_and_delete_round_trip_through_reopen(tmp_path, index):
+    index.upsert("docs", points=[models.PointStruct(id=2, vector={"titan": [0, 0, 1, 0]}, payload={"text": "new"})])
+    index.delete("docs", points_selector=models.PointIdsList(points=[3, POINT_UUID]))
+    index.delete("docs", points_selector=models.FilterSelector(filter=models.Filter(must=[match("persona", "ceo")])))
+    expected = ["1", "2", "4", "5", "8"]
+    assert ids(index, None) == expected
+
+    index.close()
+    reopened = MmapIndex(str(tmp_path))
+    assert ids(reopened, None) == expected
+    [point] = reopened.retrieve("docs", ids=[2], with_vectors=True)
+    assert point.payload == {"text": "new"}
+    assert point.vector["titan"] == pytest.approx([0, 0, 1, 0], abs=1e-3)
+    assert reopened.count("docs").count == 5
+    reopened.close()
+
+
+def test_compaction_drops_dead_rows_and_keeps_points(tmp_path, index, monkeypatch):
+    monkeypatch.setattr(mmap_index, "COMPACT_MIN_DEAD", 3)
+    before = {str(p.id): p for p in index.scroll("docs", limit=100, with_vectors=True)[0]}
+    for _ in range(3):
+        # Each upsert of an existing id leaves a dead row; the third makes 9 dead > 8 live
+        index.upsert("docs", points=[p for p in fixture_points() if p.id in (1, 2, 3)])
+
+    collection = index._collection("docs")
+    assert collection.dead == 0
+    assert len(collection.ids) == collection.count == 8
+    index.delete("docs", points_selector=models.PointIdsList(points=[8]))
+    after = {str(p.id): p for p in index.scroll("docs", limit=100, with_vectors=True)[0]}
+    assert sorted(after) == sorted(set(before) - {"8"})
+    for point_id, point in after.items():
+        assert point.payload == before[point_id].payload
+        assert point.vector["titan"] == pytest.approx(before[point_id].vector["titan"], abs=1e-3)
+    assert ids(index, FILTERS["must"]) == sorted(["1", "3", "5", POINT_UUID])
+
+    index.close()
+    reopened = MmapIndex(str(tmp_path))
+    assert sorted(str(p.id) for p in reopened.scroll("docs", limit=100)[0]) == sorted(after)
+    reopened.close()
+
+
+def test_alias_swap(tmp_path, index):
+    index.create_collection("docs_v2", vectors_config=VECTORS)
+    index.upsert("docs_v2", points=[models.PointStruct(id=42, vector={"titan": [1, 0, 0, 0]}, payload={})])
+    create = models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name="docs", alias_name="live"))
+    index.update_collection_aliases(change_aliases_operations=[create])
+    assert index.count("live").count == 8
+
+    index.update_collection_aliases(change_aliases_operations=[
+        models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name="live")),
+        models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name="docs_v2", alias_name="live")),
+    ])
+    assert index.count("docs").count == 8  # the replaced collection is untouched
+    assert [p.id for p in index.scroll("live")[0]] == [42]
+    assert MmapIndex(str(tmp_path)).get_aliases().aliases == [
+        models.AliasDescription(alias_name="live", collection_name="docs_v2")
+    ]
+
+    with pytest.raises(ValueError, match="doesn't exist"):
+        index.update_collection_aliases(change_aliases_operations=[models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name="missing", alias_name="live")
+        )])
+    index.delete_collection("docs_v2")
+    assert index.get_aliases().aliases == []
@@ -0,0 +1,18 @@
+import boto3
+from moto import mock_aws
+
+import reconcile_s3
+
+
+@mock_aws
+def test_list_bucket_skips_snapshot_backups():
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="docs")
+    for key in ["tenant-acme/analyst/report.pdf", "tenant-acme/analyst/",
+                "_snapshots/tenant-acme/tenant_acme-1.snapshot",
+                "_snapshots/tenant-acme/tenant_acme-1.snapshot.manifest.json",
+                "_snapshots/tenant-acme/tenant_acme-1.snapshot.tabular.sqlite"]:
+        s3.put_object(Bucket="docs", Key=key, Body=b"x")
+
+    assert list(reconcile_s3.list_bucket(s3, "docs", "")) == ["tenant-acme/analyst/report.pdf"]
+    assert reconcile_s3.list_bucket(s3, "docs", "_snapshots/") == {}
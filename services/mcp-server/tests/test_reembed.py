@@ -0,0 +1,43 @@
+import pytest
+from qdrant_client import models
+
+import reembed
+
+
+def legacy_collection(server, name, points=5):
+    """A collection created before COLLECTION_ALIASES, with the unnamed vector."""
+    server.qdrant_client.create_collection(
+        collection_name=name, vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE),
+    )
+    server.qdrant_client.upsert(collection_name=name, wait=True, points=[
+        models.PointStruct(id=i, vector=[1.0, float(i), 0.5, 0.25], payload={"text": f"chunk {i}"})
+        for i in range(points)
+    ])
+
+
+def test_swap_alias_refuses_a_pre_alias_collection(server):
+    legacy_collection(server, "tenant_legacy")
+    with pytest.raises(ValueError, match="--migrate-legacy"):
+        server.swap_alias("tenant_legacy", "tenant_legacy__20260101000000")
+    assert server.qdrant_client.count("tenant_legacy", exact=True).count == 5
+
+
+def test_migrate_legacy_moves_the_collection_behind_an_alias(server):
+    legacy_collection(server, "tenant_legacy")
+    state = {}
+    assert reembed.migrate_legacy("tenant_legacy", state, batch_size=2)
+
+    copy = state["tenant_legacy"]["shadow"]
+    assert server.resolve_collection("tenant_legacy") == copy != "tenant_legacy"
+    assert not server.is_legacy_collection("tenant_legacy")
+    points, _ = server.qdrant_client.scroll("tenant_legacy", limit=10, with_payload=True, with_vectors=True)
+    assert sorted(p.id for p in points) == list(range(5))
+    assert {p.payload["text"] for p in points} == {f"chunk {i}" for i in range(5)}
+    assert state["tenant_legacy"]["status"] == "migrated"
+
+    # From here on swaps are atomic and keep the copy for catch-up and rollback
+    server.qdrant_client.create_collection(
+        collection_name="tenant_legacy__next", vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE),
+    )
+    assert server.swap_alias("tenant_legacy", "tenant_legacy__next") == copy
+    assert server.qdrant_client.collection_exists(copy)
@@ -0,0 +1,53 @@
+import asyncio
+
+from starlette.testclient import TestClient
+
+
+def embedding_calls(server):
+    return server.bedrock_client.calls["embedding"]
+
+
+def test_small_talk_turn_is_not_embedded(server):
+    asyncio.run(server.generate_twin_response("thanks!", "tenant-acme", "You are helpful."))
+    assert embedding_calls(server) == 0
+
+    asyncio.run(server.generate_twin_response("What was Q4 revenue?", "tenant-acme", "You are helpful."))
+    assert embedding_calls(server) == 1
+
+
+def test_prefetch_applies_the_gate(server):
+    with TestClient(server.mcp.sse_app()) as client:
+        assert client.post("/prefetch", json={"query": "hello there"}).status_code == 202
+        assert client.post("/prefetch", json={"query": "What was Q4 revenue?"}).status_code == 202
+        # Prefetches run in the background; the next request on the loop lets them finish
+        client.get("/stats")
+    assert embedding_calls(server) == 1
+
+
+QUESTION = [
+    {"role": "user", "content": "How did revenue do this year?"},
+    {"role": "assistant", "content": "Revenue grew 12%. Want the Q3 numbers?"},
+]
+
+
+def test_yes_to_assistant_question_is_retrieved():
+    from retrieval_gate import RetrievalGate, follow_up_query
+
+    gate = RetrievalGate()
+    assert gate.decide("yes", QUESTION) == (True, "follow_up")
+    assert gate.decide("Sure!", QUESTION) == (True, "follow_up")
+    assert gate.decide("yes", QUESTION[:1] + [{"role": "assistant", "content": "Revenue grew 12%."}]) == (False, "small_talk")
+    assert gate.decide("yes") == (False, "small_talk")
+    assert follow_up_query(QUESTION) == "How did revenue do this year?\nRevenue grew 12%. Want the Q3 numbers?"
+
+
+def test_follow_up_searches_the_previous_exchange(server, monkeypatch):
+    searched = []
+
+    async def search(query, tenant_id, limit=5, *args):
+        searched.append(query)
+        return "[Score: 0.9] Q3 revenue was 1.2M"
+
+    monkeypatch.setattr(server, "search_knowledge_base", search)
+    asyncio.run(server.generate_twin_response("yes", "tenant-acme", "You are helpful.", QUESTION))
+    assert searched == ["How did revenue do this year?\nRevenue grew 12%. Want the Q3 numbers?"]
@@ -0,0 +1,33 @@
+import json
+
+import storage_profiles
+
+
+def entry(ef):
+    return {"params": {"hnsw_ef": ef}, "profile": "large", "vector": "titan"}
+
+
+def write_tuning(tmp_path, monkeypatch, tuning):
+    path = tmp_path / "search_params.json"
+    path.write_text(json.dumps(tuning))
+    load = storage_profiles.load_tuning
+    monkeypatch.setattr(storage_profiles, "load_tuning", lambda: load(str(path)))
+
+
+def tuned(tenant_id):
+    params = storage_profiles.tuned_search_params("shared", tenant_id, "large", "titan")
+    return params.hnsw_ef if params else None
+
+
+def test_one_tenants_params_dont_apply_to_others(tmp_path, monkeypatch):
+    write_tuning(tmp_path, monkeypatch, {"shared": {"tenant-a": entry(16)}})
+    assert tuned("tenant-a") == 16
+    assert tuned("tenant-b") is None
+    assert tuned(None) is None
+
+
+def test_star_entry_is_the_collection_default(tmp_path, monkeypatch):
+    write_tuning(tmp_path, monkeypatch, {"shared": {"tenant-a": entry(16), "*": entry(64)}})
+    assert tuned("tenant-a") == 16
+    assert tuned("tenant-b") == 64
+    assert tuned(None) == 64
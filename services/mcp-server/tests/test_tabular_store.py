@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import tabular_store
+
+PRICES = """item,price,stock
+Widget A,$12.50,40
+Widget B,$8,15
+Gadget C,$99.99,3
+Gizmo D,$5.25,120
+"""
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(tabular_store, "TABULAR_STORE_DIR", str(tmp_path))
+    return tabular_store
+
+
+def test_price_answer_keeps_source_currency(store):
+    store.load("t1", "t1/user/prices.csv", PRICES, "prices.csv")
+    assert store.answer("t1", "price of gadget")["answer"] == "Price:\n- Gadget C: $99.99"
+
+
+def test_price_answer_without_currency_has_no_symbol(store):
+    store.load("t1", "t1/user/prices.csv", PRICES.replace("$", ""), "prices.csv")
+    assert store.answer("t1", "price of gizmo")["answer"] == "Price:\n- Gizmo D: 5.25"
+
+
+def test_blank_and_duplicate_headers_are_suffixed(store):
+    text = "item,,,price,price\nA,x,y,1,2\nB,x,y,3,4\nC,x,y,5,6\nD,x,y,7,8\n"
+    assert store.load("t1", "t1/user/sheet.csv", text, "sheet.csv") == 4
+    assert store.parse_table(text, "sheet.csv")[0] == ["item", "col", "col_2", "price", "price_2"]
+
+
+def test_ingest_survives_tabular_failure(server, monkeypatch):
+    def broken_load(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(server.tabular_store, "load", broken_load)
+    result = asyncio.run(server.ingest_document(PRICES, "tenant-acme", "tenant-acme/user/prices.csv"))
+    assert result.startswith("Successfully ingested")
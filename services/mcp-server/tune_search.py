@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Measure recall against latency for tenant collections and recommend search params.
+
+For each tenant:
+
+  queries   - recorded queries for the tenant (QUERY_SAMPLE_FILE, filled by the
+              server at QUERY_SAMPLE_RATE, and/or --queries files in the
+              examples/queries format or JSONL), embedded in one batch; with
+              fewer than --min-queries, stored chunks' own vectors are sampled
+              instead (no embedding calls)
+  truth     - exact top-k by brute force with NumPy: every vector of the
+              tenant is scrolled from the collection and scored against all
+              queries a page at a time, so memory stays at one page
+  sweep     - the same queries through Qdrant under each candidate setting:
+              the profile default, exact search, every --ef as hnsw_ef and,
+              on quantized profiles, rescoring off / on at every --oversampling
+
+The recommendation is the setting with the lowest p95 latency whose mean
+recall@k reaches --target-recall (the profile default is kept unless that is
+more than 10% faster), or the one with the best recall when none does. It is written to SEARCH_TUNING_FILE (unless --dry-run), which the server
+reads on every search. An entry applies until the collection's storage profile
+or embedding vector changes (reprofile_collections.py, reembed.py); re-run
+after either. With VECTOR_BACKEND=mmap every search is exact already and the
+sweep only reports latency.
+
+Usage:
+  python tune_search.py --all --dry-run
+  python tune_search.py tenant-acme --k 5 --target-recall 0.98
+  python tune_search.py --all --queries ../../examples/queries/test-queries.json
+  python tune_search.py tenant-acme --ef 16 32 64 128 --oversampling 1.5 2 3 --repeats 5
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from qdrant_client.http import models
+
+import main
+import storage_profiles
+
+DEFAULT_EF = [16, 32, 64, 128, 256]
+DEFAULT_OVERSAMPLING = [1.0, 1.5, 2.0, 3.0]
+# A setting must beat the profile default's p95 by more than this to replace it
+LATENCY_NOISE = 0.1
+
+
+def load_recorded_queries(paths):
+    """tenant -> query texts from examples/queries-style JSON or JSONL files (missing files are skipped)."""
+    queries = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            text = f.read()
+        if text.lstrip().startswith("{") and '"queries"' in text[:200]:
+            records = json.loads(text)["queries"]
+        else:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        for record in records:
+            query = record.get("message") or record.get("query")
+            if query and record.get("tenantId"):
+                queries.setdefault(record["tenantId"], []).append(query)
+    return {tenant: list(dict.fromkeys(texts)) for tenant, texts in queries.items()}
+
+
+def discover_tenants():
+    """Tenants with vectors: tenantIds in the shared collection, or one per tenant collection."""
+    names = main.tenant_collections()
+    shared = main.TENANCY_MODE == "shared"
+    tenants = set()
+    for name in names:
+        if shared != (name == main.SHARED_COLLECTION):
+            continue
+        offset = None
+        while True:
+            points, offset = main.qdrant_client.scroll(
+                collection_name=name, limit=1000 if shared else 1, offset=offset,
+                with_payload=[main.TENANT_KEY], with_vectors=False,
+            )
+            tenants.update((p.payload or {}).get(main.TENANT_KEY, name.replace("_", "-")) for p in points)
+            if offset is None or not shared:
+                break
+    return sorted(t for t in tenants if main.collection_for_tenant(t) in names)
+
+
+def vector_of(point, using):
+    vector = point.vector
+    return vector.get(using) if isinstance(vector, dict) else vector
+
+
+def sample_point_queries(collection_name, tenant_id, using, count, rng):
+    """Vectors of `count` random stored chunks, as stand-in queries."""
+    ids, offset = [], None
+    while True:
+        points, offset = main.qdrant_client.scroll(
+            collection_name=collection_name, scroll_filter=main.tenant_filter(tenant_id),
+            limit=1000, offset=offset, with_payload=False, with_vectors=False,
+        )
+        ids.extend(p.id for p in points)
+        if offset is None:
+            break
+    chosen = rng.sample(ids, min(count, len(ids)))
+    points = main.qdrant_client.retrieve(collection_name, ids=chosen, with_payload=False,
+                                         with_vectors=[using] if using else True)
+    return [vector_of(p, using) for p in points if vector_of(p, using) is not None]
+
+
+def normalized(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def exact_top_k(collection_name, tenant_id, using, queries: np.ndarray, k: int, page_size: int = 1000):
+    """Brute-force top-k per query over every tenant vector, one scroll page at a time.
+
+    Returns, per query, the ids scoring at least the k-th best score (more than k when
+    there are ties at the cut, any of which is a correct answer) and how many of them
+    count towards recall.
+    """
+    keep = 4 * k
+    best_scores = np.full((len(queries), keep), -np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), keep), None, dtype=object)
+    offset, scanned = None, 0
+    while True:
+        points, offset = main.qdrant_client.scroll(
+            collection_name=collection_name, scroll_filter=main.tenant_filter(tenant_id),
+            limit=page_size, offset=offset, with_payload=False, with_vectors=[using] if using else True,
+        )
+        points = [p for p in points if vector_of(p, using) is not None]
+        if points:
+            scores = queries @ normalized([vector_of(p, using) for p in points]).T
+            ids = np.empty(len(points), dtype=object)
+            ids[:] = [p.id for p in points]
+            all_scores = np.concatenate([best_scores, scores], axis=1)
+            all_ids = np.concatenate([best_ids, np.broadcast_to(ids, scores.shape)], axis=1)
+            top = np.argpartition(-all_scores, keep - 1, axis=1)[:, :keep]
+            best_scores = np.take_along_axis(all_scores, top, axis=1)
+            best_ids = np.take_along_axis(all_ids, top, axis=1)
+            scanned += len(points)
+        if offset is None:
+            break
+    truth = []
+    for scores, ids in zip(best_scores, best_ids):
+        found = int(np.isfinite(scores).sum())
+        cut = np.sort(scores)[::-1][min(k, found) - 1] - 1e-5 if found else np.inf
+        truth.append(({i for i, score in zip(ids, scores) if i is not None and score >= cut}, min(k, found)))
+    return truth, scanned
+
+
+def candidates(profile, efs, oversampling):
+    """(label, SearchParams or None) settings to sweep for a collection on `profile`."""
+    settings = [("profile default", storage_profiles.search_params(profile)),
+                ("exact", models.SearchParams(exact=True))]
+    quantized = storage_profiles.get_profile(profile)["quantization"] is not None
+    for ef in efs:
+        if not quantized:
+            settings.append((f"hnsw_ef={ef}", models.SearchParams(hnsw_ef=ef)))
+            continue
+        settings.append((f"hnsw_ef={ef} no rescore", models.SearchParams(
+            hnsw_ef=ef, quantization=models.QuantizationSearchParams(rescore=False))))
+        for factor in oversampling:
+            settings.append((f"hnsw_ef={ef} rescore x{factor:g}", models.SearchParams(
+                hnsw_ef=ef, quantization=models.QuantizationSearchParams(rescore=True, oversampling=factor))))
+    return settings
+
+
+def sweep(collection_name, tenant_id, using, queries, truth, settings, k, repeats):
+    """recall@k and latency percentiles per setting; passes alternate settings to even out drift."""
+    query_filter = main.search_filter(tenant_id)
+    results = {label: {"latencies": [], "recall": None} for label, _ in settings}
+    for _ in range(repeats):
+        for label, params in settings:
+            # Untimed first call: connection and segment caches
+            main.qdrant_client.query_points(collection_name=collection_name, query=queries[0].tolist(), using=using,
+                                            query_filter=query_filter, search_params=params, limit=k, with_payload=False)
+            hits = []
+            for vector, expected in zip(queries, truth):
+                start = time.perf_counter()
+                points = main.qdrant_client.query_points(
+                    collection_name=collection_name, query=vector.tolist(), using=using,
+                    query_filter=query_filter, search_params=params, limit=k, with_payload=False,
+                ).points
+                results[label]["latencies"].append(time.perf_counter() - start)
+                expected_ids, wanted = expected
+                if wanted:
+                    hits.append(min(wanted, len(expected_ids & {p.id for p in points})) / wanted)
+            results[label]["recall"] = float(np.mean(hits)) if hits else 1.0
+    for result in results.values():
+        latencies = sorted(result.pop("latencies"))
+        result["p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 2)
+        result["p95_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2)
+        result["recall"] = round(result["recall"], 4)
+    return results
+
+
+def recommend(results, target_recall):
+    """Fastest setting (p95) reaching the target recall, else the most accurate one."""
+    passing = [label for label, r in results.items() if r["recall"] >= target_recall]
+    if passing:
+        best = min(passing, key=lambda label: (results[label]["p95_ms"], -results[label]["recall"]))
+        default = results["profile default"]
+        if "profile default" in passing and default["p95_ms"] <= results[best]["p95_ms"] * (1 + LATENCY_NOISE):
+            return "profile default"
+        return best
+    return max(results, key=lambda label: (results[label]["recall"], -results[label]["p95_ms"]))
+
+
+def tune(tenant_id, recorded, args, rng):
+    """Sweep one tenant; returns (collection, recommendation entry) or None."""
+    collection_name = main.collection_for_tenant(tenant_id)
+    if not main.qdrant_client.collection_exists(collection_name):
+        print(f"❌ {tenant_id}: collection {collection_name} doesn't exist")
+        return None
+    using = main.vector_name_for(collection_name)
+    profile = storage_profiles.profile_from_collection(main.collection_info(collection_name))
+
+    texts = recorded.get(tenant_id, [])
+    if len(texts) >= args.min_queries:
+        texts = rng.sample(texts, min(args.sample, len(texts)))
+        vectors, source = main.get_embeddings(texts, tenant_id), f"{len(texts)} recorded queries"
+    else:
+        vectors = sample_point_queries(collection_name, tenant_id, using, args.sample, rng)
+        source = f"{len(vectors)} stored chunks as queries"
+    if not vectors:
+        print(f"❌ {tenant_id}: no points to tune on")
+        return None
+    queries = normalized(vectors)
+
+    started = time.perf_counter()
+    truth, scanned = exact_top_k(collection_name, tenant_id, using, queries, args.k)
+    truth_seconds = time.perf_counter() - started
+    settings = candidates(profile, args.ef, args.oversampling)
+    results = sweep(collection_name, tenant_id, using, queries, truth, settings, args.k, args.repeats)
+    best = recommend(results, args.target_recall)
+
+    print(f"🔧 {tenant_id} ({collection_name}, profile '{profile}'): {scanned} chunks, {source}, "
+          f"exact top-{args.k} in {truth_seconds:.1f}s")
+    print(f"   {'setting':<28} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, r in results.items():
+        marker = " <- recommended" if label == best else ""
+        print(f"   {label:<28} {r['recall']:>9.3f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f}{marker}")
+    if results[best]["recall"] < args.target_recall:
+        print(f"   ⚠️  no setting reaches recall {args.target_recall}; recommending the most accurate")
+
+    params = dict(settings)[best]
+    return collection_name, {
+        "params": params.model_dump(exclude_defaults=True, mode="json") if params else {},
+        "setting": best,
+        "profile": profile,
+        "vector": using or "",
+        "k": args.k,
+        "recall": results[best]["recall"],
+        "p50_ms": results[best]["p50_ms"],
+        "p95_ms": results[best]["p95_ms"],
+        "default": results["profile default"],
+        "queries": source,
+        "tuned_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def save(recommendations):
+    """Merge recommendations into SEARCH_TUNING_FILE, replacing it atomically."""
+    path = storage_profiles.SEARCH_TUNING_FILE
+    tuning = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            tuning = json.load(f)
+    for collection_name, tenant_id, entry in recommendations:
+        tuning.setdefault(collection_name, {})[tenant_id] = entry
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(tuning, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Sweep search params per tenant: recall@k vs latency")
+    parser.add_argument("tenants", nargs="*", help="Tenant ids to tune")
+    parser.add_argument("--all", action="store_true", help="Every tenant with vectors")
+    parser.add_argument("--queries", nargs="*", default=[],
+                        help="Recorded query files (examples/queries JSON or JSONL), in addition to QUERY_SAMPLE_FILE")
+    parser.add_argument("--sample", type=int, default=50, help="Queries per tenant")
+    parser.add_argument("--min-queries", type=int, default=10,
+                        help="Fewer recorded queries than this: sample stored chunks instead")
+    parser.add_argument("--k", type=int, default=5, help="Results per search (the server's default limit)")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--ef", type=int, nargs="+", default=DEFAULT_EF)
+    parser.add_argument("--oversampling", type=float, nargs="+", default=DEFAULT_OVERSAMPLING)
+    parser.add_argument("--repeats", type=int, default=3, help="Timed passes over the queries per setting")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dry-run", action="store_true", help="Report only; don't write SEARCH_TUNING_FILE")
+    args = parser.parse_args()
+
+    if not args.tenants and not args.all:
+        parser.error("name the tenants to tune or pass --all")
+    rng = random.Random(args.seed)
+    recorded = load_recorded_queries([main.QUERY_SAMPLE_FILE, *args.queries])
+    tenants = args.tenants or discover_tenants()
+
+    recommendations, failures = [], 0
+    for tenant_id in tenants:
+        tuned = tune(tenant_id, recorded, args, rng)
+        if tuned is None:
+            failures += 1
+            continue
+        recommendations.append((tuned[0], tenant_id, tuned[1]))
+
+    if recommendations and not args.dry_run:
+        save(recommendations)
+        print(f"\n✅ {len(recommendations)} recommendations written to {storage_profiles.SEARCH_TUNING_FILE}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,219 @@
+"""
+Per-tenant token, latency and cost accounting.
+
+Every Bedrock/Ollama call made by the server (chat generations, query and
+chunk embeddings) is appended to a local SQLite log with its tenant,
+persona, bridge tool, request id, model, tokens, latency and estimated
+cost. Rows are buffered in memory and written in batches by a background
+thread, so the hot path only appends to a list.
+
+  events  - append-only raw log, pruned after USAGE_RETENTION_DAYS; used to
+            find the most expensive requests (wasteful prompts)
+  hourly  - rollup per (hour, tenant, persona, tool, kind, model), updated
+            in the same transaction as the raw insert and kept indefinitely
+
+Costs use list prices per million tokens (USAGE_PRICES overrides them);
+local models cost nothing.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Sequence
+
+from metrics import log, request_id_var
+
+USAGE_ACCOUNTING = os.getenv("USAGE_ACCOUNTING", "on") == "on"
+USAGE_DB = os.getenv("USAGE_DB", "/app/data/usage/usage.sqlite")
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "5"))
+USAGE_FLUSH_ROWS = int(os.getenv("USAGE_FLUSH_ROWS", "500"))
+USAGE_RETENTION_DAYS = float(os.getenv("USAGE_RETENTION_DAYS", "30"))
+
+# USD per million (input, output) tokens
+PRICES = {
+    "anthropic.claude-3-5-sonnet-20241022-v2:0": (3.0, 15.0),
+    "anthropic.claude-3-5-haiku-20241022-v1:0": (0.8, 4.0),
+    "anthropic.claude-3-haiku-20240307-v1:0": (0.25, 1.25),
+    "amazon.titan-embed-text-v1": (0.1, 0.0),
+    "amazon.titan-embed-text-v2:0": (0.02, 0.0),
+    **{model: tuple(price) for model, price in json.loads(os.getenv("USAGE_PRICES", "{}")).items()},
+}
+
+GROUP_COLUMNS = ("tenant", "persona", "tool", "kind", "model")
+BUCKETS = {"hour": 3600, "day": 86400}
+
+# (tool, persona) of the call being served, set by the HTTP bridge
+scope_var = contextvars.ContextVar("usage_scope", default=("-", "-"))
+
+_buffer = []
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_writer = None
+_pruned_at = 0.0
+
+
+def cost_usd(model: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+@contextmanager
+def scope(tool: str, persona: Optional[str]):
+    """Attribute model calls made inside the block to this tool and persona."""
+    token = scope_var.set((tool, persona or "-"))
+    try:
+        yield
+    finally:
+        scope_var.reset(token)
+
+
+def record(tenant_id: str, kind: str, model: str, input_tokens: int = 0, output_tokens: int = 0,
+           latency_s: float = 0.0, calls: int = 1):
+    """Queue one model call for the usage log (kind is "llm" or "embedding")."""
+    if not USAGE_ACCOUNTING:
+        return
+    tool, persona = scope_var.get()
+    row = (
+        time.time(), request_id_var.get(), tenant_id or "unknown", persona, tool, kind, model, calls,
+        input_tokens, output_tokens, latency_s * 1000, cost_usd(model, input_tokens, output_tokens),
+    )
+    with _lock:
+        _buffer.append(row)
+        size = len(_buffer)
+    _ensure_writer()
+    if size >= USAGE_FLUSH_ROWS:
+        _wakeup.set()
+
+
+@contextmanager
+def _connect():
+    os.makedirs(os.path.dirname(USAGE_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(USAGE_DB)
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "ts REAL, request_id TEXT, tenant TEXT, persona TEXT, tool TEXT, kind TEXT, model TEXT, "
+                "calls INTEGER, input_tokens INTEGER, output_tokens INTEGER, latency_ms REAL, cost_usd REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS events_tenant_ts ON events (tenant, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS events_ts ON events (ts)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hourly ("
+                "hour INTEGER, tenant TEXT, persona TEXT, tool TEXT, kind TEXT, model TEXT, "
+                "calls INTEGER, input_tokens INTEGER, output_tokens INTEGER, latency_ms REAL, cost_usd REAL, "
+                "PRIMARY KEY (hour, tenant, persona, tool, kind, model))"
+            )
+            yield conn
+    finally:
+        conn.close()
+
+
+def flush() -> int:
+    """Write buffered rows and their rollups; returns the number of rows written."""
+    global _pruned_at
+    with _lock:
+        rows = _buffer[:]
+        del _buffer[:]
+    if not rows:
+        return 0
+    try:
+        with _connect() as conn:
+            conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany(
+                "INSERT INTO hourly VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (hour, tenant, persona, tool, kind, model) DO UPDATE SET "
+                "calls = calls + excluded.calls, input_tokens = input_tokens + excluded.input_tokens, "
+                "output_tokens = output_tokens + excluded.output_tokens, "
+                "latency_ms = latency_ms + excluded.latency_ms, cost_usd = cost_usd + excluded.cost_usd",
+                [(int(r[0] // 3600) * 3600, *r[2:]) for r in rows],
+            )
+            if time.time() - _pruned_at > 3600:
+                conn.execute("DELETE FROM events WHERE ts < ?", (time.time() - USAGE_RETENTION_DAYS * 86400,))
+                _pruned_at = time.time()
+    except (sqlite3.Error, OSError) as e:
+        log(f"Usage flush failed, {len(rows)} rows dropped: {e}")
+        return 0
+    return len(rows)
+
+
+def _run_writer():
+    while True:
+        _wakeup.wait(USAGE_FLUSH_SECONDS)
+        _wakeup.clear()
+        flush()
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_run_writer, name="usage-writer", daemon=True)
+                _writer.start()
+                atexit.register(flush)
+
+
+def _where(since: float, until: float, tenant: Optional[str], time_column: str):
+    clauses, params = [f"{time_column} >= ?", f"{time_column} < ?"], [since, until]
+    if tenant:
+        clauses.append("tenant = ?")
+        params.append(tenant)
+    return " AND ".join(clauses), params
+
+
+def summary(since: float, until: float, tenant: Optional[str] = None,
+            group_by: Sequence[str] = ("tenant",), bucket: Optional[str] = None) -> List[dict]:
+    """Aggregates from the hourly rollup (hour resolution), grouped and optionally bucketed by hour/day."""
+    unknown = [c for c in group_by if c not in GROUP_COLUMNS]
+    if unknown or (bucket and bucket not in BUCKETS):
+        raise ValueError(f"group_by must be in {GROUP_COLUMNS} and bucket in {tuple(BUCKETS)}")
+    flush()
+    columns = list(group_by)
+    if bucket:
+        columns.insert(0, f"(hour / {BUCKETS[bucket]}) * {BUCKETS[bucket]} AS bucket")
+    where, params = _where(int(since // 3600) * 3600, until, tenant, "hour")
+    keys = ["bucket", *group_by] if bucket else list(group_by)
+    select = ", ".join(columns + [
+        "SUM(calls)", "SUM(input_tokens)", "SUM(output_tokens)", "SUM(latency_ms) / SUM(calls)", "SUM(cost_usd)",
+    ])
+    group = f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}" if keys else ""
+    with _connect() as conn:
+        rows = conn.execute(f"SELECT {select} FROM hourly WHERE {where}{group}", params).fetchall()
+    return [
+        {
+            **dict(zip(keys, row)),
+            "calls": row[len(keys)] or 0,
+            "input_tokens": row[len(keys) + 1] or 0,
+            "output_tokens": row[len(keys) + 2] or 0,
+            "avg_latency_ms": round(row[len(keys) + 3] or 0.0, 1),
+            "cost_usd": round(row[len(keys) + 4] or 0.0, 6),
+        }
+        for row in rows if row[len(keys)]
+    ]
+
+
+def top_requests(since: float, until: float, tenant: Optional[str] = None, limit: int = 10) -> List[dict]:
+    """The most expensive requests in the raw log: every model call of a request summed."""
+    flush()
+    where, params = _where(since, until, tenant, "ts")
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT request_id, MIN(ts), tenant, persona, tool, GROUP_CONCAT(DISTINCT model), SUM(calls), "
+            "SUM(input_tokens), SUM(output_tokens), SUM(latency_ms), SUM(cost_usd) "
+            f"FROM events WHERE {where} AND request_id != '-' "
+            "GROUP BY request_id, tenant, persona, tool ORDER BY SUM(cost_usd) DESC, SUM(input_tokens) DESC LIMIT ?",
+            params + [limit],
+        ).fetchall()
+    keys = ("request_id", "ts", "tenant", "persona", "tool", "models", "calls",
+            "input_tokens", "output_tokens", "latency_ms", "cost_usd")
+    return [
+        {**dict(zip(keys, row)), "models": row[5].split(","), "latency_ms": round(row[9], 1),
+         "cost_usd": round(row[10], 6)}
+        for row in rows
+    ]
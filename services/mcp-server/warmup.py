@@ -0,0 +1,108 @@
+"""
+Lazy client construction and startup warmup for the MCP server.
+
+Clients (Qdrant, Bedrock, embedding models) are wrapped in LazyClient so
+importing main.py does no network or model-loading work; each is built on
+first use and its build time recorded. After the process starts, Warmup
+runs a list of steps on a background thread (resolve AWS credentials, load
+collection metadata, open connections, pre-embed warm queries, touch
+collection segments) and the /health endpoint reports ready only once
+every required step has succeeded.
+"""
+
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from metrics import STARTUP_SECONDS, log
+
+
+class LazyClient:
+    """Proxy that builds the wrapped object on first attribute access."""
+
+    def __init__(self, name: str, factory: Callable):
+        self._name = name
+        self._factory = factory
+        self._target = None
+        self._build_seconds = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    start = time.perf_counter()
+                    target = self._factory()
+                    self._build_seconds = time.perf_counter() - start
+                    STARTUP_SECONDS.labels(phase=f"client_{self._name}").set(self._build_seconds)
+                    log(f"Built {self._name} client in {self._build_seconds * 1000:.0f}ms")
+                    self._target = target
+        return self._target
+
+    @property
+    def build_ms(self) -> Optional[float]:
+        return None if self._build_seconds is None else round(self._build_seconds * 1000, 1)
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        state = "built" if self._target is not None else "not built"
+        return f"<LazyClient {self._name} ({state})>"
+
+
+class Warmup:
+    """Runs (name, fn, required) steps once in order; failed required steps are retried."""
+
+    def __init__(self, steps: List[Tuple[str, Callable, bool]], retry_seconds: float = 5.0):
+        self.steps = steps
+        self.retry_seconds = retry_seconds
+        self.state = "pending"
+        self.results = {}
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def mark_ready(self):
+        """Skip warmup (WARMUP=off): ready immediately, clients build on first request."""
+        self.state = "ready"
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def run(self):
+        self.state = "warming"
+        self.started_at = time.perf_counter()
+        pending = list(self.steps)
+        while pending:
+            failed = []
+            for name, fn, required in pending:
+                start = time.perf_counter()
+                try:
+                    detail = fn()
+                    self.results[name] = {"ms": round((time.perf_counter() - start) * 1000, 1), "detail": detail}
+                    STARTUP_SECONDS.labels(phase=f"warmup_{name}").set(time.perf_counter() - start)
+                except Exception as e:
+                    self.results[name] = {"ms": round((time.perf_counter() - start) * 1000, 1), "error": str(e)}
+                    log(f"Warmup step {name} failed{'' if required else ' (optional)'}: {e}")
+                    if required:
+                        failed.append((name, fn, required))
+            pending = failed
+            if pending:
+                time.sleep(self.retry_seconds)
+        self.finished_at = time.perf_counter()
+        STARTUP_SECONDS.labels(phase="warmup").set(self.finished_at - self.started_at)
+        self.state = "ready"
+        log(f"Warmup finished in {(self.finished_at - self.started_at) * 1000:.0f}ms")
+
+    def report(self) -> dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round(((self.finished_at or time.perf_counter()) - self.started_at) * 1000, 1)
+        return {"state": self.state, "elapsed_ms": elapsed, "steps": self.results}
@@ -1,59 +1,306 @@
+"""
+Shared tenant-service identity client (email -> tenant/persona, tenant DNA).
+
+One pooled HTTP session per process, a bounded TTL cache with short-lived
+negative entries, and a circuit breaker: after PERSONA_BREAKER_FAILURES
+consecutive errors the client stops calling the tenant service for
+PERSONA_BREAKER_RESET seconds and answers from the fallback map
+immediately instead of waiting out a timeout on every chat turn.
+
+Sync callers use PersonaClient.lookup / get_tenant_persona; async callers
+use the *_async variants (httpx, optional). Both share cache and breaker.
+"""
+
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
 import requests
-from typing import Tuple
+from requests.adapters import HTTPAdapter
+
+TENANT_SERVICE_URL = os.getenv("TENANT_SERVICE_URL", "http://tenant-service-dt:8000")
+PERSONA_CONNECT_TIMEOUT = float(os.getenv("PERSONA_CONNECT_TIMEOUT", "0.5"))
+PERSONA_READ_TIMEOUT = float(os.getenv("PERSONA_READ_TIMEOUT", "2"))
+PERSONA_CACHE_TTL = float(os.getenv("PERSONA_CACHE_TTL", "300"))
+PERSONA_NEGATIVE_CACHE_TTL = float(os.getenv("PERSONA_NEGATIVE_CACHE_TTL", "30"))
+PERSONA_CACHE_SIZE = int(os.getenv("PERSONA_CACHE_SIZE", "10000"))
+PERSONA_BREAKER_FAILURES = int(os.getenv("PERSONA_BREAKER_FAILURES", "3"))
+PERSONA_BREAKER_RESET = float(os.getenv("PERSONA_BREAKER_RESET", "30"))
+
+DEFAULT_IDENTITY = ("default", "user")
+
+# Backwards compatibility: PERSONA_MAP for offline/fallback mode
+PERSONA_MAP_FALLBACK = {
+    "alice.tenanta@gmail.com": ("tenant-tenanta", "CEO"),
+    "bob.tenanta@gmail.com": ("tenant-tenanta", "manager"),
+    "sarah.tenanta@gmail.com": ("tenant-tenanta", "analyst"),
+    "diana.tenantb@gmail.com": ("tenant-tenantb", "CEO"),
+    "john.tenantb@gmail.com": ("tenant-tenantb", "manager"),
+    "demo.demotenant@gmail.com": ("tenant-demotenant", "CEO"),
+}
+
+
+class ServiceUnavailable(Exception):
+    """The tenant service could not be asked (breaker open, timeout, 5xx)."""
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> one half-open probe after `reset_after` seconds."""
+
+    def __init__(self, failure_threshold: int = PERSONA_BREAKER_FAILURES, reset_after: float = PERSONA_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class TTLCache:
+    """At most `max_entries` items: a full cache drops expired ones, then the oldest insertions."""
+
+    def __init__(self, ttl: float, negative_ttl: float, max_entries: int = PERSONA_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, value); value None is a cached miss."""
+        with self._lock:
+            entry = self._items.get(key)
+        if entry and entry[0] > time.monotonic():
+            return True, entry[1]
+        return False, None
+
+    def set(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl > 0:
+            now = time.monotonic()
+            with self._lock:
+                # Re-inserted at the end, so the dict stays in insertion order
+                self._items.pop(key, None)
+                if len(self._items) >= self.max_entries:
+                    self._items = {k: e for k, e in self._items.items() if e[0] > now}
+                    while len(self._items) >= self.max_entries:
+                        self._items.pop(next(iter(self._items)))
+                self._items[key] = (now + ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class PersonaClient:
+    def __init__(self, base_url: str = TENANT_SERVICE_URL,
+                 timeout: Tuple[float, float] = (PERSONA_CONNECT_TIMEOUT, PERSONA_READ_TIMEOUT),
+                 cache_ttl: float = PERSONA_CACHE_TTL, negative_ttl: float = PERSONA_NEGATIVE_CACHE_TTL,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cache = TTLCache(cache_ttl, negative_ttl)
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+        self._async_client = None
+
+    # --- shared request handling -------------------------------------------
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise ServiceUnavailable(f"tenant service circuit open ({self.base_url})")
+
+    def _handle(self, status_code: int, json_fn, not_found_ok: bool):
+        """Map an HTTP response to a cacheable value or raise ServiceUnavailable."""
+        if status_code >= 500:
+            self.breaker.record_failure()
+            raise ServiceUnavailable(f"tenant service returned {status_code}")
+        self.breaker.record_success()
+        if status_code == 404 and not_found_ok:
+            return None
+        if status_code != 200:
+            return None
+        return json_fn()
+
+    @staticmethod
+    def _lookup_result(data):
+        # The lookup endpoint answers 200 with found=false for unknown users and an "error" key on failures
+        if data and "error" in data:
+            raise ServiceUnavailable(f"tenant service lookup failed: {data['error']}")
+        return data if data and data.get("found") else None
+
+    # --- sync -----------------------------------------------------------------
+
+    def _get(self, path: str, params=None, headers=None, not_found_ok=False):
+        self._check_breaker()
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            raise ServiceUnavailable(str(e)) from e
+        return self._handle(response.status_code, response.json, not_found_ok)
+
+    def lookup(self, email: str, headers: Optional[dict] = None) -> Optional[dict]:
+        """Lookup result for a user, or None if unknown. Raises ServiceUnavailable."""
+        key = ("user", email.lower())
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        value = self._lookup_result(self._get("/api/user/lookup", params={"email": email}, headers=headers))
+        self.cache.set(key, value)
+        return value
+
+    def tenant(self, tenant_id: str, headers: Optional[dict] = None) -> Optional[dict]:
+        """Tenant item (prompt DNA), or None if unknown. Raises ServiceUnavailable."""
+        key = ("tenant", tenant_id)
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        data = self._get(f"/api/tenants/{tenant_id}", headers=headers, not_found_ok=True)
+        value = (data or {}).get("tenant")
+        self.cache.set(key, value)
+        return value
+
+    def get_tenant_persona(self, email: str, headers: Optional[dict] = None,
+                           default: Tuple[str, str] = DEFAULT_IDENTITY) -> Tuple[str, str]:
+        """(tenant_id, persona_id); the fallback map is used only when the service is unavailable."""
+        try:
+            data = self.lookup(email, headers)
+        except ServiceUnavailable as e:
+            print(f"[WARN] Tenant service unavailable for {email}, using fallback: {e}")
+            return PERSONA_MAP_FALLBACK.get(email.lower(), default)
+        if data:
+            return data["tenantId"], data.get("personaId", "user")
+        return default
+
+    # --- async ----------------------------------------------------------------
+
+    async def _get_async(self, path: str, params=None, headers=None, not_found_ok=False):
+        import httpx
+
+        self._check_breaker()
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=8),
+            )
+        try:
+            response = await self._async_client.get(path, params=params, headers=headers)
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise ServiceUnavailable(str(e)) from e
+        return self._handle(response.status_code, response.json, not_found_ok)
+
+    async def lookup_async(self, email: str, headers: Optional[dict] = None) -> Optional[dict]:
+        key = ("user", email.lower())
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        value = self._lookup_result(await self._get_async("/api/user/lookup", params={"email": email}, headers=headers))
+        self.cache.set(key, value)
+        return value
+
+    async def tenant_async(self, tenant_id: str, headers: Optional[dict] = None) -> Optional[dict]:
+        key = ("tenant", tenant_id)
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        data = await self._get_async(f"/api/tenants/{tenant_id}", headers=headers, not_found_ok=True)
+        value = (data or {}).get("tenant")
+        self.cache.set(key, value)
+        return value
+
+    async def get_tenant_persona_async(self, email: str, headers: Optional[dict] = None,
+                                       default: Tuple[str, str] = DEFAULT_IDENTITY) -> Tuple[str, str]:
+        try:
+            data = await self.lookup_async(email, headers)
+        except ServiceUnavailable as e:
+            print(f"[WARN] Tenant service unavailable for {email}, using fallback: {e}")
+            return PERSONA_MAP_FALLBACK.get(email.lower(), default)
+        if data:
+            return data["tenantId"], data.get("personaId", "user")
+        return default
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client() -> PersonaClient:
+    """Process-wide client for TENANT_SERVICE_URL."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = PersonaClient()
+        return _default_client
 
-TENANT_SERVICE_URL = "http://tenant-service-dt:8000"
 
 def get_user_tenant_persona(email: str) -> Tuple[str, str]:
     """
     Get user's tenant and persona from tenant service API.
-    Falls back to default if user not found.
-    
+    Falls back to default if user not found or the service is unavailable.
+
     Args:
         email: User's email address
-        
+
     Returns:
         Tuple of (tenant_id, persona_id)
     """
     try:
-        response = requests.get(
-            f"{TENANT_SERVICE_URL}/api/user/lookup",
-            params={"email": email},
-            timeout=2
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("found"):
-                return data["tenantId"], data["personaId"]
-        
-        # Fallback to default
-        return "default", "user"
-        
-    except Exception as e:
+        data = get_client().lookup(email)
+    except ServiceUnavailable as e:
         print(f"[WARN] Failed to lookup user {email}: {e}")
-        # Fallback if tenant service unavailable
-        return "default", "user"
+        return DEFAULT_IDENTITY
+    return (data["tenantId"], data.get("personaId", "user")) if data else DEFAULT_IDENTITY
 
 
-# Backwards compatibility: PERSONA_MAP for offline/fallback mode
-PERSONA_MAP_FALLBACK = {
-    "alice.tenanta@gmail.com": ("tenant-tenanta", "CEO"),
-    "bob.tenanta@gmail.com": ("tenant-tenanta", "manager"),
-    "sarah.tenanta@gmail.com": ("tenant-tenanta", "analyst"),
-    "diana.tenantb@gmail.com": ("tenant-tenantb", "CEO"),
-    "john.tenantb@gmail.com": ("tenant-tenantb", "manager"),
-    "demo.demotenant@gmail.com": ("tenant-demotenant", "CEO"),
-}
-
 def get_user_tenant_persona_with_fallback(email: str) -> Tuple[str, str]:
     """
     Try API first, fall back to hardcoded map if API unavailable.
     """
-    try:
-        # Try API first
-        return get_user_tenant_persona(email)
-    except:
-        # Fall back to hardcoded map
-        if email in PERSONA_MAP_FALLBACK:
-            return PERSONA_MAP_FALLBACK[email]
-        return "default", "user"
+    return get_client().get_tenant_persona(email)
+
+
+async def get_user_tenant_persona_async(email: str) -> Tuple[str, str]:
+    """Async variant of get_user_tenant_persona_with_fallback."""
+    return await get_client().get_tenant_persona_async(email)
@@ -1,15 +1,24 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
 import os
 import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 from datetime import datetime
 import uuid
+import time
+import random
+import threading
+import asyncio
 
 app = FastAPI(title="CloneMind Tenant Management API")
 
+REQUEST_ID_HEADER = "X-Request-ID"
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -19,16 +28,173 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Propagate the pipeline's request id so a chat turn can be traced across services"""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    start = time.perf_counter()
+    response = await call_next(request)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"[req={request_id}] {request.method} {request.url.path} {response.status_code} {elapsed_ms:.0f}ms")
+    return response
+
 # AWS Configuration
 REGION = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
 COGNITO_USER_POOL_ID = os.getenv("COGNITO_USER_POOL_ID")
 COGNITO_CLIENT_ID = os.getenv("COGNITO_CLIENT_ID")
 TENANT_TABLE = os.getenv("TENANT_TABLE", "TenantMetadata")
+# One item per user (pk tenantId, sk email, GSI on email); bulk-provisioned users live here
+USER_TABLE = os.getenv("USER_TABLE", "TenantUsers")
+USER_EMAIL_INDEX = os.getenv("USER_EMAIL_INDEX", "email-index")
+BULK_MAX_USERS = int(os.getenv("BULK_MAX_USERS", "1000"))
+BULK_COGNITO_CONCURRENCY = int(os.getenv("BULK_COGNITO_CONCURRENCY", "8"))
+COGNITO_MAX_ATTEMPTS = int(os.getenv("COGNITO_MAX_ATTEMPTS", "6"))
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", "60"))
+TENANT_NEGATIVE_CACHE_TTL = float(os.getenv("TENANT_NEGATIVE_CACHE_TTL", "5"))
 
 # Initialize AWS Clients
 cognito = boto3.client("cognito-idp", region_name=REGION)
-dynamodb = boto3.resource("dynamodb", region_name=REGION)
-table = dynamodb.Table(TENANT_TABLE)
+
+# boto3 resources are not thread-safe; DynamoDB calls run in the threadpool, so one Table per thread
+_thread_local = threading.local()
+
+def _dynamodb():
+    if not hasattr(_thread_local, "dynamodb"):
+        session = boto3.session.Session(region_name=REGION)
+        _thread_local.dynamodb = session.resource("dynamodb")
+    return _thread_local.dynamodb
+
+def get_table():
+    if not hasattr(_thread_local, "table"):
+        _thread_local.table = _dynamodb().Table(TENANT_TABLE)
+    return _thread_local.table
+
+def get_user_table():
+    if not hasattr(_thread_local, "user_table"):
+        _thread_local.user_table = _dynamodb().Table(USER_TABLE)
+    return _thread_local.user_table
+
+class TTLCache:
+    """Read-through in-process cache for tenant items (per uvicorn worker).
+
+    Concurrent misses for the same key share one load, so a cold cache
+    doesn't send a burst of identical DynamoDB requests.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._items = {}
+        self._loading = {}
+        # Bumped on invalidate so a load that started before a write is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return (found, value); value None is a cached miss."""
+        entry = self._items.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return True, entry[1]
+        self.misses += 1
+        return False, None
+
+    def set(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl > 0:
+            self._items[key] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, key=None):
+        self._generation += 1
+        if key is None:
+            self._items.clear()
+        else:
+            self._items.pop(key, None)
+
+    async def get_or_load(self, key, loader):
+        found, value = self.get(key)
+        if found:
+            return value
+        task = self._loading.get(key)
+        if task is None:
+            generation = self._generation
+
+            async def load():
+                result = await loader()
+                if generation == self._generation:
+                    self.set(key, result)
+                return result
+
+            task = asyncio.ensure_future(load())
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(task)
+
+tenant_cache = TTLCache(TENANT_CACHE_TTL, TENANT_NEGATIVE_CACHE_TTL)
+# Single entry: email -> user record, built from one table scan
+user_index_cache = TTLCache(TENANT_CACHE_TTL, 0)
+# email -> user item from the user table's email GSI
+user_record_cache = TTLCache(TENANT_CACHE_TTL, TENANT_NEGATIVE_CACHE_TTL)
+
+async def fetch_tenant(tenant_id: str):
+    """Tenant item from the cache, falling back to DynamoDB off the event loop."""
+    async def load():
+        response = await run_in_threadpool(lambda: get_table().get_item(Key={"tenantId": tenant_id}))
+        return response.get("Item")
+    return await tenant_cache.get_or_load(tenant_id, load)
+
+def _scan_all_tenants():
+    table = get_table()
+    response = table.scan()
+    items = response.get("Items", [])
+    while "LastEvaluatedKey" in response:
+        response = table.scan(ExclusiveStartKey=response["LastEvaluatedKey"])
+        items.extend(response.get("Items", []))
+    return items
+
+async def fetch_user_index():
+    """email -> lookup result for every user in every tenant."""
+    async def load():
+        index = {}
+        for tenant in await run_in_threadpool(_scan_all_tenants):
+            for user in tenant.get("users", []):
+                index[user["email"].lower()] = {
+                    "found": True,
+                    "tenantId": tenant["tenantId"],
+                    "personaId": user.get("persona", "user"),
+                    "companyName": tenant.get("companyName", "Unknown Corp"),
+                    "tone": tenant.get("tone", "professional")
+                }
+        return index
+    return await user_index_cache.get_or_load("users", load)
+
+async def fetch_user_record(email: str):
+    """User item for an email from the user table, or None (also when the table doesn't exist)."""
+    def query():
+        try:
+            response = get_user_table().query(
+                IndexName=USER_EMAIL_INDEX,
+                KeyConditionExpression=Key("email").eq(email),
+                Limit=1,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ResourceNotFoundException":
+                return None
+            raise
+        items = response.get("Items", [])
+        return items[0] if items else None
+
+    async def load():
+        return await run_in_threadpool(query)
+    return await user_record_cache.get_or_load(email, load)
+
+def invalidate_tenant(tenant_id: str):
+    """Call after every write to a tenant item."""
+    tenant_cache.invalidate(tenant_id)
+    user_index_cache.invalidate()
+    user_record_cache.invalidate()
 
 # Pydantic Models
 class TenantCreate(BaseModel):
@@ -47,7 +213,89 @@ class UserCreate(BaseModel):
     last_name: str
     persona: str
 
+class BulkUser(BaseModel):
+    email: str
+    password: str
+    first_name: str = ""
+    last_name: str = ""
+    persona: str = "user"
+
+class BulkUserCreate(BaseModel):
+    users: List[BulkUser]
+
+# Cognito error codes worth retrying with backoff
+COGNITO_RETRYABLE = {"TooManyRequestsException", "ThrottlingException", "LimitExceededException",
+                     "InternalErrorException", "ServiceUnavailable"}
+
 # Helper Functions
+def cognito_call(method, **kwargs):
+    """Call a Cognito admin API, retrying throttles with exponential backoff and full jitter."""
+    for attempt in range(COGNITO_MAX_ATTEMPTS):
+        try:
+            return getattr(cognito, method)(**kwargs)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in COGNITO_RETRYABLE or attempt == COGNITO_MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(random.uniform(0, min(5.0, 0.1 * 2 ** attempt)))
+
+def provision_cognito_user(email: str, password: str, first_name: str, last_name: str, tenant_id: str):
+    """Create a Cognito user with a permanent password, or accept one this tenant already has.
+
+    Returns "created" or "exists". An existing user is never modified (no password reset);
+    one that belongs to another tenant raises ValueError. Raises ClientError on anything else.
+    """
+    try:
+        cognito_call(
+            "admin_create_user",
+            UserPoolId=COGNITO_USER_POOL_ID,
+            Username=email,
+            UserAttributes=[
+                {"Name": "email", "Value": email},
+                {"Name": "given_name", "Value": first_name},
+                {"Name": "family_name", "Value": last_name},
+                {"Name": "email_verified", "Value": "true"},
+                {"Name": "custom:tenant_id", "Value": tenant_id}
+            ],
+            TemporaryPassword=password,
+            MessageAction="SUPPRESS"
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "UsernameExistsException":
+            raise
+        existing = cognito_call("admin_get_user", UserPoolId=COGNITO_USER_POOL_ID, Username=email)
+        attributes = {a["Name"]: a["Value"] for a in existing.get("UserAttributes", [])}
+        owner = attributes.get("custom:tenant_id")
+        if owner != tenant_id:
+            raise ValueError(f"User already exists in another tenant ({owner or 'none'})")
+        return "exists"
+    try:
+        cognito_call(
+            "admin_set_user_password",
+            UserPoolId=COGNITO_USER_POOL_ID,
+            Username=email,
+            Password=password,
+            Permanent=True
+        )
+    except Exception:
+        # Don't leave a half-provisioned user behind: a resend creates it again
+        cognito_call("admin_delete_user", UserPoolId=COGNITO_USER_POOL_ID, Username=email)
+        raise
+    return "created"
+
+def write_user_records(tenant_id: str, users: List[BulkUser]):
+    """Write user items with BatchWriteItem (batch_writer chunks by 25 and resends unprocessed items)."""
+    now = datetime.now().isoformat()
+    with get_user_table().batch_writer(overwrite_by_pkeys=["tenantId", "email"]) as batch:
+        for user in users:
+            batch.put_item(Item={
+                "tenantId": tenant_id,
+                "email": user.email.lower(),
+                "persona": user.persona,
+                "firstName": user.first_name,
+                "lastName": user.last_name,
+                "createdAt": now,
+            })
+
 def create_cognito_user(email: str, password: str, first_name: str, last_name: str, tenant_id: str):
     """Create user in Cognito User Pool"""
     try:
@@ -90,7 +338,8 @@ async def create_tenant(tenant: TenantCreate):
     
     try:
         # 1. Create Admin User in Cognito
-        success = create_cognito_user(
+        success = await run_in_threadpool(
+            create_cognito_user,
             tenant.admin_email, 
             tenant.admin_password, 
             "Admin", 
@@ -102,27 +351,27 @@ async def create_tenant(tenant: TenantCreate):
             raise HTTPException(status_code=500, detail="Failed to create Cognito user")
 
         # 2. Store Tenant Metadata in DynamoDB
-        table.put_item(
-            Item={
-                "tenantId": tenant_id,
-                "tenantName": tenant.tenant_name,
-                "companyName": tenant.company_name,
-                "industry": tenant.industry,
-                "tone": tenant.tone,
-                "specialInstructions": tenant.special_instructions,
-                "adminEmail": tenant.admin_email,
-                "isActive": True,
-                "createdAt": datetime.now().isoformat(),
-                "users": [
-                    {"email": tenant.admin_email, "persona": "CEO"}
-                ],
-                "personas": {
-                    "CEO": {"focus": "strategic", "style": "executive"},
-                    "manager": {"focus": "operational", "style": "actionable"},
-                    "analyst": {"focus": "data", "style": "technical"}
-                }
+        item = {
+            "tenantId": tenant_id,
+            "tenantName": tenant.tenant_name,
+            "companyName": tenant.company_name,
+            "industry": tenant.industry,
+            "tone": tenant.tone,
+            "specialInstructions": tenant.special_instructions,
+            "adminEmail": tenant.admin_email,
+            "isActive": True,
+            "createdAt": datetime.now().isoformat(),
+            "users": [
+                {"email": tenant.admin_email, "persona": "CEO"}
+            ],
+            "personas": {
+                "CEO": {"focus": "strategic", "style": "executive"},
+                "manager": {"focus": "operational", "style": "actionable"},
+                "analyst": {"focus": "data", "style": "technical"}
             }
-        )
+        }
+        await run_in_threadpool(lambda: get_table().put_item(Item=item))
+        invalidate_tenant(tenant_id)
         
         return {
             "success": True,
@@ -137,11 +386,12 @@ async def create_tenant(tenant: TenantCreate):
 async def get_tenant(tenant_id: str):
     """Fetch tenant configuration for the pipeline prompt engine"""
     try:
-        response = table.get_item(Key={"tenantId": tenant_id})
-        item = response.get("Item")
+        item = await fetch_tenant(tenant_id)
         if not item:
             raise HTTPException(status_code=404, detail="Tenant not found")
         return {"tenant": item}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -149,25 +399,87 @@ async def get_tenant(tenant_id: str):
 async def lookup_user(email: str):
     """Lookup user tenant and persona from DynamoDB"""
     try:
-        # Scan for demo/QA - in production, use a Global Secondary Index (GSI) on Email
-        response = table.scan()
-        items = response.get("Items", [])
-        
-        for tenant in items:
-            for user in tenant.get("users", []):
-                if user["email"].lower() == email.lower():
-                    return {
-                        "found": True,
-                        "tenantId": tenant["tenantId"],
-                        "personaId": user.get("persona", "user"),
-                        "companyName": tenant.get("companyName", "Unknown Corp"),
-                        "tone": tenant.get("tone", "professional")
-                    }
+        record = await fetch_user_record(email.lower())
+        if record:
+            tenant = await fetch_tenant(record["tenantId"]) or {}
+            return {
+                "found": True,
+                "tenantId": record["tenantId"],
+                "personaId": record.get("persona", "user"),
+                "companyName": tenant.get("companyName", "Unknown Corp"),
+                "tone": tenant.get("tone", "professional")
+            }
+
+        # Users embedded in tenant items (created before the user table): cached scan
+        index = await fetch_user_index()
+        if email.lower() in index:
+            return index[email.lower()]
         
         return {"found": False, "tenantId": "default", "personaId": "user"}
     except Exception as e:
         return {"error": str(e)}
 
+@app.post("/api/tenants/{tenant_id}/users/bulk")
+async def bulk_create_users(tenant_id: str, request: BulkUserCreate):
+    """Provision many users for a tenant: Cognito identities with bounded concurrency, then one batched DynamoDB write"""
+    if len(request.users) > BULK_MAX_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_USERS} users per request")
+    if not await fetch_tenant(tenant_id):
+        raise HTTPException(status_code=404, detail="Tenant not found")
+
+    start = time.perf_counter()
+    results = {}
+    # Repeated emails are provisioned once
+    unique = {}
+    for user in request.users:
+        unique.setdefault(user.email.lower(), user)
+
+    semaphore = asyncio.Semaphore(BULK_COGNITO_CONCURRENCY)
+
+    async def provision(email, user):
+        async with semaphore:
+            try:
+                status = await run_in_threadpool(
+                    provision_cognito_user, email, user.password, user.first_name, user.last_name, tenant_id
+                )
+                return email, {"email": email, "status": status}
+            except Exception as e:
+                return email, {"email": email, "status": "failed", "error": str(e)}
+
+    for email, result in await asyncio.gather(*(provision(e, u) for e, u in unique.items())):
+        results[email] = result
+
+    provisioned = [unique[e] for e, r in results.items() if r["status"] in ("created", "exists")]
+    try:
+        await run_in_threadpool(write_user_records, tenant_id, provisioned)
+    except Exception as e:
+        # Identities exist but records don't; the request is safe to retry (creates become "exists")
+        for user in provisioned:
+            results[user.email.lower()] = {"email": user.email.lower(), "status": "failed", "error": f"DynamoDB: {e}"}
+    invalidate_tenant(tenant_id)
+
+    ordered = [results[e] for e in unique]
+    counts = {}
+    for result in ordered:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {
+        "tenant_id": tenant_id,
+        "requested": len(request.users),
+        "unique": len(unique),
+        "counts": counts,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000),
+        "results": ordered,
+    }
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the in-process tenant caches"""
+    return {
+        "tenant": {"hits": tenant_cache.hits, "misses": tenant_cache.misses, "ttl": tenant_cache.ttl},
+        "user_index": {"hits": user_index_cache.hits, "misses": user_index_cache.misses},
+        "user_records": {"hits": user_record_cache.hits, "misses": user_record_cache.misses},
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Load test for the tenant service read path (GET /api/tenants/{id}, GET /api/user/lookup).
+
+Runs the FastAPI app in-process against moto (default) or DynamoDB-local
+(--endpoint-url) and compares three scenarios:
+  blocking   - DynamoDB called inline on the event loop, no cache (previous behaviour)
+  threadpool - DynamoDB calls moved off the event loop, cache disabled
+  cached     - threadpool + read-through tenant cache (current behaviour)
+
+--bulk-users N instead provisions N users through POST /api/tenants/{id}/users/bulk
+against a moto Cognito pool with added latency and injected throttling.
+
+Usage:
+  pip install "moto[dynamodb,cognitoidp]" httpx
+  python loadtest.py --requests 2000 --concurrency 50 --latency-ms 10
+  python loadtest.py --endpoint-url http://localhost:8001   # DynamoDB-local
+  python loadtest.py --bulk-users 1000 --cognito-latency-ms 30 --throttle-rate 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+
+import boto3
+import httpx
+from botocore.exceptions import ClientError
+
+
+class SlowTable:
+    """Adds a fixed round-trip delay to every Table call (moto answers in microseconds)."""
+
+    def __init__(self, table, latency_s):
+        self._table = table
+        self._latency_s = latency_s
+
+    def __getattr__(self, name):
+        attr = getattr(self._table, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._latency_s)
+            return attr(*args, **kwargs)
+        return call
+
+
+class SlowCognito:
+    """Cognito client stand-in: fixed latency per call and a fraction of calls throttled."""
+
+    def __init__(self, client, latency_s, throttle_rate, seed=7):
+        self._client = client
+        self._latency_s = latency_s
+        self._throttle_rate = throttle_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.throttled = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            time.sleep(self._latency_s)
+            if self._rng.random() < self._throttle_rate:
+                self.throttled += 1
+                raise ClientError({"Error": {"Code": "TooManyRequestsException", "Message": "Rate exceeded"}}, name)
+            return attr(*args, **kwargs)
+        return call
+
+
+def create_user_table(table_name, endpoint_url):
+    dynamodb = boto3.resource("dynamodb", endpoint_url=endpoint_url)
+    if table_name not in [t.name for t in dynamodb.tables.all()]:
+        dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=[{"AttributeName": "tenantId", "KeyType": "HASH"},
+                       {"AttributeName": "email", "KeyType": "RANGE"}],
+            AttributeDefinitions=[{"AttributeName": "tenantId", "AttributeType": "S"},
+                                  {"AttributeName": "email", "AttributeType": "S"}],
+            GlobalSecondaryIndexes=[{
+                "IndexName": "email-index",
+                "KeySchema": [{"AttributeName": "email", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "ALL"},
+            }],
+            BillingMode="PAY_PER_REQUEST",
+        ).wait_until_exists()
+    return dynamodb.Table(table_name)
+
+
+def create_table(table_name, endpoint_url):
+    dynamodb = boto3.resource("dynamodb", endpoint_url=endpoint_url)
+    existing = [t.name for t in dynamodb.tables.all()]
+    if table_name not in existing:
+        dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=[{"AttributeName": "tenantId", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "tenantId", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        ).wait_until_exists()
+    return dynamodb.Table(table_name)
+
+
+def seed(table, tenants, users_per_tenant):
+    with table.batch_writer() as batch:
+        for t in range(tenants):
+            batch.put_item(Item={
+                "tenantId": f"tenant-load{t}",
+                "companyName": f"Load Corp {t}",
+                "industry": "Testing",
+                "tone": "professional",
+                "users": [{"email": f"user{u}.load{t}@example.com", "persona": "analyst"}
+                          for u in range(users_per_tenant)],
+            })
+
+
+async def run_scenario(app, tenants, users_per_tenant, total, concurrency):
+    rng = random.Random(7)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(client, i):
+        nonlocal errors
+        t = rng.randrange(tenants)
+        if i % 2:
+            path, params = f"/api/tenants/tenant-load{t}", None
+        else:
+            path, params = "/api/user/lookup", {"email": f"user{rng.randrange(users_per_tenant)}.load{t}@example.com"}
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://tenant-service") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(total)))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / wall, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def blocking_fetchers(app_module):
+    """The pre-cache read path: boto3 called directly inside the async endpoints."""
+    async def fetch_tenant(tenant_id):
+        return app_module.get_table().get_item(Key={"tenantId": tenant_id}).get("Item")
+
+    async def fetch_user_index():
+        index = {}
+        for tenant in app_module._scan_all_tenants():
+            for user in tenant.get("users", []):
+                index[user["email"].lower()] = {"found": True, "tenantId": tenant["tenantId"],
+                                                "personaId": user.get("persona", "user")}
+        return index
+    return fetch_tenant, fetch_user_index
+
+
+async def post_bulk(app, tenant_id, users):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://tenant-service", timeout=600) as client:
+        response = await client.post(f"/api/tenants/{tenant_id}/users/bulk", json={"users": users})
+        lookup = await client.get("/api/user/lookup", params={"email": users[-1]["email"]})
+    return response, lookup
+
+
+def run_bulk(args):
+    os.environ["TENANT_TABLE"] = "TenantMetadataLoadTest"
+    os.environ["USER_TABLE"] = "TenantUsersLoadTest"
+    os.environ["BULK_MAX_USERS"] = str(max(args.bulk_users, 1000))
+    seed(create_table(os.environ["TENANT_TABLE"], args.endpoint_url), 1, 1)
+    create_user_table(os.environ["USER_TABLE"], args.endpoint_url)
+
+    cognito = boto3.client("cognito-idp")
+    pool_id = cognito.create_user_pool(
+        PoolName="loadtest",
+        Schema=[{"Name": "tenant_id", "AttributeDataType": "String", "Mutable": True}],
+    )["UserPool"]["Id"]
+
+    import app as app_module
+    app_module.COGNITO_USER_POOL_ID = pool_id
+    slow = SlowCognito(cognito, args.cognito_latency_ms / 1000.0, args.throttle_rate)
+    app_module.cognito = slow
+
+    users = [{"email": f"bulk{i}@example.com", "password": "Bulk-Passw0rd!", "first_name": "Bulk",
+              "last_name": str(i), "persona": "analyst"} for i in range(args.bulk_users)]
+    started = time.perf_counter()
+    response, lookup = asyncio.run(post_bulk(app_module.app, "tenant-load0", users))
+    wall = time.perf_counter() - started
+
+    body = response.json()
+    print(f"status {response.status_code}: {body.get('counts')} in {wall:.1f}s "
+          f"({args.bulk_users / wall:.0f} users/s)")
+    print(f"cognito calls: {slow.calls}, throttled and retried: {slow.throttled}")
+    print(f"lookup {users[-1]['email']}: {lookup.json()}")
+
+
+def run_all(args):
+    if args.bulk_users:
+        return run_bulk(args)
+
+    table_name = "TenantMetadataLoadTest"
+    os.environ["TENANT_TABLE"] = table_name
+    raw_table = create_table(table_name, args.endpoint_url)
+    seed(raw_table, args.tenants, args.users_per_tenant)
+
+    import app as app_module
+    latency_s = args.latency_ms / 1000.0
+    original_get_table = app_module.get_table
+    app_module.get_table = lambda: SlowTable(original_get_table(), latency_s)
+    cached_fetch_tenant, cached_fetch_user_index = app_module.fetch_tenant, app_module.fetch_user_index
+
+    results = {}
+    for scenario in ("blocking", "threadpool", "cached"):
+        app_module.tenant_cache.invalidate()
+        app_module.user_index_cache.invalidate()
+        ttl = args.cache_ttl if scenario == "cached" else 0
+        app_module.tenant_cache.ttl = app_module.user_index_cache.ttl = ttl
+        app_module.tenant_cache.negative_ttl = 0
+        if scenario == "blocking":
+            app_module.fetch_tenant, app_module.fetch_user_index = blocking_fetchers(app_module)
+        else:
+            app_module.fetch_tenant, app_module.fetch_user_index = cached_fetch_tenant, cached_fetch_user_index
+        results[scenario] = asyncio.run(
+            run_scenario(app_module.app, args.tenants, args.users_per_tenant, args.requests, args.concurrency)
+        )
+        print(f"{scenario:>10}: {results[scenario]}")
+
+    base = results["blocking"]["throughput_rps"]
+    for scenario in ("threadpool", "cached"):
+        print(f"{scenario} throughput vs blocking: {results[scenario]['throughput_rps'] / base:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tenant service read-path load test")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--users-per-tenant", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Added DynamoDB round-trip time")
+    parser.add_argument("--cache-ttl", type=float, default=60.0)
+    parser.add_argument("--endpoint-url", help="DynamoDB-local URL (default: in-process moto)")
+    parser.add_argument("--bulk-users", type=int, default=0, help="Run the bulk provisioning test instead")
+    parser.add_argument("--cognito-latency-ms", type=float, default=30.0, help="Added Cognito round-trip time")
+    parser.add_argument("--throttle-rate", type=float, default=0.05, help="Fraction of Cognito calls throttled")
+    args = parser.parse_args()
+
+    if args.endpoint_url:
+        os.environ["AWS_ENDPOINT_URL_DYNAMODB"] = args.endpoint_url
+        run_all(args)
+    else:
+        from moto import mock_aws
+        with mock_aws():
+            run_all(args)
+
+
+if __name__ == "__main__":
+    main()